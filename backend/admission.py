@@ -0,0 +1,148 @@
+# nutrisnap-backend/admission.py
+"""
+Admission control for expensive endpoints.
+
+Photo uploads hold a worker for as long as Vertex/Gemini take to answer and
+use the threadpool the sync DB sessions also need. When those services slow
+down, unbounded uploads pile up and starve the dashboard. Each limited route
+group gets a Limiter: at most ``limit`` requests run at once, up to
+``queue_size`` more wait (for at most ``timeout`` seconds), and anything
+beyond that is answered straight away with 503 and a Retry-After estimated
+from the queue length and recent hold times. The check runs in ASGI
+middleware, before the request body is read, so a shed upload costs nothing.
+
+Limits are per process. Routes not listed in ADMISSION_ROUTES (all reads) are
+never queued.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import metrics
+
+ADMISSION_UPLOAD_CONCURRENCY = int(os.getenv("ADMISSION_UPLOAD_CONCURRENCY", "8"))  # 0 disables
+ADMISSION_UPLOAD_QUEUE = int(os.getenv("ADMISSION_UPLOAD_QUEUE", "16"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+
+ADMISSION_SHED = metrics.counter("nutrisnap_admission_shed", "Requests refused with 503 by reason", ["pool", "reason"])
+ADMISSION_WAIT = metrics.histogram("nutrisnap_admission_wait_seconds", "Time queued before admission", ["pool"])
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Limiter:
+    """Concurrency limit with a bounded FIFO wait queue.
+
+    Waiters are futures on whichever event loop is running, so one limiter
+    works across the test clients' loops as well as in a single server loop.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int, timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self._waiters = deque()
+        # Smoothed seconds per admitted request, for Retry-After
+        self.avg_hold = 1.0
+
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        ahead = self.waiting() + 1
+        return max(1, min(60, math.ceil(ahead * self.avg_hold / max(self.limit, 1))))
+
+    def _shed(self, reason: str):
+        ADMISSION_SHED.inc(pool=self.name, reason=reason)
+        raise Overloaded(reason, self.retry_after())
+
+    async def _admit(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self._shed("queue_full")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self._shed("timeout")
+        except BaseException:
+            # Cancelled after being handed a slot: pass it on instead of leaking it
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            ADMISSION_WAIT.observe(time.perf_counter() - start, pool=self.name)
+
+    def _release(self):
+        # Hand the slot straight to the next live waiter; `active` stays the same
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        """``async with limiter.slot():`` runs the block once admitted, or raises Overloaded."""
+        await self._admit()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.avg_hold = 0.8 * self.avg_hold + 0.2 * (time.perf_counter() - start)
+            self._release()
+
+
+UPLOADS = Limiter("uploads", ADMISSION_UPLOAD_CONCURRENCY, ADMISSION_UPLOAD_QUEUE)
+# (method, path) -> limiter; everything else is admitted without queueing
+ADMISSION_ROUTES = {
+    ("POST", "/log/food"): UPLOADS,
+    ("POST", "/log/food/batch"): UPLOADS,
+}
+
+metrics.gauge("nutrisnap_admission_active", "Requests holding an admission slot", ["pool"],
+              fn=lambda: {(lim.name,): lim.active for lim in set(ADMISSION_ROUTES.values())})
+metrics.gauge("nutrisnap_admission_queue_depth", "Requests waiting for an admission slot", ["pool"],
+              fn=lambda: {(lim.name,): lim.waiting() for lim in set(ADMISSION_ROUTES.values())})
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying ADMISSION_ROUTES before the request body is read."""
+
+    def __init__(self, app, routes: dict = None):
+        self.app = app
+        self.routes = ADMISSION_ROUTES if routes is None else routes
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.routes.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if limiter is None or limiter.limit <= 0:
+            await self.app(scope, receive, send)
+            return
+        try:
+            async with limiter.slot():
+                await self.app(scope, receive, send)
+        except Overloaded as exc:
+            body = b'{"detail":"Server is busy processing uploads, retry later."}'
+            await send({"type": "http.response.start", "status": 503, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(exc.retry_after).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
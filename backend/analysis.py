@@ -0,0 +1,177 @@
+# nutrisnap-backend/analysis.py
+"""
+Trigger/symptom association analysis.
+
+A user's history is loaded once into NumPy arrays: meal times, a meal x trigger
+indicator matrix, and symptom times with integer symptom codes. For every lag
+window L, each meal gets an outcome flag per symptom type ("was this symptom
+logged within L hours after the meal?"), found with one vectorized
+``searchsorted`` over all meals and symptom types. Matrix products then give
+the 2x2 table (trigger present/absent x symptom followed/not) for every
+(trigger, symptom, lag) at once, from which lift and odds ratios follow.
+
+Unlike the plain co-occurrence count behind /dashboard/triggers, this
+compares each trigger against the user's base rate for that symptom.
+"""
+import os
+from dataclasses import dataclass
+from typing import List, Sequence
+
+import numpy as np
+from sqlalchemy import select
+
+import models
+
+ASSOCIATION_LAGS_HOURS = tuple(float(h) for h in os.getenv("ASSOCIATION_LAGS_HOURS", "2,6,12,24").split(","))
+# Longest lag the endpoint accepts (two weeks)
+ASSOCIATION_MAX_LAG_HOURS = float(os.getenv("ASSOCIATION_MAX_LAG_HOURS", str(24 * 14)))
+# Pairs seen after fewer meals than this are too noisy to report
+ASSOCIATION_MIN_MEALS = int(os.getenv("ASSOCIATION_MIN_MEALS", "3"))
+
+
+@dataclass
+class History:
+    meal_times: np.ndarray        # (M,) int64 seconds, ascending
+    exposure: np.ndarray          # (M, T) uint8, meal contains trigger
+    triggers: List[str]           # (T,)
+    symptom_times: np.ndarray     # (S,) int64 seconds
+    symptom_codes: np.ndarray     # (S,) int64 index into symptom_names
+    symptom_names: List[str]      # (K,)
+
+
+def _seconds(datetimes) -> np.ndarray:
+    return np.array(datetimes, dtype="datetime64[s]").astype(np.int64)
+
+
+def build_history(meal_times, meal_triggers, symptom_times, symptom_names) -> History:
+    """Arrays from parallel lists of meal datetimes/trigger strings and symptom datetimes/names."""
+    meal_times = _seconds(meal_times) if len(meal_times) else np.empty(0, dtype=np.int64)
+    order = np.argsort(meal_times, kind="stable")
+    meal_times = meal_times[order]
+
+    # Trigger strings repeat heavily ("Gluten, Lactose"), so parse each distinct one once
+    combos, inverse = np.unique(np.array([t or "" for t in meal_triggers], dtype=object), return_inverse=True)
+    parsed = [split_triggers(combo) for combo in combos]
+    triggers = sorted({t for parts in parsed for t in parts})
+    index = {t: i for i, t in enumerate(triggers)}
+    combo_matrix = np.zeros((len(combos), len(triggers)), dtype=np.uint8)
+    for row, parts in enumerate(parsed):
+        combo_matrix[row, [index[t] for t in parts]] = 1
+    exposure = combo_matrix[inverse.reshape(-1)][order] if len(meal_times) else np.zeros((0, len(triggers)), np.uint8)
+
+    names, codes = np.unique(np.array(symptom_names, dtype=object), return_inverse=True)
+    symptom_times = _seconds(symptom_times) if len(symptom_times) else np.empty(0, dtype=np.int64)
+    return History(meal_times, exposure, triggers, symptom_times, codes.reshape(-1).astype(np.int64), list(names))
+
+
+def split_triggers(triggers) -> List[str]:
+    if not triggers or triggers == "None":
+        return []
+    return [p.strip() for p in triggers.split(",") if p.strip() and p.strip().lower() != "none"]
+
+
+def window_trigger_counts(meal_times, meal_triggers, symptom_times, window_hours: float = 6) -> dict:
+    """How often each trigger was eaten in the ``window_hours`` up to and including a symptom.
+
+    A meal inside the windows of n symptoms counts n times. Windows are turned
+    into per-meal coverage counts with a difference array, so the cost is one
+    sort plus a pass over the meals instead of a query per symptom.
+    """
+    if not len(meal_times) or not len(symptom_times):
+        return {}
+    times = _seconds(meal_times)
+    order = np.argsort(times, kind="stable")
+    times = times[order]
+    symptoms = _seconds(symptom_times)
+    lower = np.searchsorted(times, symptoms - int(window_hours * 3600), side="left")
+    upper = np.searchsorted(times, symptoms, side="right")
+    coverage = np.zeros(len(times) + 1, dtype=np.int64)
+    np.add.at(coverage, lower, 1)
+    np.add.at(coverage, upper, -1)
+    coverage = np.cumsum(coverage[:-1])
+
+    counts = {}
+    for idx in np.nonzero(coverage)[0]:
+        for part in split_triggers(meal_triggers[order[idx]]):
+            counts[part] = counts.get(part, 0) + int(coverage[idx])
+    return counts
+
+
+def load_history(db, user_id: int) -> History:
+    meals = db.execute(
+        select(models.Meal.created_at, models.Meal.triggers).where(models.Meal.user_id == user_id)
+    ).all()
+    symptoms = db.execute(
+        select(models.Symptom.created_at, models.Symptom.symptom_name).where(models.Symptom.user_id == user_id)
+    ).all()
+    return build_history(
+        [m[0] for m in meals], [m[1] for m in meals],
+        [s[0] for s in symptoms], [s[1] for s in symptoms],
+    )
+
+
+def followed_by(history: History, lags_hours: Sequence[float]) -> np.ndarray:
+    """(L, M, K) uint8: symptom k logged in (meal, meal + lag] for each lag/meal."""
+    k = len(history.symptom_names)
+    if not len(history.symptom_times) or not len(history.meal_times):
+        return np.zeros((len(lags_hours), len(history.meal_times), k), dtype=np.uint8)
+
+    # Sort symptoms by (code, time) and shift each code into its own time band,
+    # so one searchsorted answers every (meal, symptom type) query
+    t0 = min(history.meal_times.min(), history.symptom_times.min())
+    span = int(max(history.meal_times.max(), history.symptom_times.max()) - t0 + max(lags_hours) * 3600 + 1)
+    keys = np.sort(history.symptom_codes * span + (history.symptom_times - t0))
+    bands = (np.arange(k, dtype=np.int64) * span)[None, :]
+    meals = (history.meal_times - t0)[:, None]
+    lower = np.searchsorted(keys, bands + meals, side="right")
+
+    windows = (np.asarray(lags_hours, dtype=np.float64) * 3600).astype(np.int64)
+    upper = np.searchsorted(keys, bands[None] + meals[None] + windows[:, None, None], side="right")
+    return (upper > lower[None]).astype(np.uint8)
+
+
+def associations(history: History, lags_hours: Sequence[float] = ASSOCIATION_LAGS_HOURS,
+                 min_meals: int = ASSOCIATION_MIN_MEALS) -> List[dict]:
+    """Lift and odds ratio for every (trigger, symptom, lag) seen after ``min_meals`` meals.
+
+    lift = P(symptom within lag | meal has trigger) / P(symptom within lag | any meal)
+    Odds ratios use the Haldane-Anscombe +0.5 correction so empty cells stay finite.
+    Sorted by lift, strongest first.
+    """
+    total = len(history.meal_times)
+    if total == 0 or not history.triggers or not history.symptom_names:
+        return []
+
+    outcome = followed_by(history, lags_hours)                           # (L, M, K)
+    exposure = history.exposure.astype(np.int64)                         # (M, T)
+    a = np.einsum("mt,lmk->ltk", exposure, outcome.astype(np.int64))     # trigger & symptom
+    exposed = exposure.sum(axis=0)[None, :, None]                        # (1, T, 1)
+    followed = outcome.sum(axis=1, dtype=np.int64)[:, None, :]           # (L, 1, K)
+    b = exposed - a
+    c = followed - a
+    d = total - a - b - c
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lift = np.where(followed > 0, (a / exposed) / (followed / total), 0.0)
+    odds = ((a + 0.5) * (d + 0.5)) / ((b + 0.5) * (c + 0.5))
+
+    keep = np.broadcast_to((exposed >= min_meals), a.shape) & (a > 0)
+    lag_idx, trig_idx, sym_idx = np.nonzero(keep)
+    hits, lifts, odds = a[keep], lift[keep], odds[keep]
+    exposed = np.broadcast_to(exposed, a.shape)[keep]
+    return [
+        {
+            "trigger": history.triggers[trig_idx[i]],
+            "symptom": history.symptom_names[sym_idx[i]],
+            "lag_hours": float(lags_hours[lag_idx[i]]),
+            "meals_with_trigger": int(exposed[i]),
+            "followed_by_symptom": int(hits[i]),
+            "lift": round(float(lifts[i]), 4),
+            "odds_ratio": round(float(odds[i]), 4),
+        }
+        for i in np.lexsort((-odds, -lifts))
+    ]
+
+
+def user_associations(db, user_id: int, lags_hours=ASSOCIATION_LAGS_HOURS, min_meals: int = ASSOCIATION_MIN_MEALS):
+    return associations(load_history(db, user_id), lags_hours, min_meals)
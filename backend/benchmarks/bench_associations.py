@@ -0,0 +1,85 @@
+"""
+Speed of the vectorized trigger/symptom association analysis.
+
+Generates years of synthetic history with seed_synthetic.generate, then
+times building the NumPy arrays and computing lift/odds ratios for every
+(trigger, symptom, lag). With --db it also seeds a throwaway SQLite database
+and times the full load_history + associations path behind
+/dashboard/associations, next to /dashboard/triggers (two queries plus
+analysis.window_trigger_counts over the same history).
+
+Usage (from backend/):
+  python benchmarks/bench_associations.py --years 1 3 10 --repeat 20 --db
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("TESTING", "1")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy.orm import sessionmaker
+
+import analysis
+import database
+import main
+import models
+import seed_synthetic
+
+
+def wall_ms(fn, repeat: int) -> float:
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return round((time.perf_counter() - start) / repeat * 1000, 3)
+
+
+def bench_db(data: dict, repeat: int) -> dict:
+    engine = database.make_engine(f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench.db'}", name="bench")
+    models.Base.metadata.create_all(bind=engine)
+    seed_synthetic.write(engine, data, users=1)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    with factory() as db:
+        return {
+            "associations_endpoint_ms": wall_ms(lambda: analysis.user_associations(db, 1), repeat),
+            "triggers_endpoint_ms": wall_ms(lambda: main._triggers(db, 1), max(1, repeat // 10)),
+        }
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=float, nargs="+", default=[1, 3, 10])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db", action="store_true", help="Also time the database-backed endpoints")
+    args = parser.parse_args()
+
+    results = []
+    for years in args.years:
+        days = int(365 * years)
+        data = seed_synthetic.generate(1, days * 3, days * 2, days=days, seed=0)
+        meals, symptoms = data["meals"], data["symptoms"]
+        columns = (meals["created_at"], list(meals["triggers"]), symptoms["created_at"], list(symptoms["symptom_name"]))
+        history = analysis.build_history(*columns)
+        result = {
+            "years": years,
+            "meals": len(meals["user_id"]),
+            "symptoms": len(symptoms["user_id"]),
+            "pairs": len(analysis.associations(history)),
+            "build_arrays_ms": wall_ms(lambda: analysis.build_history(*columns), args.repeat),
+            "associations_ms": wall_ms(lambda: analysis.associations(history), args.repeat),
+        }
+        if args.db:
+            result.update(bench_db(data, args.repeat))
+        results.append(result)
+
+    print(json.dumps({"lags_hours": analysis.ASSOCIATION_LAGS_HOURS, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    run()
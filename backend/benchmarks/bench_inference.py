@@ -0,0 +1,137 @@
+"""
+Per-stage timing of backend/inference.py.
+
+Builds a randomly initialized ViT (no GCS download, runs offline) and times
+each stage of the inference path separately: JPEG decode, processor
+preprocessing, forward pass (+ softmax) and top-k formatting. Sweeps batch
+size, torch intra-op thread count and input image resolution, and writes the
+medians as JSON for regression tracking.
+
+--model tiny (default) is a 2-layer, 64-wide ViT for quick relative numbers;
+--model base has the ViT-B/16 shape we deploy, for absolute numbers.
+
+Usage (from backend/):
+  python benchmarks/bench_inference.py --batch-sizes 1 4 16 --threads 1 4 --resolutions 224 1024 --out inference.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+import torch
+import transformers
+from PIL import Image
+from transformers import ViTConfig, ViTForImageClassification, ViTImageProcessor
+
+import inference
+
+MODEL_CONFIGS = {
+    "tiny": dict(hidden_size=64, num_hidden_layers=2, num_attention_heads=2, intermediate_size=128),
+    "base": dict(),  # ViTConfig defaults are ViT-B/16
+}
+NUM_LABELS = 101  # Food-101
+
+
+def build_bundle(size: str) -> dict:
+    torch.manual_seed(0)
+    config = ViTConfig(image_size=224, patch_size=16, num_labels=NUM_LABELS, **MODEL_CONFIGS[size])
+    config.id2label = {i: f"class_{i}" for i in range(NUM_LABELS)}
+    model = ViTForImageClassification(config).eval()
+    processor = ViTImageProcessor(size={"height": 224, "width": 224})
+    return {"processor": processor, "model": model, "device": torch.device("cpu"), "id2label": config.id2label}
+
+
+def make_jpegs(resolution: int, count: int, seed: int = 0):
+    """Smooth gradients plus noise: compresses and decodes more like a photo than pure noise."""
+    rng = np.random.default_rng(seed)
+    ramp = np.linspace(0, 255, resolution, dtype=np.float32)
+    images = []
+    for _ in range(count):
+        base = (ramp[None, :, None] * rng.uniform(0.3, 1.0, 3) + ramp[:, None, None] * rng.uniform(0, 0.5, 3)) / 1.5
+        pixels = np.clip(base + rng.normal(0, 12, (resolution, resolution, 3)), 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+
+def time_stages(bundle: dict, jpegs, repeat: int, warmup: int) -> dict:
+    samples = {"decode": [], "preprocess": [], "forward": [], "topk": []}
+    for i in range(warmup + repeat):
+        t0 = time.perf_counter()
+        decoded = [inference.decode_image(b) for b in jpegs]
+        t1 = time.perf_counter()
+        inputs = inference.preprocess(bundle, decoded)
+        t2 = time.perf_counter()
+        probs = inference.forward(bundle, inputs)
+        t3 = time.perf_counter()
+        inference.top_k(probs, bundle["id2label"])
+        t4 = time.perf_counter()
+        if i >= warmup:
+            for stage, seconds in zip(samples, (t1 - t0, t2 - t1, t3 - t2, t4 - t3)):
+                samples[stage].append(seconds * 1000)
+
+    batch = len(jpegs)
+    stages = {stage: round(float(np.median(ms)), 3) for stage, ms in samples.items()}
+    total = sum(stages.values())
+    return {
+        "stage_ms": stages,
+        "stage_p90_ms": {stage: round(float(np.percentile(ms, 90)), 3) for stage, ms in samples.items()},
+        "total_ms": round(total, 3),
+        "per_image_ms": round(total / batch, 3),
+        "images_per_second": round(batch / total * 1000, 1) if total else None,
+    }
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=sorted(MODEL_CONFIGS), default="tiny")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({1, min(4, os.cpu_count() or 1)}))
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[224, 512, 1024])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--out", type=Path)
+    args = parser.parse_args()
+
+    bundle = build_bundle(args.model)
+    results = []
+    for threads in args.threads:
+        torch.set_num_threads(threads)
+        for resolution in args.resolutions:
+            pool = make_jpegs(resolution, max(args.batch_sizes))
+            for batch in args.batch_sizes:
+                result = {"threads": threads, "resolution": resolution, "batch_size": batch,
+                          "jpeg_kb": round(sum(len(b) for b in pool[:batch]) / batch / 1024, 1)}
+                result.update(time_stages(bundle, pool[:batch], args.repeat, args.warmup))
+                results.append(result)
+                print(f"threads={threads} res={resolution} batch={batch}: {result['per_image_ms']} ms/image", file=sys.stderr)
+
+    report = {
+        "model": args.model,
+        "parameters": sum(p.numel() for p in bundle["model"].parameters()),
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        args.out.write_text(text + "\n")
+
+
+if __name__ == "__main__":
+    run()
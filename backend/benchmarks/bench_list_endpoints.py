@@ -0,0 +1,118 @@
+"""
+Per-endpoint CPU cost of the dashboard list endpoints.
+
+Seeds a long history for the demo user, then measures process CPU time per
+request (not wall time, so database I/O waits are excluded) for each
+read endpoint. For /dashboard and /dashboard/symptoms it also times the
+previous ORM hydration + pydantic from_attributes path on the same rows.
+
+Usage (from backend/):
+  python benchmarks/bench_list_endpoints.py --meals 5000 --symptoms 2000 --repeat 20
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Import the app without waiting on the docker Postgres; measure uncached work
+os.environ.setdefault("TESTING", "1")
+os.environ.setdefault("CACHE_BACKEND", "none")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+import database
+import main
+import models
+import schemas
+
+ENDPOINTS = ["/dashboard", "/dashboard/symptoms", "/dashboard/recent", "/dashboard/triggers"]
+
+
+def seed(factory, meals: int, symptoms: int) -> None:
+    start = datetime(2024, 1, 1)
+    with factory() as db:
+        db.add(models.User(id=1, email="bench@test.com", name="Bench"))
+        db.add_all(
+            models.Meal(
+                image_url="https://via.placeholder.com/150",
+                identified_foods=f"Meal {i}",
+                protein=12.5, carbs=40.0, fat=9.25,
+                triggers="Gluten, Lactose" if i % 3 else "None",
+                created_at=start + timedelta(hours=4 * i),
+                user_id=1,
+            )
+            for i in range(meals)
+        )
+        db.add_all(
+            models.Symptom(
+                symptom_name="Bloating", severity=i % 10 + 1, notes="bench",
+                created_at=start + timedelta(hours=10 * i + 1), user_id=1,
+            )
+            for i in range(symptoms)
+        )
+        db.commit()
+
+
+def cpu_ms(fn, repeat: int) -> float:
+    fn()  # warm up
+    start = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return round((time.process_time() - start) / repeat * 1000, 3)
+
+
+def legacy(factory, model, schema):
+    def run():
+        with factory() as db:
+            rows = db.query(model).filter(model.user_id == 1).order_by(model.created_at.desc()).all()
+            payload = [schema.model_validate(r) for r in rows]
+            return JSONResponse(jsonable_encoder(payload)).body
+    return run
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--meals", type=int, default=5000)
+    parser.add_argument("--symptoms", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = database.make_engine(f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench.db'}", name="bench")
+    models.Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    seed(factory, args.meals, args.symptoms)
+
+    def override():
+        with factory() as db:
+            yield db
+
+    main.app.dependency_overrides[database.get_read_db] = override
+    results = {}
+    with TestClient(main.app) as client:
+        for path in ENDPOINTS:
+            response = client.get(path, headers={"Accept-Encoding": "identity"})
+            gzipped = client.get(path, headers={"Accept-Encoding": "gzip"})
+            results[path] = {
+                "cpu_ms_per_request": cpu_ms(lambda: client.get(path), args.repeat),
+                "bytes": len(response.content),
+                "content_encoding": gzipped.headers.get("content-encoding", "identity"),
+            }
+    main.app.dependency_overrides.clear()
+
+    results["/dashboard"]["legacy_orm_pydantic_cpu_ms"] = cpu_ms(legacy(factory, models.Meal, schemas.MealOut), args.repeat)
+    results["/dashboard/symptoms"]["legacy_orm_pydantic_cpu_ms"] = cpu_ms(legacy(factory, models.Symptom, schemas.SymptomOut), args.repeat)
+
+    print(json.dumps({"meals": args.meals, "symptoms": args.symptoms, "endpoints": results}, indent=2))
+
+
+if __name__ == "__main__":
+    run()
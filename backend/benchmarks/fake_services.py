@@ -0,0 +1,134 @@
+"""
+Local stand-ins for the paid services the backend calls.
+
+One app serves all three, with the same request/response shapes:
+  POST /v1/{endpoint}:predict                 Vertex AI online prediction
+  POST /predict                               our model service (MODEL_SERVICE_URL), JSON or wire.py frames
+  POST /v1/{model}:generateContent            Gemini (GEMINI_API_BASE)
+  GET  /stats                                 calls and injected errors per service
+  POST /v1/traces, GET /v1/traces             trace collector (TRACE_EXPORTER=http)
+
+Latency and failures are injected per service from FAKE_<SERVICE>_LATENCY_MS
+("mean" or "mean:stddev", sampled from a lognormal) and FAKE_<SERVICE>_ERROR_RATE
+(fraction answered with HTTP 500), where SERVICE is VERTEX, MODEL or GEMINI.
+
+Usage (from backend/):
+  FAKE_VERTEX_LATENCY_MS=120:40 python -m uvicorn --app-dir benchmarks fake_services:app --port 8090
+"""
+
+import asyncio
+import base64
+import math
+import os
+import random
+import sys
+from collections import Counter
+from pathlib import Path
+
+from fastapi import FastAPI, HTTPException, Request
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import wire  # noqa: E402
+
+LABELS = ["ramen", "pizza", "sushi", "caesar_salad", "chicken_curry", "ice_cream"]
+TRIGGERS = {
+    "ramen": "Gluten, Soy, High Sodium",
+    "pizza": "Gluten, Lactose",
+    "sushi": "Soy, Shellfish",
+    "caesar_salad": "Lactose",
+    "chicken_curry": "Spicy Food",
+    "ice_cream": "Lactose, Sugar",
+}
+
+
+class Behaviour:
+    """Latency/error injection for one fake service."""
+
+    def __init__(self, latency_ms: float = 0.0, stddev_ms: float = 0.0, error_rate: float = 0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.stddev_ms = stddev_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+
+    @classmethod
+    def from_env(cls, service: str):
+        mean, _, stddev = os.getenv(f"FAKE_{service}_LATENCY_MS", "0").partition(":")
+        return cls(float(mean), float(stddev or 0), float(os.getenv(f"FAKE_{service}_ERROR_RATE", "0")))
+
+    def delay(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        if self.stddev_ms <= 0:
+            return self.latency_ms / 1000
+        # Lognormal with the requested mean/stddev: long right tail, like real services
+        sigma2 = math.log(1 + (self.stddev_ms / self.latency_ms) ** 2)
+        mu = math.log(self.latency_ms) - sigma2 / 2
+        return self.rng.lognormvariate(mu, math.sqrt(sigma2)) / 1000
+
+    async def __call__(self, name: str):
+        stats[name] += 1
+        await asyncio.sleep(self.delay())
+        if self.rng.random() < self.error_rate:
+            stats[f"{name}_errors"] += 1
+            raise HTTPException(status_code=500, detail=f"injected {name} failure")
+
+
+stats = Counter()
+spans = []
+behaviour = {name: Behaviour.from_env(name.upper()) for name in ("vertex", "model", "gemini")}
+app = FastAPI(title="NutriSnap fake services")
+
+
+def _predictions(instances):
+    out = []
+    for encoded in instances:
+        if not isinstance(encoded, str):
+            # Raw bytes from NSF1 frames: base64 of the first 48 bytes matches the JSON path's first 64 chars
+            encoded = base64.b64encode((encoded.data if isinstance(encoded, wire.Pixels) else encoded)[:48]).decode()
+        # Stable label per image so repeated uploads classify the same way
+        label = LABELS[sum(encoded[:64].encode()) % len(LABELS)]
+        top = [{"label": label, "score": 0.91}, {"label": LABELS[0] if label != LABELS[0] else LABELS[1], "score": 0.05}]
+        out.append({"top1": top[:1], "topk": top})
+    return {"predictions": out}
+
+
+@app.post("/v1/{endpoint:path}:predict")
+async def vertex_predict(endpoint: str, request: Request):
+    await behaviour["vertex"]("vertex")
+    if "traceparent" in request.headers:
+        stats["vertex_traced"] += 1
+    return _predictions((await request.json())["instances"])
+
+
+@app.post("/predict")
+async def model_predict(request: Request):
+    await behaviour["model"]("model")
+    if request.headers.get("content-type") == wire.CONTENT_TYPE:
+        stats["model_frames"] += 1
+        return _predictions(wire.decode_batch(await request.body()))
+    return _predictions((await request.json())["instances"])
+
+
+@app.post("/v1/{model:path}:generateContent")
+async def gemini_generate(model: str, request: Request):
+    await behaviour["gemini"]("gemini")
+    prompt = (await request.json())["contents"][0]["parts"][0]["text"]
+    label = next((name for name in TRIGGERS if name.replace("_", " ") in prompt.lower()), None)
+    text = TRIGGERS.get(label, "None")
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+
+
+@app.post("/v1/traces")
+async def collect_traces(request: Request):
+    spans.extend((await request.json())["spans"])
+    return {"accepted": True}
+
+
+@app.get("/v1/traces")
+async def get_traces():
+    return {"spans": spans}
+
+
+@app.get("/stats")
+async def get_stats():
+    return dict(stats)
@@ -0,0 +1,278 @@
+"""
+End-to-end load test of the backend against local fake cloud services.
+
+Starts benchmarks/fake_services.py and the backend (uvicorn, fresh SQLite
+database unless --database-url is given) as subprocesses, points the backend's
+Vertex / model service / Gemini clients at the fakes, then drives mixed
+traffic open-loop at a target request rate. Prints (and with --out, writes)
+JSON with p50/p95/p99 latency, throughput and errors per endpoint, plus the
+git commit, so runs can be compared across commits.
+
+Usage (from backend/):
+  python benchmarks/loadtest.py --rps 50 --duration 30
+  python benchmarks/loadtest.py --inference model --model-latency 80:30 --gemini-latency 400:150 \\
+      --gemini-error-rate 0.02 --mix upload=3,dashboard=5,symptom=2 --out load.json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import httpx
+import numpy as np
+from PIL import Image
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Traffic classes: method, path, and how to build the request
+ENDPOINTS = {
+    "upload": ("POST", "/log/food"),
+    "batch_upload": ("POST", "/log/food/batch"),
+    "dashboard": ("GET", "/dashboard"),
+    "symptoms": ("GET", "/dashboard/symptoms"),
+    "recent": ("GET", "/dashboard/recent"),
+    "triggers": ("GET", "/dashboard/triggers"),
+    "symptom": ("POST", "/log/symptom"),
+}
+DEFAULT_MIX = "upload=2,dashboard=4,recent=1,triggers=1,symptom=2"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def sample_images(count: int = 8, size: int = 640):
+    """Distinct JPEGs so the fake classifier returns a spread of labels."""
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        pixels = rng.integers(0, 255, (size, size, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+
+def start_server(module: str, port: int, env: dict, app_dir: Path, workers: int = 1):
+    cmd = [sys.executable, "-m", "uvicorn", "--app-dir", str(app_dir), module,
+           "--port", str(port), "--log-level", "warning", "--workers", str(workers)]
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env={**os.environ, **env})
+
+
+def wait_until_up(url: str, proc, timeout: float = 180.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint {name!r}; choose from {', '.join(ENDPOINTS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def summarize(latencies: list, statuses: Counter, errors: Counter, duration: float) -> dict:
+    ok = sum(n for code, n in statuses.items() if isinstance(code, int) and code < 400)
+    total = sum(statuses.values())
+    summary = {
+        "requests": total,
+        "ok": ok,
+        "errors": total - ok,
+        "error_rate": round((total - ok) / total, 4) if total else 0.0,
+        "throughput_rps": round(ok / duration, 2) if duration else 0.0,
+        "status_codes": {str(code): n for code, n in sorted(statuses.items(), key=str)},
+    }
+    if errors:
+        summary["exceptions"] = dict(errors)
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary.update(
+            p50_ms=round(float(p50), 2),
+            p95_ms=round(float(p95), 2),
+            p99_ms=round(float(p99), 2),
+            mean_ms=round(float(np.mean(latencies)), 2),
+            max_ms=round(float(np.max(latencies)), 2),
+        )
+    return summary
+
+
+async def drive(base_url: str, rps: float, duration: float, weights: dict, images: list,
+                seed: int = 0, poisson: bool = True, max_inflight: int = 1000, timeout: float = 60.0):
+    """Open-loop traffic: requests start on schedule whether or not earlier ones finished."""
+    rng = random.Random(seed)
+    names, cum = list(weights), np.cumsum(list(weights.values()))
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    errors = defaultdict(Counter)
+    dropped = Counter()
+    inflight = set()
+
+    async def send(client, name):
+        method, path = ENDPOINTS[name]
+        kwargs = {}
+        if name == "upload":
+            kwargs["files"] = {"file": ("meal.jpg", rng.choice(images), "image/jpeg")}
+        elif name == "batch_upload":
+            kwargs["files"] = [("files", (f"{i}.jpg", img, "image/jpeg")) for i, img in enumerate(rng.sample(images, 4))]
+        elif name == "symptom":
+            kwargs["json"] = {"symptom_name": rng.choice(["Bloating", "Heartburn", "Lethargy"]), "severity": rng.randint(1, 10)}
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+            statuses[name][response.status_code] += 1
+        except httpx.HTTPError as exc:
+            statuses[name]["exception"] += 1
+            errors[name][type(exc).__name__] += 1
+            return
+        latencies[name].append((time.perf_counter() - start) * 1000)
+
+    limits = httpx.Limits(max_connections=max_inflight, max_keepalive_connections=max_inflight)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        start = time.perf_counter()
+        next_at = 0.0
+        while next_at < duration:
+            delay = start + next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            name = names[int(np.searchsorted(cum, rng.random() * cum[-1], side="right"))]
+            if len(inflight) >= max_inflight:
+                dropped[name] += 1
+            else:
+                task = asyncio.create_task(send(client, name))
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+            next_at += rng.expovariate(rps) if poisson else 1.0 / rps
+        sent_for = time.perf_counter() - start
+        if inflight:
+            await asyncio.gather(*inflight)
+        elapsed = time.perf_counter() - start
+
+    endpoints = {name: summarize(latencies[name], statuses[name], errors[name], elapsed) for name in names}
+    for name, count in dropped.items():
+        endpoints[name]["client_dropped"] = count
+    overall = summarize(
+        [ms for values in latencies.values() for ms in values],
+        sum(statuses.values(), Counter()), sum(errors.values(), Counter()), elapsed,
+    )
+    overall["offered_rps"] = round(sum(sum(c.values()) for c in statuses.values()) / sent_for, 2)
+    overall["elapsed_seconds"] = round(elapsed, 2)
+    return {"overall": overall, "endpoints": endpoints}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=20)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of offered load")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of load before measuring")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"endpoint=weight list; endpoints: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--constant", action="store_true", help="Evenly spaced arrivals instead of Poisson")
+    parser.add_argument("--inference", choices=["vertex", "model"], default="vertex", help="Which fake classifier the backend calls")
+    for service in ("vertex", "model", "gemini"):
+        parser.add_argument(f"--{service}-latency", default="100:30" if service != "gemini" else "300:100",
+                            help="Injected latency in ms, mean[:stddev]")
+        parser.add_argument(f"--{service}-error-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes for the backend")
+    parser.add_argument("--database-url", help="Defaults to a fresh SQLite file")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra backend environment")
+    parser.add_argument("--max-inflight", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path)
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="nutrisnap-load-"))
+    fake_port, backend_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    fake_env = {}
+    for service in ("vertex", "model", "gemini"):
+        fake_env[f"FAKE_{service.upper()}_LATENCY_MS"] = getattr(args, f"{service}_latency")
+        fake_env[f"FAKE_{service.upper()}_ERROR_RATE"] = str(getattr(args, f"{service}_error_rate"))
+
+    backend_env = {
+        "TESTING": "0",
+        "DATABASE_URL": args.database_url or f"sqlite:///{tmp / 'load.db'}",
+        "UPLOAD_DIR": str(tmp / "uploads"),
+        "GEMINI_API_BASE": fake_url,
+        "WEB_CONCURRENCY": str(args.workers),
+    }
+    if args.workers > 1:
+        # Per-worker caches are refused with several workers; pass --env CACHE_BACKEND=redis to measure caching
+        backend_env["CACHE_BACKEND"] = "none"
+    if args.inference == "vertex":
+        backend_env.update(VERTEX_ENDPOINT_ID="fake-endpoint", VERTEX_PROJECT_ID="local",
+                           VERTEX_API_BASE=fake_url, VERTEX_AUTH="0")
+    else:
+        backend_env.update(VERTEX_ENDPOINT_ID="", MODEL_SERVICE_URL=fake_url)
+    backend_env.update(dict(item.split("=", 1) for item in args.env))
+
+    fake = start_server("fake_services:app", fake_port, fake_env, BACKEND_DIR / "benchmarks")
+    backend = start_server("main:app", backend_port, backend_env, BACKEND_DIR, workers=args.workers)
+    try:
+        wait_until_up(f"{fake_url}/stats", fake)
+        backend_url = f"http://127.0.0.1:{backend_port}"
+        wait_until_up(f"{backend_url}/", backend)
+
+        weights = parse_mix(args.mix)
+        images = sample_images()
+        if args.warmup > 0:
+            asyncio.run(drive(backend_url, args.rps, args.warmup, weights, images, args.seed + 1,
+                              not args.constant, args.max_inflight))
+        results = asyncio.run(drive(backend_url, args.rps, args.duration, weights, images, args.seed,
+                                    not args.constant, args.max_inflight))
+        fake_stats = httpx.get(f"{fake_url}/stats").json()
+    finally:
+        for proc in (backend, fake):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    report = {
+        "commit": git_commit(),
+        "config": {
+            "rps": args.rps, "duration": args.duration, "mix": weights, "arrivals": "constant" if args.constant else "poisson",
+            "inference": args.inference, "workers": args.workers,
+            "fakes": fake_env, "backend_env": {k: v for k, v in backend_env.items() if k not in ("DATABASE_URL",)},
+        },
+        **results,
+        "fake_service_calls": fake_stats,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        args.out.write_text(text + "\n")
+
+
+if __name__ == "__main__":
+    run()
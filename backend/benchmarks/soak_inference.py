@@ -0,0 +1,63 @@
+"""
+Soak test for inference.predict: run it thousands of times and flag memory growth.
+
+Uses the randomly initialized ViT from bench_inference.py (no GCS download),
+cycles through a pool of synthetic JPEGs, samples RSS every --sample-every
+calls and fits a trend after a warmup. Exits 1 when the growth looks like a
+leak (sustained rise above --min-growth-mb), so it can gate CI or a canary.
+--inject-leak-kb keeps that many KiB per call alive to check the detector fires.
+
+Usage (from backend/):
+  python benchmarks/soak_inference.py --iterations 5000 --resolution 512 --out soak.json
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import inference
+import memstats
+from bench_inference import MODEL_CONFIGS, build_bundle, make_jpegs
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=sorted(MODEL_CONFIGS), default="tiny")
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--resolution", type=int, default=512)
+    parser.add_argument("--images", type=int, default=16, help="Distinct JPEGs to cycle through")
+    parser.add_argument("--sample-every", type=int, default=50)
+    parser.add_argument("--warmup", type=float, default=0.2, help="Fraction of samples ignored")
+    parser.add_argument("--min-growth-mb", type=float, default=32)
+    parser.add_argument("--inject-leak-kb", type=int, default=0)
+    parser.add_argument("--out", type=Path)
+    args = parser.parse_args(argv)
+
+    inference._BUNDLE = build_bundle(args.model)
+    jpegs = make_jpegs(args.resolution, args.images)
+    leaked = []
+
+    def call(image_bytes):
+        inference.predict(image_bytes)
+        if args.inject_leak_kb:
+            leaked.append(bytearray(args.inject_leak_kb * 1024))
+
+    result = memstats.soak(call, jpegs, args.iterations, args.sample_every, warmup=args.warmup,
+                           min_growth_bytes=int(args.min_growth_mb * 1024 * 1024))
+    report = {"model": args.model, "resolution": args.resolution, "inject_leak_kb": args.inject_leak_kb,
+              **result, "torch": memstats.torch_stats(), "peak_rss_bytes": memstats.peak_rss_bytes()}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        args.out.write_text(text + "\n")
+    verdict = "⚠️  memory keeps growing" if result["leak"] else "✅ no sustained growth"
+    print(f"{verdict}: {result['growth_bytes'] / 2**20:.1f} MiB over the measured window", file=sys.stderr)
+    return 1 if result["leak"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,291 @@
+# nutrisnap-backend/cache.py
+"""
+Per-user response cache for the dashboard endpoints.
+
+Every user has a version counter that write endpoints bump. Cached bodies are
+keyed by (user, path, version), and the version doubles as a strong ETag, so
+a poll after no new writes is either a 304 or a cache hit.
+
+CACHE_BACKEND selects where entries live:
+  memory       in-process LRU (default; single worker only)
+  redis        shared Redis at CACHE_REDIS_URL (needs the `redis` package)
+  local-redis  in-process stand-in speaking the same commands, for tests/dev
+  none         caching and ETags disabled
+
+A worker that misses another worker's version bump would answer 304s, and
+later serve fresh bodies, under a stale ETag. So when WEB_CONCURRENCY (read by
+uvicorn and gunicorn as the worker count) is above 1, the in-process backends
+are refused and a shared one has to be configured.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import orjson
+from fastapi import Request, Response
+
+import metrics
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+CACHE_REQUESTS = metrics.counter("nutrisnap_cache_requests", "Cached endpoint lookups by result", ["result"])
+
+
+class MemoryBackend:
+    """Thread-safe LRU dict with per-entry expiry."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key):
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key, value, ttl=None, nx=False):
+        with self._lock:
+            if nx and self._live(key) is not None:
+                return False
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+            return True
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._live(key) or 0) + 1
+            self._data[key] = (value, None)
+            self._data.move_to_end(key)
+            return value
+
+
+class LocalRedis:
+    """Minimal in-process stand-in for the redis-py client (bytes in, bytes out)."""
+
+    def __init__(self):
+        self._backend = MemoryBackend(max_entries=10**9)
+        self._lists = {}
+        self._lock = threading.Lock()
+        self._pushed = threading.Condition(self._lock)
+        self._channels = {}
+
+    @staticmethod
+    def _encode(value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def get(self, key):
+        return self._backend.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        with self._lock:
+            return self._backend.set(key, self._encode(value), ttl=ex, nx=nx) or None
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._backend.get(key) or 0) + 1
+            self._backend.set(key, self._encode(value))
+            return value
+
+    def lpush(self, key, *values):
+        with self._lock:
+            items = self._lists.setdefault(key, deque())
+            for value in values:
+                items.appendleft(self._encode(value))
+            self._pushed.notify_all()
+            return len(items)
+
+    def rpush(self, key, *values):
+        with self._lock:
+            items = self._lists.setdefault(key, deque())
+            items.extend(self._encode(value) for value in values)
+            self._pushed.notify_all()
+            return len(items)
+
+    def rpop(self, key):
+        with self._lock:
+            items = self._lists.get(key)
+            return items.pop() if items else None
+
+    def brpop(self, key, timeout=0):
+        """(key, value) once ``key`` has an item, or None after ``timeout`` seconds (0 waits forever)."""
+        with self._lock:
+            self._pushed.wait_for(lambda: self._lists.get(key), timeout=timeout or None)
+            items = self._lists.get(key)
+            return (self._encode(key), items.pop()) if items else None
+
+    def llen(self, key):
+        with self._lock:
+            return len(self._lists.get(key, ()))
+
+    def publish(self, channel, message):
+        channel = self._encode(channel)
+        subscribers = list(self._channels.get(channel, ()))
+        for subscriber in subscribers:
+            subscriber._deliver(channel, self._encode(message))
+        return len(subscribers)
+
+    def pubsub(self):
+        return LocalPubSub(self)
+
+
+class LocalPubSub:
+    """Subscriber side of LocalRedis.publish, shaped like redis-py's PubSub."""
+
+    def __init__(self, server):
+        self._server = server
+        self._messages = deque()
+        self._ready = threading.Condition()
+
+    def subscribe(self, *channels):
+        for channel in channels:
+            self._server._channels.setdefault(self._server._encode(channel), []).append(self)
+
+    def _deliver(self, channel, data):
+        with self._ready:
+            self._messages.append({"type": "message", "channel": channel, "data": data})
+            self._ready.notify_all()
+
+    def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        with self._ready:
+            self._ready.wait_for(lambda: self._messages, timeout=timeout)
+            return self._messages.popleft() if self._messages else None
+
+    def close(self):
+        for subscribers in self._server._channels.values():
+            if self in subscribers:
+                subscribers.remove(self)
+
+
+class RedisBackend:
+    """Adapter from the redis-py command set to the backend interface."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl=None, nx=False):
+        return bool(self.client.set(key, value, ex=ttl, nx=nx))
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+
+def _build_backend(name: str, workers: int = WEB_CONCURRENCY):
+    if name == "none":
+        return None
+    if name != "redis" and workers > 1:
+        raise RuntimeError(
+            f"CACHE_BACKEND={name} is per process and would serve stale ETags across "
+            f"{workers} workers; set CACHE_BACKEND=redis or CACHE_BACKEND=none."
+        )
+    if name == "redis":
+        import redis
+
+        return RedisBackend(redis.Redis.from_url(CACHE_REDIS_URL))
+    if name == "local-redis":
+        return RedisBackend(LocalRedis())
+    return MemoryBackend()
+
+
+_backend = _build_backend(CACHE_BACKEND)
+
+
+def get_backend():
+    return _backend
+
+
+def set_backend(backend):
+    """Swap the cache backend (tests, or wiring a shared client at startup)."""
+    global _backend
+    _backend = backend
+
+
+def user_version(user_id: int):
+    """Current cache version for ``user_id``, seeded from the clock on first use.
+
+    Seeding with a timestamp rather than 0 keeps ETags from repeating after a
+    restart or an evicted counter.
+    """
+    key = f"ver:{user_id}"
+    value = _backend.get(key)
+    if value is None:
+        _backend.set(key, time.time_ns(), nx=True)
+        value = _backend.get(key)
+    return int(value)
+
+
+def invalidate_user(user_id: int):
+    """Bump ``user_id``'s version so cached bodies and ETags go stale."""
+    if _backend is None:
+        return
+    user_version(user_id)
+    _backend.incr(f"ver:{user_id}")
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        # If-None-Match uses weak comparison, so ignore W/ prefixes
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+async def cached_json(request: Request, user_id: int, build, cacheable: bool = True) -> Response:
+    """Serve ``await build()`` as JSON for ``user_id``, through the cache and ETag check.
+
+    Pass ``cacheable=False`` when ``build`` reads from a replica: a lagging
+    replica can miss writes the current version already counts, so its body is
+    neither stored nor labelled with that version's ETag.
+    """
+    if _backend is None:
+        CACHE_REQUESTS.inc(result="bypass")
+        return Response(orjson.dumps(await build()), media_type="application/json")
+
+    version = user_version(user_id)
+    etag = f'"{user_id}-{version}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        CACHE_REQUESTS.inc(result="not_modified")
+        return Response(status_code=304, headers=headers)
+
+    if not cacheable:
+        CACHE_REQUESTS.inc(result="uncacheable")
+        return Response(orjson.dumps(await build()), media_type="application/json",
+                        headers={"Cache-Control": "private, no-cache"})
+
+    path = f"{request.url.path}?{request.url.query}" if request.url.query else request.url.path
+    key = f"resp:{user_id}:{path}:{version}"
+    body = _backend.get(key)
+    if body is None:
+        CACHE_REQUESTS.inc(result="miss")
+        body = orjson.dumps(await build())
+        _backend.set(key, body, ttl=CACHE_TTL_SECONDS)
+    else:
+        CACHE_REQUESTS.inc(result="hit")
+    return Response(body, media_type="application/json", headers=headers)
@@ -1,36 +1,337 @@
 # nutrisnap-backend/database.py
-from sqlalchemy import create_engine
+from fastapi import Depends
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
 import os
+import random
+import threading
 import time
 
+import metrics
+import tracing
+
+TESTING = os.getenv("TESTING") == "1"
+
+# Set DB_ASYNC=1 to serve requests through an asyncio engine (asyncpg / aiosqlite).
+# The synchronous engine is always available because scripts (seed.py, reset_db.py) use it.
+USE_ASYNC = os.getenv("DB_ASYNC") == "1"
+
 # Get DB URL from Docker environment variables
 # During tests, use SQLite (set TESTING=1 before running pytest)
-if os.getenv("TESTING") == "1":
+if TESTING:
     SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-    engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-    print("✅ Using SQLite for testing")
 else:
     SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://user:password@db:5432/nutrisnap_db")
-    # Retry logic for Docker startup timing
+
+# Optional read replica for dashboard reads. After a user writes, their reads stay
+# on the primary for DB_READ_YOUR_WRITES_SECONDS so replica lag can't hide the write.
+REPLICA_DATABASE_URL = os.getenv("DATABASE_REPLICA_URL")
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+
+# Connection pool tuning (ignored for SQLite except the timeout)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds, -1 disables
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 keeps the server default
+
+# Startup retry: exponential backoff capped at DB_CONNECT_MAX_DELAY, giving up after DB_CONNECT_DEADLINE
+DB_CONNECT_DEADLINE = float(os.getenv("DB_CONNECT_DEADLINE", "60"))
+DB_CONNECT_MAX_DELAY = float(os.getenv("DB_CONNECT_MAX_DELAY", "8"))
+
+Base = declarative_base()
+
+
+class PoolMetrics:
+    """Counters for one engine's connection pool checkouts."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, waited: float, timed_out: bool = False):
+        self.checkouts += 1
+        self.timeouts += int(timed_out)
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def snapshot(self, pool) -> dict:
+        stats = {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+        }
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+                max_overflow=pool._max_overflow,
+            )
+        return stats
+
+
+# Keyed by the pool's logging name so counters survive engine.dispose()
+POOL_METRICS = {}
+
+
+class _TimedPoolMixin:
+    """Times how long each checkout waits for a free connection."""
+
+    def _do_get(self):
+        metrics = POOL_METRICS.setdefault(self.logging_name, PoolMetrics())
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        metrics.record(time.perf_counter() - start)
+        return conn
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def async_url(url: str) -> str:
+    """Map a sync driver URL onto its asyncio counterpart."""
+    if url.startswith("sqlite+aiosqlite:") or url.startswith("postgresql+asyncpg:"):
+        return url
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    raise ValueError(f"No async driver known for {url}")
+
+
+def engine_options(url: str, name: str) -> dict:
+    """Pool and connect arguments for ``create_engine``/``create_async_engine``."""
+    is_async = "+asyncpg" in url or "+aiosqlite" in url
+    options = {
+        "poolclass": TimedAsyncQueuePool if is_async else TimedQueuePool,
+        "pool_logging_name": name,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+        return options
+
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        if "+asyncpg" in url:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+
+def make_engine(url: str, name: str = "primary"):
+    return tracing.instrument_engine(create_engine(url, **engine_options(url, name)))
+
+
+def make_async_engine(url: str, name: str = "primary-async"):
+    url = async_url(url)
+    return tracing.instrument_engine(create_async_engine(url, **engine_options(url, name)))
+
+
+def wait_for_database(engine, deadline: float = DB_CONNECT_DEADLINE, max_delay: float = DB_CONNECT_MAX_DELAY, sleep=time.sleep):
+    """Block until ``engine`` accepts a connection, backing off exponentially.
+
+    Raises RuntimeError once ``deadline`` seconds pass without a successful connect.
+    """
+    start = time.monotonic()
+    attempt = 0
     while True:
         try:
-            engine = create_engine(SQLALCHEMY_DATABASE_URL)
-            connection = engine.connect()
-            connection.close()
+            with engine.connect():
+                pass
             print("✅ Database connection successful!")
-            break
+            return
         except Exception as e:
-            print("⏳ Waiting for Database...", e)
-            time.sleep(2)
+            elapsed = time.monotonic() - start
+            # Full-jitter style backoff so replicas don't retry in lockstep
+            delay = min(max_delay, 0.25 * 2 ** attempt) * random.uniform(0.5, 1.0)
+            if elapsed + delay > deadline:
+                raise RuntimeError(f"Database unavailable after {elapsed:.1f}s: {e}") from e
+            print(f"⏳ Waiting for Database (retry {attempt + 1} in {delay:.1f}s)...", e)
+            sleep(delay)
+            attempt += 1
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+# Prototype has a single hardcoded user; auth would supply this per request
+def current_user_id() -> int:
+    return 1
+
+
+def read_role(user_id: int) -> str:
+    """Engine role for a read-only request: the replica unless the user just wrote.
+
+    Read-your-writes is tracked per process, which is enough to keep a user's
+    own dashboard consistent right after an upload served by the same worker.
+    """
+    if not REPLICA_DATABASE_URL:
+        return "primary"
+    last = _last_write.get(user_id)
+    if last is not None and time.monotonic() - last < DB_READ_YOUR_WRITES_SECONDS:
+        return "primary"
+    return "replica"
+
+
+def is_replica(db) -> bool:
+    """Whether session ``db`` (sync or async) is bound to the replica engine."""
+    return db.bind is not None and db.bind in (_engines.get(("replica", False)), _engines.get(("replica", True)))
+
+
+def record_write(user_id: int):
+    """Pin ``user_id``'s reads to the primary for DB_READ_YOUR_WRITES_SECONDS."""
+    if not REPLICA_DATABASE_URL or DB_READ_YOUR_WRITES_SECONDS <= 0:
+        return
+    now = time.monotonic()
+    if len(_last_write) > 10000:
+        for uid, ts in list(_last_write.items()):
+            if now - ts >= DB_READ_YOUR_WRITES_SECONDS:
+                del _last_write[uid]
+    _last_write[user_id] = now
+
+
+_lock = threading.Lock()
+_last_write = {}
+# Keyed by (role, is_async); role is "primary" or "replica"
+_engines = {}
+_sessionmakers = {}
+
+
+def _url_for(role: str) -> str:
+    return REPLICA_DATABASE_URL if role == "replica" else SQLALCHEMY_DATABASE_URL
+
+
+def get_engine(role: str = "primary"):
+    """Create the sync engine for ``role`` on first use, waiting for the database to come up."""
+    key = (role, False)
+    if key not in _engines:
+        with _lock:
+            if key not in _engines:
+                engine = make_engine(_url_for(role), name=role)
+                if not TESTING:
+                    wait_for_database(engine)
+                elif role == "primary":
+                    print("✅ Using SQLite for testing")
+                _sessionmakers[key] = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                _engines[key] = engine
+    return _engines[key]
+
+
+def get_async_engine(role: str = "primary"):
+    key = (role, True)
+    if key not in _engines:
+        # Reuse the sync engine's startup wait so both engines see a live server
+        get_engine(role)
+        with _lock:
+            if key not in _engines:
+                engine = make_async_engine(_url_for(role), name=f"{role}-async")
+                _sessionmakers[key] = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+                _engines[key] = engine
+                print(f"✅ Using async database engine ({role})")
+    return _engines[key]
+
+
+def session_factory(role: str = "primary", is_async: bool = False):
+    if is_async:
+        get_async_engine(role)
+    else:
+        get_engine(role)
+    return _sessionmakers[(role, is_async)]
+
+
+def __getattr__(name):
+    # Lazily build engines so importing this module never blocks on the database
+    if name == "engine":
+        return get_engine()
+    if name == "SessionLocal":
+        return session_factory()
+    if name == "async_engine":
+        return get_async_engine()
+    if name == "AsyncSessionLocal":
+        return session_factory(is_async=True)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def pool_stats() -> dict:
+    """Pool occupancy and checkout wait metrics for every engine created so far."""
+    stats = {}
+    for engine in list(_engines.values()):
+        pool = engine.pool
+        stats[pool.logging_name] = POOL_METRICS.setdefault(pool.logging_name, PoolMetrics()).snapshot(pool)
+    return stats
+
+
+def _pool_gauge(field):
+    return lambda: {(name,): stats.get(field, 0) for name, stats in pool_stats().items()}
+
+
+metrics.gauge("nutrisnap_db_pool_checked_out", "Connections in use per pool", ["pool"], fn=_pool_gauge("checked_out"))
+metrics.gauge("nutrisnap_db_pool_checkout_timeouts", "Checkouts that timed out per pool", ["pool"], fn=_pool_gauge("timeouts"))
+
+
+def get_sync_db():
+    db = session_factory()()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with session_factory(is_async=True)() as db:
+        yield db
+
+
+def get_sync_read_db(user_id: int = Depends(current_user_id)):
+    db = session_factory(read_role(user_id))()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(user_id: int = Depends(current_user_id)):
+    async with session_factory(read_role(user_id), is_async=True)() as db:
+        yield db
+
+
+# Request dependencies used by the API; DB_ASYNC picks the engine flavour.
+# get_db always targets the primary, get_read_db may be served by the replica.
+get_db = get_async_db if USE_ASYNC else get_sync_db
+get_read_db = get_async_read_db if USE_ASYNC else get_sync_read_db
+
+
+async def run(db, fn, *args):
+    """Run ``fn(session, *args)`` without blocking the event loop.
+
+    Query code is written once against the ORM Session API. An AsyncSession
+    executes it through ``run_sync`` on the asyncio driver, while a plain
+    Session is handed to the threadpool.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(fn, db, *args)
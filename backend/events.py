@@ -0,0 +1,125 @@
+# nutrisnap-backend/events.py
+"""
+Per-user Server-Sent Events for live dashboard updates.
+
+Writes publish small delta events ({"op": "created" | "updated", ...fields})
+that are fanned out to each of the user's open /events streams. Every
+connection owns a bounded buffer; a client too slow to drain it is
+disconnected and resumes with Last-Event-ID from the per-user replay ring.
+Event ids carry a per-process boot token, so a resume id the process can't
+satisfy (restart, or fell out of the ring) gets a "reset" event telling the
+client to refetch the dashboard instead.
+
+Delivery is per API process; with several workers, put sticky sessions in
+front of /events.
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import defaultdict, deque
+
+import orjson
+
+import metrics
+
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_BUFFER_SIZE = int(os.getenv("SSE_BUFFER_SIZE", "64"))
+SSE_REPLAY_SIZE = int(os.getenv("SSE_REPLAY_SIZE", "256"))
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))
+# Streams end after this long and the client transparently reconnects with
+# Last-Event-ID, which lets load balancers rebalance long-lived connections
+SSE_MAX_CONNECTION_SECONDS = float(os.getenv("SSE_MAX_CONNECTION_SECONDS", "1800"))
+
+_OVERFLOW = object()
+
+
+def _frame(event_id: str, event: str, data) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+class EventBroker:
+    def __init__(self, buffer_size: int = SSE_BUFFER_SIZE, replay_size: int = SSE_REPLAY_SIZE):
+        self.buffer_size = buffer_size
+        self.boot = uuid.uuid4().hex[:8]
+        self._seq = defaultdict(int)
+        self._history = defaultdict(lambda: deque(maxlen=replay_size))
+        self._subscribers = defaultdict(set)
+
+    def connections(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def publish(self, user_id: int, event: str, data: dict):
+        """Record an event for ``user_id`` and push it to their open streams."""
+        self._seq[user_id] += 1
+        seq = self._seq[user_id]
+        item = (seq, _frame(f"{self.boot}-{seq}", event, data))
+        self._history[user_id].append(item)
+        for queue in list(self._subscribers.get(user_id, ())):
+            try:
+                queue.put_nowait(item)
+            except asyncio.QueueFull:
+                # Slow consumer: drop its backlog and close it so it resumes from the ring
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(_OVERFLOW)
+                self._subscribers[user_id].discard(queue)
+
+    def _replay(self, user_id: int, last_event_id):
+        """Frames after ``last_event_id``, or None when that point can't be resumed."""
+        history = self._history[user_id]
+        if last_event_id is None:
+            return []
+        boot, _, seq = last_event_id.rpartition("-")
+        if boot != self.boot or not seq.isdigit():
+            return None
+        seq = int(seq)
+        oldest = history[0][0] if history else self._seq[user_id] + 1
+        if seq > self._seq[user_id] or seq < oldest - 1:
+            return None
+        return [item for item in history if item[0] > seq]
+
+    async def stream(self, user_id: int, last_event_id=None, heartbeat: float = SSE_HEARTBEAT_SECONDS, max_seconds: float = None):
+        """Async generator of SSE frames for one connection."""
+        deadline = time.monotonic() + (SSE_MAX_CONNECTION_SECONDS if max_seconds is None else max_seconds)
+        queue = asyncio.Queue(maxsize=self.buffer_size)
+        # Subscribe before replaying so nothing published in between is lost
+        self._subscribers[user_id].add(queue)
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            replay = self._replay(user_id, last_event_id)
+            last_sent = self._seq[user_id] if replay is None else 0
+            if replay is None:
+                yield _frame(f"{self.boot}-{last_sent}", "reset", {})
+            for seq, frame in replay or []:
+                last_sent = seq
+                yield frame
+
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=min(heartbeat, remaining))
+                except asyncio.TimeoutError:
+                    if time.monotonic() < deadline:
+                        yield ": ping\n\n"
+                    continue
+                if item is _OVERFLOW:
+                    return
+                seq, frame = item
+                if seq > last_sent:
+                    last_sent = seq
+                    yield frame
+        finally:
+            self._subscribers[user_id].discard(queue)
+            if not self._subscribers[user_id]:
+                del self._subscribers[user_id]
+
+
+broker = EventBroker()
+metrics.gauge("nutrisnap_sse_connections", "Open /events streams", fn=lambda: broker.connections())
+
+
+def publish(user_id: int, event: str, data: dict):
+    broker.publish(user_id, event, data)
@@ -0,0 +1,126 @@
+# nutrisnap-backend/export.py
+"""
+Streaming export of a user's meal and symptom history.
+
+Rows are read through a server-side cursor (``stream_results``/``yield_per``
+on the sync engine, ``AsyncSession.stream`` on the async one) and encoded one
+chunk at a time, so memory stays flat however long the history is.
+"""
+import csv
+import io
+import os
+from datetime import datetime
+from typing import Optional
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+
+# Every stored column except the owner, in file column order
+EXPORT_COLUMNS = {
+    "meals": (
+        models.Meal.id,
+        models.Meal.created_at,
+        models.Meal.identified_foods,
+        models.Meal.protein,
+        models.Meal.carbs,
+        models.Meal.fat,
+        models.Meal.triggers,
+        models.Meal.status,
+        models.Meal.image_url,
+    ),
+    "symptoms": (
+        models.Symptom.id,
+        models.Symptom.created_at,
+        models.Symptom.symptom_name,
+        models.Symptom.severity,
+        models.Symptom.notes,
+    ),
+}
+EXPORT_MODELS = {"meals": models.Meal, "symptoms": models.Symptom}
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def export_query(kind: str, user_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Oldest-first SELECT of ``kind`` rows for ``user_id`` in [start, end)."""
+    model = EXPORT_MODELS[kind]
+    stmt = select(*EXPORT_COLUMNS[kind]).where(model.user_id == user_id)
+    if start is not None:
+        stmt = stmt.where(model.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(model.created_at < end)
+    return stmt.order_by(model.created_at, model.id)
+
+
+def iter_chunks(db, stmt, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """Lists of row mappings from a sync Session, ``chunk_rows`` at a time."""
+    result = db.execute(stmt.execution_options(stream_results=True, yield_per=chunk_rows))
+    try:
+        for partition in result.mappings().partitions():
+            yield partition
+    finally:
+        result.close()
+
+
+async def aiter_chunks(db: AsyncSession, stmt, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    result = await db.stream(stmt.execution_options(yield_per=chunk_rows))
+    try:
+        async for partition in result.mappings().partitions():
+            yield partition
+    finally:
+        await result.close()
+
+
+def encode_ndjson(kind: str, rows) -> bytes:
+    # Each line names its table so a mixed export can be split back apart
+    record_type = kind[:-1]
+    return b"".join(orjson.dumps({"type": record_type, **row}) + b"\n" for row in rows)
+
+
+def csv_header(kind: str) -> bytes:
+    return encode_csv([[column.key for column in EXPORT_COLUMNS[kind]]])
+
+
+def encode_csv(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        values = row.values() if hasattr(row, "values") else row
+        writer.writerow(v.isoformat() if isinstance(v, datetime) else v for v in values)
+    return buffer.getvalue().encode()
+
+
+def _encode(fmt: str, kind: str, rows) -> bytes:
+    return encode_ndjson(kind, rows) if fmt == "ndjson" else encode_csv(rows)
+
+
+def stream_export(db, kinds, fmt: str, user_id: int, start=None, end=None, chunk_rows: Optional[int] = None):
+    """Body iterator for ``StreamingResponse``.
+
+    Sync sessions give a plain generator (Starlette drains it in the
+    threadpool); async sessions give an async generator.
+    """
+    chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+    if isinstance(db, AsyncSession):
+        return _astream(db, kinds, fmt, user_id, start, end, chunk_rows)
+    return _stream(db, kinds, fmt, user_id, start, end, chunk_rows)
+
+
+def _stream(db, kinds, fmt, user_id, start, end, chunk_rows):
+    for kind in kinds:
+        if fmt == "csv":
+            yield csv_header(kind)
+        for rows in iter_chunks(db, export_query(kind, user_id, start, end), chunk_rows):
+            yield _encode(fmt, kind, rows)
+
+
+async def _astream(db, kinds, fmt, user_id, start, end, chunk_rows):
+    for kind in kinds:
+        if fmt == "csv":
+            yield csv_header(kind)
+        async for rows in aiter_chunks(db, export_query(kind, user_id, start, end), chunk_rows):
+            yield _encode(fmt, kind, rows)
@@ -0,0 +1,183 @@
+# nutrisnap-backend/export_parquet.py
+"""
+Incremental Parquet snapshot of meals/symptoms for offline analytics.
+
+    python export_parquet.py --out /data/nutrisnap-parquet
+    python export_parquet.py --out /data/nutrisnap-parquet --every 3600   # run hourly
+
+Rows are written to date-partitioned files (``meals/date=2024-01-31/part-....parquet``)
+with meal triggers exploded into a list column. ``_watermarks.json`` records, per
+table, the last exported id and the running row count; it is updated after
+each chunk's files land, so an interrupted run picks up where it stopped. Files
+holding ids past the watermark are leftovers of a run that died before saving
+it, and are deleted before the next run rewrites those rows. Reads go to
+DATABASE_REPLICA_URL when it is set.
+
+The watermark never passes a row that may still change or appear: a run stops
+below the oldest meal still "pending" in the background pipeline, and below
+any row created in the last PARQUET_SETTLE_SECONDS (so a slow transaction that
+commits a lower id late is not skipped). Only "complete" meals are written;
+"failed" ones are terminal and left out.
+"""
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, select
+
+import analysis
+import database
+import export
+
+EXPORT_CHUNK_ROWS = int(os.getenv("PARQUET_CHUNK_ROWS", "50000"))
+PARQUET_SETTLE_SECONDS = float(os.getenv("PARQUET_SETTLE_SECONDS", "300"))
+WATERMARK_FILE = "_watermarks.json"
+
+SCHEMAS = {
+    "meals": pa.schema([
+        ("id", pa.int64()),
+        ("user_id", pa.int64()),
+        ("created_at", pa.timestamp("us")),
+        ("identified_foods", pa.string()),
+        ("protein", pa.float64()),
+        ("carbs", pa.float64()),
+        ("fat", pa.float64()),
+        ("triggers", pa.list_(pa.string())),
+        ("status", pa.string()),
+    ]),
+    "symptoms": pa.schema([
+        ("id", pa.int64()),
+        ("user_id", pa.int64()),
+        ("created_at", pa.timestamp("us")),
+        ("symptom_name", pa.string()),
+        ("severity", pa.int64()),
+        ("notes", pa.string()),
+    ]),
+}
+
+
+def load_watermarks(out_dir: Path) -> dict:
+    path = Path(out_dir) / WATERMARK_FILE
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_watermarks(out_dir: Path, marks: dict):
+    path = Path(out_dir) / WATERMARK_FILE
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(marks, indent=2, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def _export_bound(db, kind: str, after_id: int, settle_seconds: float) -> int:
+    """First id past the watermark that can't be exported yet (pending or too recent)."""
+    model = export.EXPORT_MODELS[kind]
+    unsettled = [model.created_at > datetime.utcnow() - timedelta(seconds=settle_seconds)]
+    if kind == "meals":
+        unsettled.append(model.status == "pending")
+    hold_id = db.execute(select(func.min(model.id)).where(model.id > after_id, or_(*unsettled))).scalar()
+    if hold_id is not None:
+        return hold_id
+    return (db.execute(select(func.max(model.id))).scalar() or after_id) + 1
+
+
+def _query(kind: str, after_id: int, bound: int):
+    model = export.EXPORT_MODELS[kind]
+    columns = [getattr(model, name) for name in SCHEMAS[kind].names]
+    stmt = select(*columns).where(model.id > after_id, model.id < bound)
+    if kind == "meals":
+        stmt = stmt.where(model.status == "complete")
+    return stmt.order_by(model.id)
+
+
+def _write_partitions(kind: str, rows, out_dir: Path) -> list:
+    by_date = defaultdict(list)
+    for row in rows:
+        row = dict(row)
+        if kind == "meals":
+            row["triggers"] = analysis.split_triggers(row["triggers"])
+        by_date[row["created_at"].date().isoformat()].append(row)
+
+    paths = []
+    for day, day_rows in sorted(by_date.items()):
+        partition = Path(out_dir) / kind / f"date={day}"
+        partition.mkdir(parents=True, exist_ok=True)
+        # The id range in the name lets the next run find files past the watermark
+        path = partition / f"part-{day_rows[0]['id']:012d}-{day_rows[-1]['id']:012d}.parquet"
+        tmp = path.with_suffix(".tmp")
+        pq.write_table(pa.Table.from_pylist(day_rows, schema=SCHEMAS[kind]), tmp)
+        os.replace(tmp, path)
+        paths.append(path)
+    return paths
+
+
+def _drop_uncommitted(kind: str, out_dir: Path, last_id: int) -> int:
+    """Delete files a crashed run wrote past ``last_id``; the rerun may chunk those rows differently."""
+    dropped = 0
+    for path in (Path(out_dir) / kind).glob("date=*/part-*"):
+        if path.suffix == ".tmp" or int(path.stem.split("-")[1]) > last_id:
+            path.unlink()
+            dropped += 1
+    return dropped
+
+
+def export_table(db, kind: str, out_dir: Path, chunk_rows: int = None, settle_seconds: float = None) -> int:
+    """Append rows of ``kind`` settled since the last run; returns how many were written."""
+    chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+    settle_seconds = PARQUET_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+    marks = load_watermarks(out_dir)
+    mark = marks.get(kind, {"last_id": 0, "rows": 0})
+    _drop_uncommitted(kind, out_dir, mark["last_id"])
+    bound = _export_bound(db, kind, mark["last_id"], settle_seconds)
+    written = 0
+    for rows in export.iter_chunks(db, _query(kind, mark["last_id"], bound), chunk_rows):
+        _write_partitions(kind, rows, out_dir)
+        mark = {"last_id": rows[-1]["id"], "rows": mark["rows"] + len(rows)}
+        marks[kind] = mark
+        save_watermarks(out_dir, marks)
+        written += len(rows)
+    if mark["last_id"] < bound - 1:
+        # Everything below the bound is final, including skipped "failed" meals
+        marks[kind] = {"last_id": bound - 1, "rows": mark["rows"]}
+        save_watermarks(out_dir, marks)
+    return written
+
+
+def run_export(out_dir: Path, tables=("meals", "symptoms"), chunk_rows: int = None) -> dict:
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    role = "replica" if database.REPLICA_DATABASE_URL else "primary"
+    db = database.session_factory(role)()
+    try:
+        return {kind: export_table(db, kind, out_dir, chunk_rows) for kind in tables}
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, type=Path, help="Output directory (local path or mounted bucket)")
+    parser.add_argument("--tables", nargs="+", default=["meals", "symptoms"], choices=sorted(SCHEMAS))
+    parser.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS)
+    parser.add_argument("--every", type=float, default=0, help="Repeat every N seconds instead of exiting")
+    args = parser.parse_args(argv)
+
+    while True:
+        start = time.perf_counter()
+        counts = run_export(args.out, args.tables, args.chunk_rows)
+        summary = ", ".join(f"{kind}: {n}" for kind, n in counts.items())
+        print(f"📦 Exported new rows ({summary}) in {time.perf_counter() - start:.1f}s")
+        if not args.every:
+            return counts
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
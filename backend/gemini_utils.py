@@ -1,40 +1,76 @@
 import os
-import vertexai
-from vertexai.generative_models import GenerativeModel
+import httpx
 import logging
 
 logger = logging.getLogger(__name__)
 
 PROJECT_ID = os.getenv("GCP_PROJECT")
 LOCATION = os.getenv("GCP_LOCATION", "us-central1")
+GEMINI_MODEL = "gemini-2.5-flash-lite"
+# When set, call the generateContent REST API at this base URL instead of going
+# through the SDK (used to point the backend at a local stand-in for load tests)
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE")
+GENERATION_CONFIG = {
+    "max_output_tokens": 256,
+    "temperature": 0.4,
+    "top_p": 1.0,
+    "top_k": 32,
+}
+# Returned in place of triggers when the lookup fails
+TRIGGER_ERROR = "Error analyzing triggers"
+
+_model = None
 
-_INITIALIZED = False
 
 def _init_vertex():
+    """Initialize Vertex AI and build the Gemini model once; the SDK takes about a second to import."""
+    global _model
+    if _model is not None:
+        return _model
     print("Initializing Vertex AI...")
-    global _INITIALIZED
-    if not _INITIALIZED:
-        if not PROJECT_ID:
-            logger.warning("GCP_PROJECT not set, skipping Vertex AI init. Gemini features will fail if not authenticated via ADC with project quota.")
-            print("GCP_PROJECT not set, skipping Vertex AI init. Gemini features will fail if not authenticated via ADC with project quota.")
-        try:
-            vertexai.init(project=PROJECT_ID, location=LOCATION)
-            _INITIALIZED = True
-        except Exception as e:
-            logger.error(f"Failed to initialize Vertex AI: {e}")
-            print(f"Failed to initialize Vertex AI: {e}")
+    import vertexai
+    from vertexai.generative_models import GenerativeModel
+
+    if not PROJECT_ID:
+        logger.warning("GCP_PROJECT not set, skipping Vertex AI init. Gemini features will fail if not authenticated via ADC with project quota.")
+        print("GCP_PROJECT not set, skipping Vertex AI init. Gemini features will fail if not authenticated via ADC with project quota.")
+    try:
+        vertexai.init(project=PROJECT_ID, location=LOCATION)
+    except Exception as e:
+        logger.error(f"Failed to initialize Vertex AI: {e}")
+        print(f"Failed to initialize Vertex AI: {e}")
+    _model = GenerativeModel(GEMINI_MODEL)
+    print("Gemini model initialized.")
+    return _model
+
+def _generate_rest(prompt: str) -> str:
+    url = (
+        f"{GEMINI_API_BASE}/v1/projects/{PROJECT_ID or 'local'}/locations/{LOCATION}"
+        f"/publishers/google/models/{GEMINI_MODEL}:generateContent"
+    )
+    response = httpx.post(
+        url,
+        json={
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "maxOutputTokens": GENERATION_CONFIG["max_output_tokens"],
+                "temperature": GENERATION_CONFIG["temperature"],
+                "topP": GENERATION_CONFIG["top_p"],
+                "topK": GENERATION_CONFIG["top_k"],
+            },
+        },
+        timeout=30.0,
+    )
+    response.raise_for_status()
+    candidates = response.json().get("candidates") or [{}]
+    parts = candidates[0].get("content", {}).get("parts") or [{}]
+    return parts[0].get("text", "")
 
 def get_food_triggers(food_label: str, image_bytes: bytes) -> str:
     """
     Analyzes the food item and image using Gemini to identify potential dietary triggers.
     """
-    _init_vertex()
-
-    try:
-        model = GenerativeModel("gemini-2.5-flash-lite")
-        print("Gemini model initialized.")
-
-        prompt = f"""
+    prompt = f"""
         You are a nutritionist assistant. The user is about to eat a meal identified as "{food_label}".
         
         List common dietary triggers associated with this food (e.g., Gluten, Lactose, Nuts, Shellfish, High Sugar, High Sodium, etc.).
@@ -44,14 +80,18 @@ def get_food_triggers(food_label: str, image_bytes: bytes) -> str:
         Example Output: Gluten, Lactose
         """
 
-        responses = model.generate_content(
+    if GEMINI_API_BASE:
+        try:
+            text = _generate_rest(prompt)
+            return text.strip() if text else "None"
+        except Exception as e:
+            logger.error(f"Gemini analysis failed: {e}")
+            return TRIGGER_ERROR
+
+    try:
+        responses = _init_vertex().generate_content(
             [prompt],
-            generation_config={
-                "max_output_tokens": 256,
-                "temperature": 0.4,
-                "top_p": 1.0,
-                "top_k": 32,
-            },
+            generation_config=GENERATION_CONFIG,
             stream=False,
         )
         print("Gemini model generated response.")
@@ -64,4 +104,4 @@ def get_food_triggers(food_label: str, image_bytes: bytes) -> str:
 
     except Exception as e:
         logger.error(f"Gemini analysis failed: {e}")
-        return "Error analyzing triggers"
+        return TRIGGER_ERROR
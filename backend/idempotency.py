@@ -0,0 +1,226 @@
+# nutrisnap-backend/idempotency.py
+"""
+Idempotency-Key support for the upload endpoints.
+
+Mobile clients retry uploads when a response is lost. Without a key each
+retry runs inference and Gemini again and inserts another Meal. With an
+``Idempotency-Key`` header, the first request claims the key by inserting an
+``in_progress`` row in ``idempotency_keys``; the unique constraint decides
+the winner across workers. Its status code and JSON body are written to the
+row in the same transaction that commits the meal (``Claim.stage``), so a
+crash can't leave a saved meal behind a key that still looks unfinished.
+Then:
+
+- a retry of a completed request gets the stored response replayed, with an
+  ``Idempotent-Replayed: true`` header;
+- a duplicate arriving while the first is still running polls the row for up
+  to IDEMPOTENCY_WAIT_SECONDS and then replays it, or answers 409;
+- a key reused for a different upload (different body hash) answers 422.
+
+A request that fails releases its key, so the client's retry runs again.
+Completed keys expire after IDEMPOTENCY_TTL_SECONDS. A claim left
+``in_progress`` for IDEMPOTENCY_LOCK_SECONDS (the worker died mid-request)
+is taken over by the next request. Expired rows are purged at most once
+every IDEMPOTENCY_PURGE_SECONDS per process.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+import database
+import metrics
+import models
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "300"))
+IDEMPOTENCY_PURGE_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_SECONDS", "300"))
+IDEMPOTENCY_POLL_SECONDS = 0.05
+IDEMPOTENCY_MAX_KEY_LENGTH = 255
+
+IDEMPOTENCY_REQUESTS = metrics.counter(
+    "nutrisnap_idempotency_requests", "Requests carrying an Idempotency-Key by outcome", ["outcome"]
+)
+
+_last_purge = 0.0
+
+
+class KeyConflict(Exception):
+    """The key can't be used for this request; ``status_code`` is what the API should answer."""
+
+    def __init__(self, message: str, status_code: int = 409):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def fingerprint(*parts) -> str:
+    """SHA-256 over the parts that make two requests "the same" (bytes or str)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode()
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _purge_expired(db, now: datetime):
+    db.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.expires_at < now))
+    db.commit()
+
+
+def _select_key(user_id: int, path: str, key: str):
+    return select(models.IdempotencyKey).where(
+        models.IdempotencyKey.user_id == user_id,
+        models.IdempotencyKey.path == path,
+        models.IdempotencyKey.key == key,
+    )
+
+
+def _claim(db, user_id: int, path: str, key: str, request_hash: str):
+    """Insert an in_progress row for the key; returns None when claimed, else the existing row."""
+    now = datetime.utcnow()
+    # populate_existing: while polling, the session must see the other request's commit
+    row = db.execute(
+        _select_key(user_id, path, key).execution_options(populate_existing=True)
+    ).scalar_one_or_none()
+    if row is not None:
+        if row.expires_at > now:
+            return row
+        # Expired result, or an in-progress claim whose worker is gone: start over
+        db.delete(row)
+        db.commit()
+    db.add(models.IdempotencyKey(
+        user_id=user_id, path=path, key=key, request_hash=request_hash,
+        expires_at=now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+    ))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another request claimed it between our read and insert
+        db.rollback()
+        return _claim(db, user_id, path, key, request_hash)
+    return None
+
+
+def _stage_complete(db, user_id: int, path: str, key: str, status_code: int, body):
+    # No commit: this rides on the caller's transaction
+    row = db.execute(_select_key(user_id, path, key)).scalar_one()
+    row.status = "complete"
+    row.response_status = status_code
+    row.response_body = json.dumps(body)
+    row.expires_at = datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+
+
+def _release(db, user_id: int, path: str, key: str):
+    db.rollback()
+    db.execute(delete(models.IdempotencyKey).where(
+        models.IdempotencyKey.user_id == user_id,
+        models.IdempotencyKey.path == path,
+        models.IdempotencyKey.key == key,
+        models.IdempotencyKey.status == "in_progress",
+    ))
+    db.commit()
+
+
+def replay_response(row) -> JSONResponse:
+    return JSONResponse(json.loads(row.response_body), status_code=row.response_status,
+                        headers={"Idempotent-Replayed": "true"})
+
+
+class Claim:
+    """Handle yielded by ``claim()``: return ``replay`` if set, otherwise ``stage()`` the response.
+
+    ``stage`` and ``unstage`` take the session of the write they belong to and
+    don't commit; the caller's commit makes the key's outcome durable together
+    with the rows it describes.
+    """
+
+    def __init__(self, user_id: int = None, path: str = None, key: str = None):
+        self.user_id = user_id
+        self.path = path
+        self.key = key
+        self.replay = None
+        self.staged = False
+
+    def stage(self, db, status_code: int, body):
+        """Mark the key complete with this response, in ``db``'s open transaction."""
+        if self.key:
+            _stage_complete(db, self.user_id, self.path, self.key, status_code, body)
+        self.staged = True
+
+    def unstage(self, db):
+        """Drop the key in ``db``'s open transaction, so a retry runs the request again."""
+        if self.key:
+            db.execute(delete(models.IdempotencyKey).where(
+                models.IdempotencyKey.user_id == self.user_id,
+                models.IdempotencyKey.path == self.path,
+                models.IdempotencyKey.key == self.key,
+            ))
+        self.staged = False
+
+
+async def _acquire(db, user_id: int, path: str, key: str, request_hash: str):
+    """None once the key is ours, or the completed row to replay."""
+    global _last_purge
+    if time.monotonic() - _last_purge > IDEMPOTENCY_PURGE_SECONDS:
+        _last_purge = time.monotonic()
+        await database.run(db, _purge_expired, datetime.utcnow())
+
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    delay = IDEMPOTENCY_POLL_SECONDS
+    waited = False
+    while True:
+        row = await database.run(db, _claim, user_id, path, key, request_hash)
+        if row is None:
+            IDEMPOTENCY_REQUESTS.inc(outcome="waited_then_claimed" if waited else "claimed")
+            return None
+        if row.request_hash != request_hash:
+            IDEMPOTENCY_REQUESTS.inc(outcome="mismatch")
+            raise KeyConflict("Idempotency-Key was already used for a different request.", 422)
+        if row.status == "complete":
+            IDEMPOTENCY_REQUESTS.inc(outcome="replayed")
+            return row
+        if time.monotonic() >= deadline:
+            IDEMPOTENCY_REQUESTS.inc(outcome="in_progress")
+            raise KeyConflict("A request with this Idempotency-Key is still being processed, retry later.")
+        waited = True
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 1.0)
+
+
+@asynccontextmanager
+async def claim(db, path: str, key: str, request_hash: str, user_id: int = None):
+    """``async with claim(...) as c:`` guards one upload; a no-op when ``key`` is None.
+
+    Raises KeyConflict before the block runs. An in-progress key is released
+    for the next retry if the block raises or returns without a committed
+    ``c.stage()``.
+    """
+    if not key:
+        yield Claim()
+        return
+    if len(key) > IDEMPOTENCY_MAX_KEY_LENGTH:
+        raise KeyConflict(f"Idempotency-Key must be at most {IDEMPOTENCY_MAX_KEY_LENGTH} characters.", 400)
+    user_id = database.current_user_id() if user_id is None else user_id
+    handle = Claim(user_id, path, key)
+    row = await _acquire(db, user_id, path, key, request_hash)
+    if row is not None:
+        handle.replay = replay_response(row)
+        yield handle
+        return
+    try:
+        yield handle
+    except BaseException:
+        # Only removes a key still in_progress: one committed alongside its meal stays
+        await database.run(db, _release, user_id, path, key)
+        raise
+    if not handle.staged:
+        await database.run(db, _release, user_id, path, key)
@@ -5,16 +5,23 @@ import shutil
 from pathlib import Path
 from typing import Dict, List
 
-import gcsfs
 import torch
 from PIL import Image
-from transformers import AutoImageProcessor, AutoModelForImageClassification
+
+try:
+    import metrics
+    import wire
+except ImportError:  # imported as backend.inference by the Vertex container
+    from backend import metrics
+    from backend import wire
 
 
 MODEL_GCS_URI = os.getenv("MODEL_GCS_URI")
 MODEL_CACHE_DIR = Path(os.getenv("MODEL_CACHE_DIR", "/tmp/nutrisnap-model"))
 MODEL_BASE_PROCESSOR = os.getenv("MODEL_BASE_PROCESSOR")
 MODEL_DEFAULT_MODEL_TYPE = os.getenv("MODEL_DEFAULT_MODEL_TYPE", "vit")
+# JPEGs larger than this are decoded at 1/2-1/8 scale; the processor resizes to 224 anyway (0 = full size)
+INFERENCE_DECODE_SIDE = int(os.getenv("INFERENCE_DECODE_SIDE", "448"))
 _BUNDLE = None
 
 
@@ -45,6 +52,8 @@ def _download_model() -> Path:
         shutil.rmtree(target)
         target.mkdir(parents=True, exist_ok=True)
 
+    import gcsfs
+
     remote = _gcs_path()
     fs = gcsfs.GCSFileSystem()
     if not fs.exists(remote):
@@ -67,6 +76,9 @@ def _inject_model_type(model_dir: Path) -> None:
 
 
 def _load_bundle():
+    # transformers' Auto classes pull in most of the library; only pay for it when loading
+    from transformers import AutoImageProcessor, AutoModelForImageClassification
+
     model_dir = _download_model()
     _inject_model_type(model_dir)
 
@@ -99,30 +111,74 @@ def get_bundle():
     return _BUNDLE
 
 
+def decode_image(image_bytes) -> Image.Image:
+    """RGB image from encoded bytes, or from wire.Pixels the sender already decoded and resized."""
+    if isinstance(image_bytes, wire.Pixels):
+        mode = "RGB" if image_bytes.channels == 3 else "L"
+        return Image.frombytes(mode, (image_bytes.width, image_bytes.height), image_bytes.data).convert("RGB")
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        if INFERENCE_DECODE_SIDE:
+            img.draft("RGB", (INFERENCE_DECODE_SIDE, INFERENCE_DECODE_SIDE))
+        return img.convert("RGB")
+
+
+def preprocess(bundle, images) -> Dict[str, "torch.Tensor"]:
+    inputs = bundle["processor"](images=images, return_tensors="pt")
+    return {k: v.to(bundle["device"]) for k, v in inputs.items()}
+
+
+def forward(bundle, inputs) -> "torch.Tensor":
+    """Class probabilities, shape (batch, num_labels)."""
+    with torch.no_grad():
+        logits = bundle["model"](**inputs).logits
+        return torch.softmax(logits, dim=-1)
+
+
+def top_k(probs, id2label, k: int = 5) -> List[Dict[str, List[Dict[str, float]]]]:
+    values, indices = torch.topk(probs, k=min(k, probs.shape[-1]), dim=-1)
+    return [
+        _format_predictions(scores, idx, id2label)
+        for scores, idx in zip(values.tolist(), indices.tolist())
+    ]
+
+
 def predict(image_bytes: bytes) -> Dict[str, List[Dict[str, float]]]:
     bundle = get_bundle()
-    processor = bundle["processor"]
     model = bundle["model"]
-    device = bundle["device"]
     id2label = bundle["id2label"]
 
-    with Image.open(io.BytesIO(image_bytes)) as img:
-        image = img.convert("RGB")
-
-    inputs = processor(images=image, return_tensors="pt")
-    inputs = {k: v.to(device) for k, v in inputs.items()}
+    with metrics.stage("inference.decode"):
+        image = decode_image(image_bytes)
+    with metrics.stage("inference.preprocess"):
+        inputs = preprocess(bundle, image)
 
-    with torch.no_grad():
+    with metrics.stage("inference.forward"), torch.no_grad():
         logits = model(**inputs).logits
         probs = torch.softmax(logits, dim=-1).squeeze(0)
 
-    top_k = min(5, probs.shape[0])
-    values, indices = torch.topk(probs, k=top_k)
+    with metrics.stage("inference.topk"):
+        k = min(5, probs.shape[0])
+        values, indices = torch.topk(probs, k=k)
+        return _format_predictions(values.tolist(), indices.tolist(), id2label)
+
 
+def _format_predictions(scores, indices, id2label) -> Dict[str, List[Dict[str, float]]]:
     predictions = []
-    for score, idx in zip(values.tolist(), indices.tolist()):
+    for score, idx in zip(scores, indices):
         label = id2label.get(int(idx), str(idx))
         predictions.append({"label": label, "score": float(score)})
 
     return {"top1": predictions[:1], "topk": predictions}
 
+
+def predict_batch(images: List[bytes]) -> List[Dict[str, List[Dict[str, float]]]]:
+    """Classify several images with a single forward pass."""
+    bundle = get_bundle()
+    with metrics.stage("inference.decode"):
+        decoded = [decode_image(b) for b in images]
+    with metrics.stage("inference.preprocess"):
+        inputs = preprocess(bundle, decoded)
+    with metrics.stage("inference.forward"):
+        probs = forward(bundle, inputs)
+    with metrics.stage("inference.topk"):
+        return top_k(probs, bundle["id2label"])
@@ -0,0 +1,189 @@
+# nutrisnap-backend/inference_router.py
+"""
+Failover, circuit breaking and hedging across inference backends.
+
+The router tries backends in order. Each backend has a circuit breaker: after
+``failure_threshold`` consecutive failures it opens and the backend is skipped
+for ``reset_seconds``, then a single probe request decides whether it closes
+again. With hedging on, a backend that hasn't answered within its recent p95
+latency (never less than ``hedge_min_ms``) gets a second request sent to the
+next backend in line; the first success wins and the other is cancelled.
+Backends in ``no_hedge`` (local inference, which runs in a thread and can't be
+cancelled) are only used as failover, never as hedges.
+
+The router knows nothing about images: ``call(order, attempt)`` awaits
+``attempt(name)`` for the chosen backends and returns ``(name, result)``.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+
+import metrics
+
+ROUTER_SKIPPED = metrics.counter("nutrisnap_inference_skipped", "Backends skipped because their circuit was open", ["backend"])
+ROUTER_HEDGES = metrics.counter("nutrisnap_inference_hedges", "Hedged requests sent, by target backend", ["backend"])
+ROUTER_FAILOVERS = metrics.counter("nutrisnap_inference_failovers", "Requests answered by a later backend after a failure", ["backend"])
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class AllBackendsFailed(Exception):
+    def __init__(self, errors):
+        self.errors = errors  # [(backend, exception)]
+        super().__init__("; ".join(str(exc) for _, exc in errors) or "No inference backend available")
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Whether a request may go to this backend now (claims the probe when half-open)."""
+        if self.state == OPEN and self.clock() - self.opened_at >= self.reset_seconds:
+            self.state = HALF_OPEN
+            self._probing = False
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = self.clock()
+            self._probing = False
+
+    def record_cancelled(self):
+        # A hedge lost the race: no verdict on the backend, but release a half-open probe
+        self._probing = False
+
+
+class LatencyWindow:
+    """Sliding window of recent successful latencies (seconds)."""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def quantile(self, q: float) -> float:
+        ordered = sorted(self._samples)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class Router:
+    def __init__(self, hedge: bool = False, hedge_min_ms: float = 50.0, hedge_quantile: float = 0.95,
+                 hedge_min_samples: int = 20, failure_threshold: int = 5, reset_seconds: float = 30.0,
+                 no_hedge=("local",), clock=time.monotonic):
+        self.hedge = hedge
+        self.hedge_min_ms = hedge_min_ms
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.no_hedge = set(no_hedge)
+        self.clock = clock
+        self.breakers = {}
+        self.latency = {}
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(self.failure_threshold, self.reset_seconds, self.clock)
+        return self.breakers[name]
+
+    def window(self, name: str) -> LatencyWindow:
+        return self.latency.setdefault(name, LatencyWindow())
+
+    def reset(self):
+        self.breakers.clear()
+        self.latency.clear()
+
+    def hedge_delay(self, name: str) -> float:
+        """Seconds to wait on ``name`` before hedging: its recent p95, floored at hedge_min_ms.
+
+        Until ``hedge_min_samples`` latencies are known the slowest one seen is used instead.
+        """
+        floor = self.hedge_min_ms / 1000
+        window = self.window(name)
+        q = self.hedge_quantile if len(window) >= self.hedge_min_samples else 1.0
+        return max(floor, window.quantile(q))
+
+    def states(self) -> dict:
+        return {name: breaker.state for name, breaker in self.breakers.items()}
+
+    async def _timed(self, name, attempt):
+        start = time.perf_counter()
+        result = await attempt(name)
+        self.window(name).add(time.perf_counter() - start)
+        return result
+
+    async def call(self, order, attempt):
+        """First successful ``attempt(name)`` over ``order``; raises AllBackendsFailed."""
+        remaining = list(order)
+        errors = []
+        running = {}  # task -> backend name
+
+        def launch_next(hedging: bool) -> bool:
+            while remaining:
+                name = remaining[0]
+                if hedging and name in self.no_hedge:
+                    return False
+                remaining.pop(0)
+                if not self.breaker(name).allow():
+                    ROUTER_SKIPPED.inc(backend=name)
+                    errors.append((name, RuntimeError(f"{name} circuit open")))
+                    continue
+                if hedging:
+                    ROUTER_HEDGES.inc(backend=name)
+                running[asyncio.ensure_future(self._timed(name, attempt))] = name
+                return True
+            return False
+
+        launch_next(hedging=False)
+        try:
+            while running:
+                timeout = None
+                if self.hedge and remaining and remaining[0] not in self.no_hedge:
+                    # Hedge timer runs against the most recently launched request
+                    timeout = self.hedge_delay(list(running.values())[-1])
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch_next(hedging=True)
+                    continue
+                for task in done:
+                    name = running.pop(task)
+                    if task.exception() is None:
+                        self.breaker(name).record_success()
+                        if errors:
+                            ROUTER_FAILOVERS.inc(backend=name)
+                        return name, task.result()
+                    self.breaker(name).record_failure()
+                    errors.append((name, task.exception()))
+                if not running:
+                    launch_next(hedging=False)
+            raise AllBackendsFailed(errors)
+        finally:
+            for task, name in running.items():
+                task.cancel()
+                self.breaker(name).record_cancelled()
@@ -1,42 +1,74 @@
 # nutrisnap-backend/main.py
-from fastapi import FastAPI, Depends, UploadFile, File, HTTPException
+from fastapi import FastAPI, Body, Depends, UploadFile, File, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
+from pydantic import ValidationError
 import models
 import schemas
 import database
-from typing import List
-from inference import predict as run_inference
+import cache
+import events
+import export
+import admission
+import idempotency
+import analysis
+import memstats
+import metrics
+import profiling
+import tracing
+import uploads
+from typing import List, Optional
+import asyncio
+import math
 import os
-import httpx
-import gemini_utils
+import pipeline
 import logging
-from datetime import timedelta
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-MODEL_SERVICE_URL = os.getenv("MODEL_SERVICE_URL")
+# Responses smaller than this are sent uncompressed
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1024"))
+# Upper bound on items in one /log/*/batch request
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
 
-# Simple nutrition lookup for prototype
-NUTRITION_LOOKUP = {
-    "ramen": {"protein": 10.0, "carbs": 40.0, "fat": 15.0},
-    "grilled salmon": {"protein": 30.0, "carbs": 0.0, "fat": 15.0},
-    "caesar salad": {"protein": 7.0, "carbs": 10.0, "fat": 12.0},
-    "pizza": {"protein": 12.0, "carbs": 30.0, "fat": 10.0},
-    "burger": {"protein": 25.0, "carbs": 35.0, "fat": 20.0},
-    "sushi": {"protein": 15.0, "carbs": 45.0, "fat": 5.0},
-    "pasta": {"protein": 12.0, "carbs": 60.0, "fat": 8.0},
-    "steak": {"protein": 40.0, "carbs": 0.0, "fat": 25.0},
-    "chicken breast": {"protein": 30.0, "carbs": 0.0, "fat": 3.0},
-    "rice": {"protein": 4.0, "carbs": 45.0, "fat": 0.5},
-}
 
+app = FastAPI()
 
-# Create tables on startup (skip during tests - conftest.py handles this)
-if os.getenv("TESTING") != "1":
-    models.Base.metadata.create_all(bind=database.engine)
+@app.on_event("startup")
+async def _startup():
+    """Connect with bounded backoff and create tables off the import path, then start meal workers."""
+    # Skip during tests - conftest.py handles this
+    if not database.TESTING:
+        engine = await run_in_threadpool(database.get_engine)
+        await run_in_threadpool(models.Base.metadata.create_all, bind=engine)
+        await run_in_threadpool(models.upgrade_schema, engine)
+        roles = ["primary", "replica"] if database.REPLICA_DATABASE_URL else ["primary"]
+        for role in roles:
+            await run_in_threadpool(database.get_engine, role)
+            if database.USE_ASYNC:
+                database.get_async_engine(role)
+    if pipeline.INFERENCE_LOCAL_FALLBACK:
+        # In the background: startup shouldn't wait on the model download
+        asyncio.get_running_loop().run_in_executor(None, pipeline.warm_local_fallback)
+    await pipeline.start_relay()
+    if pipeline.MEAL_WORKERS > 0:
+        # Jobs of an in-process queue died with the last process: requeue or fail their meals
+        try:
+            await pipeline.recover_pending()
+        except Exception:
+            logger.exception("Pending meal recovery failed")
+        pipeline.start_workers()
+    profiling.install_signal_handler()
 
-app = FastAPI()
+@app.on_event("shutdown")
+async def _shutdown():
+    await pipeline.stop_workers()
+    await pipeline.close_http()
 
 # CORS: Allow Nuxt (port 3000) to talk to FastAPI (port 8000)
 app.add_middleware(
@@ -46,27 +78,122 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES)
+# Middleware added later wraps what was added before. Admission runs before the body
+# limit, so shed uploads are refused without reading any of the body.
+app.add_middleware(uploads.BodyLimitMiddleware)
+app.add_middleware(admission.AdmissionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(memstats.MemoryMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
+if profiling.PROFILE_EVERY_N > 0:
+    app.add_middleware(profiling.ProfilingMiddleware)
 
 @app.get("/")
 def read_root():
     return {"message": "NutriSnap Backend Running 🚀"}
 
-@app.get("/dashboard", response_model=List[schemas.MealOut])
-def get_dashboard(db: Session = Depends(database.get_db)):
-    # Hardcoded user_id 1 for prototype
-    meals = db.query(models.Meal).filter(models.Meal.user_id == 1).order_by(models.Meal.created_at.desc()).all()
-    return meals
+@app.get("/health/db")
+def database_health():
+    # Pool occupancy and checkout waits, to tune DB_POOL_SIZE / DB_MAX_OVERFLOW under load
+    return {"pools": database.pool_stats()}
 
-@app.get("/dashboard/symptoms", response_model=List[schemas.SymptomOut])
-def get_symptoms(db: Session = Depends(database.get_db)):
-    symptoms = db.query(models.Symptom).filter(models.Symptom.user_id == 1).order_by(models.Symptom.created_at.desc()).all()
-    return symptoms
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    # Prometheus text exposition: stage latency histograms, cache/fallback counters, queue depth
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
-@app.get("/dashboard/recent")
-def get_recent_activity(db: Session = Depends(database.get_db)):
+@app.get("/debug/memory", include_in_schema=False)
+def debug_memory(limit: int = 20, depth: Optional[int] = None, x_admin_token: Optional[str] = Header(None)):
+    # RSS, torch allocator stats, tracemalloc top modules (MEMORY_TRACEMALLOC=1) and per-route peaks
+    if not memstats.allowed(x_admin_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return memstats.report(limit, depth)
+
+@app.get("/admin/profile", include_in_schema=False)
+async def admin_profile(seconds: float = 10, interval_ms: float = profiling.PROFILE_INTERVAL_MS,
+                        x_admin_token: Optional[str] = Header(None)):
+    # Collapsed stacks of this worker over the next `seconds`, for flamegraph.pl / speedscope
+    if not profiling.allowed(x_admin_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+    collapsed = await run_in_threadpool(profiling.profile_for, seconds, interval_ms / 1000)
+    return Response(collapsed, media_type="text/plain")
+
+def _ensure_demo_user(db: Session):
+    user = db.query(models.User).filter(models.User.id == 1).first()
+    if not user:
+        user = models.User(email="demo@test.com", name="Demo")
+        db.add(user)
+        db.commit()
+    return user
+
+def _get_meal(db: Session, meal_id: int, user_id: int):
+    row = db.execute(
+        select(*MEAL_OUT_COLUMNS).where(models.Meal.id == meal_id, models.Meal.user_id == user_id)
+    ).mappings().first()
+    return dict(row) if row else None
+
+def _meal_out(meal) -> dict:
+    return schemas.MealOut.model_validate(meal).model_dump(mode="json")
+
+def _save(db: Session, row, before_commit=None):
+    db.add(row)
+    if before_commit is not None:
+        # Flushed first so the callback sees the row's id and defaults
+        db.flush()
+        before_commit(db, row)
+    db.commit()
+    db.refresh(row)
+    return row
+
+def _delete(db: Session, row, before_commit=None):
+    db.delete(row)
+    if before_commit is not None:
+        before_commit(db, row)
+    db.commit()
+
+# Columns serialized by the list endpoints. Selecting just these as mappings skips
+# ORM identity-map hydration and pydantic re-validation for long histories.
+MEAL_OUT_COLUMNS = (
+    models.Meal.id,
+    models.Meal.identified_foods,
+    models.Meal.protein,
+    models.Meal.carbs,
+    models.Meal.fat,
+    models.Meal.triggers,
+    models.Meal.status,
+    models.Meal.created_at,
+    models.Meal.user_id,
+)
+SYMPTOM_OUT_COLUMNS = (
+    models.Symptom.id,
+    models.Symptom.symptom_name,
+    models.Symptom.severity,
+    models.Symptom.notes,
+    models.Symptom.created_at,
+    models.Symptom.user_id,
+)
+# /dashboard/recent has always returned every column of the row
+RECENT_MEAL_COLUMNS = MEAL_OUT_COLUMNS + (models.Meal.image_url,)
+
+
+def _rows(db: Session, model, columns, user_id: int, limit=None):
+    # Newest first, as plain dicts ready for orjson
+    stmt = select(*columns).where(model.user_id == user_id).order_by(model.created_at.desc())
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return [dict(row) for row in db.execute(stmt).mappings()]
+
+def _list_meals(db: Session, user_id: int):
+    return _rows(db, models.Meal, MEAL_OUT_COLUMNS, user_id)
+
+def _list_symptoms(db: Session, user_id: int):
+    return _rows(db, models.Symptom, SYMPTOM_OUT_COLUMNS, user_id)
+
+def _recent_activity(db: Session, user_id: int):
     # Get recent meals and symptoms, combine and sort
-    meals = db.query(models.Meal).filter(models.Meal.user_id == 1).order_by(models.Meal.created_at.desc()).limit(5).all()
-    symptoms = db.query(models.Symptom).filter(models.Symptom.user_id == 1).order_by(models.Symptom.created_at.desc()).limit(5).all()
+    meals = _rows(db, models.Meal, RECENT_MEAL_COLUMNS, user_id, limit=5)
+    symptoms = _rows(db, models.Symptom, SYMPTOM_OUT_COLUMNS, user_id, limit=5)
     
     # Combine and sort by created_at
     activity = []
@@ -74,49 +201,40 @@ def get_recent_activity(db: Session = Depends(database.get_db)):
         activity.append({
             "type": "meal",
             "data": m,
-            "date": m.created_at
+            "date": m["created_at"]
         })
     for s in symptoms:
         activity.append({
             "type": "symptom",
             "data": s,
-            "date": s.created_at
+            "date": s["created_at"]
         })
     
     # Sort descending
     activity.sort(key=lambda x: x["date"], reverse=True)
     return activity[:5] # Return top 5 mixed
 
-@app.get("/dashboard/triggers")
-def get_triggers(db: Session = Depends(database.get_db)):
-    user_id = 1 # Hardcoded for prototype
-    
-    # 1. Get all symptoms
-    symptoms = db.query(models.Symptom).filter(models.Symptom.user_id == user_id).all()
+def _triggers(db: Session, user_id: int):
+    # Two queries for the whole history, windows counted in NumPy (previously a query per symptom)
+    with metrics.stage("triggers.query"):
+        symptom_times = db.execute(
+            select(models.Symptom.created_at).where(models.Symptom.user_id == user_id)
+        ).scalars().all()
     
     # Require at least a few symptoms to make a guess
-    if len(symptoms) < 3:
+    if len(symptom_times) < 3:
         return []
-        
-    trigger_counts = {}
-    
-    for symptom in symptoms:
-        # Find meals eaten within 6 hours BEFORE the symptom
-        window_start = symptom.created_at - timedelta(hours=6)
-        
-        meals = db.query(models.Meal).filter(
-            models.Meal.user_id == user_id,
-            models.Meal.created_at >= window_start,
-            models.Meal.created_at <= symptom.created_at
+
+    with metrics.stage("triggers.query"):
+        meals = db.execute(
+            select(models.Meal.created_at, models.Meal.triggers).where(models.Meal.user_id == user_id)
         ).all()
-        
-        for meal in meals:
-            if meal.triggers and meal.triggers != "None":
-                # Split by comma and clean up
-                parts = [t.strip() for t in meal.triggers.split(",")]
-                for part in parts:
-                    if part and part.lower() != "none":
-                        trigger_counts[part] = trigger_counts.get(part, 0) + 1
+
+    # Meals eaten within 6 hours BEFORE each symptom
+    with metrics.stage("triggers.count"):
+        trigger_counts = analysis.window_trigger_counts(
+            [m.created_at for m in meals], [m.triggers for m in meals], symptom_times, window_hours=6
+        )
                         
     # Sort by frequency
     sorted_triggers = sorted(trigger_counts.items(), key=lambda x: x[1], reverse=True)
@@ -124,166 +242,236 @@ def get_triggers(db: Session = Depends(database.get_db)):
     # Return top 3 most frequent triggers
     return [t[0] for t in sorted_triggers[:3]]
 
+def _save_all(db: Session, model, rows, before_commit=None):
+    # One transaction and batched multi-row INSERT ... RETURNING, ids in input order
+    _ensure_demo_user(db)
+    if db.get_bind().dialect.name == "sqlite":
+        # SQLite can't batch ordered RETURNING, but it hands out rowids in VALUES order
+        ids = sorted(db.execute(insert(model).returning(model.id), rows).scalars())
+    else:
+        stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+        ids = list(db.execute(stmt, rows).scalars())
+    if before_commit is not None:
+        before_commit(db, ids)
+    db.commit()
+    return ids
+
+def _batch_result(results) -> dict:
+    created = sum(1 for r in results if r["ok"])
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+def _after_write(user_id: int):
+    # Keep the writer's reads on the primary and drop their cached dashboard
+    database.record_write(user_id)
+    cache.invalidate_user(user_id)
+
+# Dashboard reads are cached per user and carry an ETag that changes on every write
+@app.get("/dashboard", response_model=List[schemas.MealOut])
+async def get_dashboard(request: Request, db: Session = Depends(database.get_read_db)):
+    # Hardcoded user_id 1 for prototype
+    return await cache.cached_json(request, 1, lambda: database.run(db, _list_meals, 1),
+                                   cacheable=not database.is_replica(db))
+
+@app.get("/dashboard/symptoms", response_model=List[schemas.SymptomOut])
+async def get_symptoms(request: Request, db: Session = Depends(database.get_read_db)):
+    return await cache.cached_json(request, 1, lambda: database.run(db, _list_symptoms, 1),
+                                   cacheable=not database.is_replica(db))
+
+@app.get("/dashboard/recent")
+async def get_recent_activity(request: Request, db: Session = Depends(database.get_read_db)):
+    return await cache.cached_json(request, 1, lambda: database.run(db, _recent_activity, 1),
+                                   cacheable=not database.is_replica(db))
+
+@app.get("/dashboard/triggers")
+async def get_triggers(request: Request, db: Session = Depends(database.get_read_db)):
+    user_id = 1 # Hardcoded for prototype
+    return await cache.cached_json(request, user_id, lambda: database.run(db, _triggers, user_id),
+                                   cacheable=not database.is_replica(db))
+
+@app.get("/dashboard/associations", response_model=List[schemas.TriggerAssociation])
+async def get_associations(request: Request, lags: Optional[str] = None, min_meals: int = analysis.ASSOCIATION_MIN_MEALS,
+                           db: Session = Depends(database.get_read_db)):
+    """Lift/odds ratio of each (trigger, symptom) pair at several lags, e.g. ?lags=2,6,24"""
+    try:
+        lag_hours = tuple(float(h) for h in lags.split(",")) if lags else analysis.ASSOCIATION_LAGS_HOURS
+    except ValueError:
+        raise HTTPException(status_code=400, detail="lags must be comma-separated hours, e.g. 2,6,24.")
+    # float() accepts "nan" and "inf", which would break the window arithmetic
+    if not lag_hours or not all(math.isfinite(h) and 0 < h <= analysis.ASSOCIATION_MAX_LAG_HOURS for h in lag_hours):
+        raise HTTPException(status_code=400,
+                            detail=f"lags must be positive hours up to {analysis.ASSOCIATION_MAX_LAG_HOURS:g}.")
+    if min_meals < 1:
+        raise HTTPException(status_code=400, detail="min_meals must be at least 1.")
+    return await cache.cached_json(
+        request, 1, lambda: database.run(db, analysis.user_associations, 1, lag_hours, min_meals),
+        cacheable=not database.is_replica(db),
+    )
+
+@app.get("/export")
+async def export_history(
+    format: str = "ndjson",
+    kind: str = "all",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(database.get_read_db),
+):
+    """Stream the user's history, oldest first, as NDJSON or CSV (one table per CSV)."""
+    if format not in export.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'.")
+    if kind not in ("all", *export.EXPORT_MODELS):
+        raise HTTPException(status_code=400, detail="kind must be 'all', 'meals' or 'symptoms'.")
+    if kind == "all" and format == "csv":
+        raise HTTPException(status_code=400, detail="CSV exports one table at a time; pass kind=meals or kind=symptoms.")
+
+    kinds = list(export.EXPORT_MODELS) if kind == "all" else [kind]
+    filename = f"nutrisnap-{kind}.{format}"
+    return StreamingResponse(
+        export.stream_export(db, kinds, format, 1, start, end),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.exception_handler(idempotency.KeyConflict)
+async def _idempotency_conflict(request: Request, exc: idempotency.KeyConflict):
+    return JSONResponse({"detail": str(exc)}, status_code=exc.status_code)
+
 @app.post("/log/food", response_model=schemas.MealOut)
-async def log_food(file: UploadFile = File(...), db: Session = Depends(database.get_db)):
-    image_bytes = await file.read()
+async def log_food(
+    response: Response,
+    file: UploadFile = File(...),
+    mode: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(database.get_db),
+):
+    try:
+        with metrics.stage("log_food.read"):
+            image_bytes = await uploads.read_upload(file)
+        if image_bytes:
+            # Header only: oversized dimensions are refused before any decode
+            uploads.check_image(image_bytes)
+    except uploads.UploadRejected as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc)) from exc
     if not image_bytes:
         raise HTTPException(status_code=400, detail="Uploaded file is empty.")
 
-    # Resize image to reduce payload size (Vertex AI limit ~1.5MB)
-    from PIL import Image
-    import io
-    
-    try:
-        image = Image.open(io.BytesIO(image_bytes))
-        # Convert to RGB (handle PNG/RGBA)
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-            
-        # Resize to max 512x512 (ViT usually takes 224x224, but 512 is safe for quality)
-        image.thumbnail((512, 512))
-        
-        # Save to buffer as JPEG
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG", quality=85)
-        resized_bytes = buffered.getvalue()
-    except Exception as e:
-        logger.error(f"Image processing failed: {e}")
-        # Fallback to original if resize fails (unlikely)
-        resized_bytes = image_bytes
-
-    # Vertex AI Configuration
-    vertex_endpoint_id = os.getenv("VERTEX_ENDPOINT_ID")
-    vertex_project_id = os.getenv("VERTEX_PROJECT_ID")
-    vertex_region = os.getenv("VERTEX_REGION", "us-central1")
-
-    predictions = {}
-    if vertex_endpoint_id:
-        try:
-            # Get credentials
-            import google.auth
-            from google.auth.transport.requests import Request as GoogleRequest
-            
-            credentials, _ = google.auth.default()
-            credentials.refresh(GoogleRequest())
-            token = credentials.token
-            
-            # Encode image
-            import base64
-            encoded_image = base64.b64encode(resized_bytes).decode("utf-8")
-            
-            # Prepare request
-            # The endpoint_id might be the full resource name or just the ID. 
-            # If it's the full path, we can extract the ID or use it directly if the URL construction handles it.
-            # The user provided full path: projects/.../endpoints/...
-            # API expects: https://{REGION}-aiplatform.googleapis.com/v1/{ENDPOINT}:predict
-            
-            # If the user passed the full path, we can use it directly in the URL if we format correctly.
-            # But usually the library or API expects the resource name.
-            
-            # Check if VERTEX_ENDPOINT_ID is already a full path
-            if "projects/" in vertex_endpoint_id:
-                 url = f"https://{vertex_region}-aiplatform.googleapis.com/v1/{vertex_endpoint_id}:predict"
-            else:
-                 url = f"https://{vertex_region}-aiplatform.googleapis.com/v1/projects/{vertex_project_id}/locations/{vertex_region}/endpoints/{vertex_endpoint_id}:predict"
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    url,
-                    json={"instances": [encoded_image]}, # Custom model expects list of strings
-                    headers={
-                        "Authorization": f"Bearer {token}",
-                        "Content-Type": "application/json"
-                    },
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                # Adapt response. Vertex AI returns {"predictions": [...]}
-                # Our model returns {"top1": ..., "topk": ...} inside the prediction
-                if result.get("predictions"):
-                    # The prediction list usually contains the output of the model.
-                    # Assuming our model output structure is preserved.
-                    predictions = result["predictions"][0]
-
-        except Exception as exc:
-            logger.error(f"Vertex AI inference failed: {exc}")
-            raise HTTPException(status_code=500, detail=f"Vertex AI inference failed: {exc}")
-    elif MODEL_SERVICE_URL:
-         # Keep legacy internal call just in case, or remove it?
-         # User said "leave the model outside of kubernetes", so we can probably remove or deprecate.
-         # I'll leave it as a fallback if VERTEX_ENDPOINT_ID is not set.
-        try:
-            # Encode image to base64 for the Vertex/Model service
-            import base64
-            encoded_image = base64.b64encode(image_bytes).decode("utf-8")
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{MODEL_SERVICE_URL}/predict",
-                    json={"instances": [encoded_image]},
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                if result.get("predictions"):
-                    predictions = result["predictions"][0]
-        except Exception as exc:
-            logger.error(f"Model service failed: {exc}")
-            raise HTTPException(status_code=500, detail=f"Model service failed: {exc}")
-    else:
-        # Fallback to local inference
+    mode = mode or pipeline.MEAL_PIPELINE_MODE
+    # A retry with the same key replays the first response instead of logging the meal twice
+    async with idempotency.claim(db, "/log/food", idempotency_key, idempotency.fingerprint(mode, image_bytes)) as claim:
+        if claim.replay is not None:
+            return claim.replay
+        return await _log_food_image(response, image_bytes, mode, db, claim)
+
+async def _log_food_image(response: Response, image_bytes: bytes, mode: str, db, claim: idempotency.Claim):
+    if mode == "async":
+        # Queue the upload and return a pending meal; a worker fills it in
+        await database.run(db, _ensure_demo_user)
+        new_meal = models.Meal(
+            image_url="https://via.placeholder.com/150?text=Food",
+            identified_foods="Processing",
+            status="pending",
+            user_id=1
+        )
+        # The idempotency key completes in the same commit as the pending meal
+        new_meal = await database.run(db, _save, new_meal, lambda db, meal: claim.stage(db, 202, _meal_out(meal)))
         try:
-            predictions = run_inference(image_bytes)
-        except Exception as exc:
-            raise HTTPException(status_code=500, detail=f"Inference failed: {exc}") from exc
+            await pipeline.enqueue(new_meal.id, 1, image_bytes)
+        except pipeline.QueueFull:
+            # No worker will pick this upload up: drop the row and free the key in one commit, so
+            # the 503 leaves nothing behind and the client's retry runs again
+            await database.run(db, _delete, new_meal, lambda db, meal: claim.unstage(db))
+            # A dashboard read may have cached the pending row in the meantime
+            _after_write(1)
+            raise HTTPException(status_code=503, detail="Meal processing queue is full, retry later.")
+        _after_write(1)
+        events.publish(1, "meal", {"op": "created", **_meal_out(new_meal)})
+        response.status_code = 202
+        return new_meal
 
-    if not predictions.get("top1"):
-        raise HTTPException(status_code=500, detail="Model returned no predictions.")
+    try:
+        values = await pipeline.process_image(image_bytes)
+    except pipeline.PipelineError as exc:
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
 
-    top_label = predictions["top1"][0]["label"]
-    # Format label: replace underscores with spaces and title case
-    formatted_label = top_label.replace("_", " ").title()
-    identified_foods = formatted_label
-    
-    # Get triggers from Gemini
-    triggers = gemini_utils.get_food_triggers(formatted_label, resized_bytes)
-    
     # Ensure user exists
-    user = db.query(models.User).filter(models.User.id == 1).first()
-    if not user:
-        user = models.User(email="demo@test.com", name="Demo")
-        db.add(user)
-        db.commit()
-
-    # Lookup nutrition
-    nutrition = NUTRITION_LOOKUP.get(identified_foods.lower(), {"protein": 0.0, "carbs": 0.0, "fat": 0.0})
+    await database.run(db, _ensure_demo_user)
 
     new_meal = models.Meal(
         image_url="https://via.placeholder.com/150?text=Food", # Placeholder since we aren't storing the file
-        identified_foods=identified_foods,
-        protein=nutrition["protein"],
-        carbs=nutrition["carbs"],
-        fat=nutrition["fat"],
-        triggers=triggers,
-        user_id=1
+        user_id=1,
+        **values
     )
     
-    db.add(new_meal)
-    db.commit()
-    db.refresh(new_meal)
-    
+    with metrics.stage("log_food.db_commit"):
+        new_meal = await database.run(db, _save, new_meal, lambda db, meal: claim.stage(db, 200, _meal_out(meal)))
+    _after_write(1)
+    events.publish(1, "meal", {"op": "created", **_meal_out(new_meal)})
     return new_meal
 
+@app.post("/log/food/batch", response_model=schemas.BatchResult)
+async def log_food_batch(
+    files: List[UploadFile] = File(...),
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(database.get_db),
+):
+    """Log several meal photos at once; failures are reported per file."""
+    if len(files) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_ITEMS} files per batch.")
+
+    results = [None] * len(files)
+    indexes, images = [], []
+    for idx, file in enumerate(files):
+        try:
+            image_bytes = await uploads.read_upload(file)
+            if image_bytes:
+                uploads.check_image(image_bytes)
+        except uploads.UploadRejected as exc:
+            results[idx] = {"index": idx, "ok": False, "error": str(exc)}
+            continue
+        if not image_bytes:
+            results[idx] = {"index": idx, "ok": False, "error": "Uploaded file is empty."}
+            continue
+        indexes.append(idx)
+        images.append(image_bytes)
+
+    request_hash = idempotency.fingerprint(len(files), *indexes, *images)
+    async with idempotency.claim(db, "/log/food/batch", idempotency_key, request_hash) as claim:
+        if claim.replay is not None:
+            return claim.replay
+        return await _log_food_images(results, indexes, images, db, claim)
+
+async def _log_food_images(results: list, indexes: List[int], images: List[bytes], db, claim: idempotency.Claim):
+    meals = []
+    for idx, values in zip(indexes, await pipeline.process_batch(images)):
+        if "error" in values:
+            results[idx] = {"index": idx, "ok": False, "error": values["error"]}
+            continue
+        meals.append((idx, {"image_url": "https://via.placeholder.com/150?text=Food", "user_id": 1, **values}))
+
+    def record(db, ids):
+        for (idx, _), meal_id in zip(meals, ids):
+            results[idx] = {"index": idx, "ok": True, "id": meal_id}
+        # Committed with the meals. Nothing created means nothing to duplicate, so the key stays free
+        claim.stage(db, 200, schemas.BatchResult.model_validate(_batch_result(results)).model_dump(mode="json"))
+
+    if meals:
+        ids = await database.run(db, _save_all, models.Meal, [meal for _, meal in meals], record)
+        _after_write(1)
+        # One event for the whole batch; clients refetch rather than apply N deltas
+        events.publish(1, "meal", {"op": "bulk_created", "ids": ids})
+    return _batch_result(results)
+
+@app.get("/meals/{meal_id}", response_model=schemas.MealOut)
+async def get_meal(meal_id: int, db: Session = Depends(database.get_db)):
+    # Poll target for background processing; read from the primary so status is current
+    meal = await database.run(db, _get_meal, meal_id, 1)
+    if meal is None:
+        raise HTTPException(status_code=404, detail="Meal not found.")
+    return meal
+
 @app.post("/log/symptom", response_model=schemas.SymptomOut)
-def log_symptom(symptom: schemas.SymptomCreate, db: Session = Depends(database.get_db)):
+async def log_symptom(symptom: schemas.SymptomCreate, db: Session = Depends(database.get_db)):
     # Ensure user exists
-    user = db.query(models.User).filter(models.User.id == 1).first()
-    if not user:
-        user = models.User(email="demo@test.com", name="Demo")
-        db.add(user)
-        db.commit()
+    await database.run(db, _ensure_demo_user)
         
     new_symptom = models.Symptom(
         symptom_name=symptom.symptom_name,
@@ -292,8 +480,45 @@ def log_symptom(symptom: schemas.SymptomCreate, db: Session = Depends(database.g
         user_id=1 # Hardcoded for prototype
     )
     
-    db.add(new_symptom)
-    db.commit()
-    db.refresh(new_symptom)
-    
+    new_symptom = await database.run(db, _save, new_symptom)
+    _after_write(1)
+    events.publish(1, "symptom", {"op": "created", **schemas.SymptomOut.model_validate(new_symptom).model_dump(mode="json")})
     return new_symptom
+
+@app.post("/log/symptom/batch", response_model=schemas.BatchResult)
+async def log_symptom_batch(items: List[dict] = Body(...), db: Session = Depends(database.get_db)):
+    """Log several symptoms in one transaction; invalid items are reported, not fatal."""
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_ITEMS} items per batch.")
+
+    results = [None] * len(items)
+    symptoms = []
+    for idx, item in enumerate(items):
+        try:
+            symptom = schemas.SymptomBatchItem.model_validate(item)
+        except ValidationError as exc:
+            errors = "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors())
+            results[idx] = {"index": idx, "ok": False, "error": errors}
+            continue
+        values = symptom.model_dump()
+        # Every row needs the same keys for a single executemany
+        values["created_at"] = values["created_at"] or datetime.utcnow()
+        symptoms.append((idx, {"user_id": 1, **values}))
+
+    if symptoms:
+        ids = await database.run(db, _save_all, models.Symptom, [symptom for _, symptom in symptoms])
+        for (idx, _), symptom_id in zip(symptoms, ids):
+            results[idx] = {"index": idx, "ok": True, "id": symptom_id}
+        _after_write(1)
+        events.publish(1, "symptom", {"op": "bulk_created", "ids": ids})
+    return _batch_result(results)
+
+@app.get("/events")
+async def stream_events(request: Request):
+    # Live dashboard deltas; browsers' EventSource resends Last-Event-ID on reconnect
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    return StreamingResponse(
+        events.broker.stream(1, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
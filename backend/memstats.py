@@ -0,0 +1,230 @@
+# nutrisnap-backend/memstats.py
+"""
+Process memory accounting: RSS, torch allocator stats, tracemalloc top
+allocators by module, per-request peaks and a growth detector for soak runs.
+
+``report()`` backs ``GET /debug/memory`` on the backend and the Vertex app.
+The endpoint exposes process internals and, with tracemalloc on, takes a
+snapshot per call, so it answers 404 unless MEMORY_DEBUG_ENABLED=1, and then
+needs the PROFILE_ADMIN_TOKEN X-Admin-Token header when that is set.
+tracemalloc slows allocation-heavy code noticeably, so it only runs with
+MEMORY_TRACEMALLOC=1. Without it, the per-request numbers come from RSS, which
+counts native allocations (torch tensors, PIL buffers) that tracemalloc can't
+see anyway.
+
+Per-request peaks are process-wide: with requests overlapping on one worker,
+each request's peak includes whatever the others allocated meanwhile. The
+Vertex app handles one predict at a time per worker, so its numbers are exact.
+
+Standard library only (torch is reported when already imported), so the
+Vertex app imports it as ``backend.memstats``.
+"""
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import metrics
+    import profiling
+except ImportError:  # imported as backend.memstats by the Vertex container
+    from backend import metrics
+    from backend import profiling
+
+MEMORY_TRACEMALLOC = os.getenv("MEMORY_TRACEMALLOC", "0") == "1"
+MEMORY_TRACEMALLOC_FRAMES = int(os.getenv("MEMORY_TRACEMALLOC_FRAMES", "1"))
+MEMORY_DEBUG_ENABLED = os.getenv("MEMORY_DEBUG_ENABLED", "0") == "1"
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+# MiB buckets from 1 to 1024, in bytes
+MEMORY_BUCKETS = tuple(2 ** i * 1024 * 1024 for i in range(11))
+
+REQUEST_RSS_GROWTH = metrics.histogram(
+    "nutrisnap_request_rss_growth_bytes", "Resident memory growth across a request", ["route"], MEMORY_BUCKETS
+)
+REQUEST_PEAK_TRACED = metrics.histogram(
+    "nutrisnap_request_peak_traced_bytes", "tracemalloc peak above the request's starting point", ["route"], MEMORY_BUCKETS
+)
+metrics.gauge("nutrisnap_process_rss_bytes", "Resident set size", fn=lambda: rss_bytes())
+
+if MEMORY_TRACEMALLOC and not tracemalloc.is_tracing():
+    tracemalloc.start(MEMORY_TRACEMALLOC_FRAMES)
+
+
+def allowed(token: str = None) -> bool:
+    """Whether a /debug/memory request may run."""
+    return MEMORY_DEBUG_ENABLED and profiling.token_ok(token)
+
+
+def rss_bytes() -> int:
+    """Current resident set size."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    """Highest resident set size since the process started."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def torch_stats() -> dict:
+    """Allocator counters when torch is loaded; CUDA numbers only with a GPU."""
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return {"loaded": False}
+    stats = {"loaded": True, "version": torch.__version__, "num_threads": torch.get_num_threads(),
+             "cuda": torch.cuda.is_available()}
+    if stats["cuda"]:
+        stats.update(
+            allocated_bytes=torch.cuda.memory_allocated(),
+            reserved_bytes=torch.cuda.memory_reserved(),
+            max_allocated_bytes=torch.cuda.max_memory_allocated(),
+            max_reserved_bytes=torch.cuda.max_memory_reserved(),
+        )
+    return stats
+
+
+def module_for(filename: str) -> str:
+    """Dotted module name for a source file, relative to the longest matching sys.path entry."""
+    path = os.path.abspath(filename)
+    best = None
+    for entry in sys.path:
+        root = os.path.abspath(entry or ".")
+        if path.startswith(root + os.sep) and (best is None or len(root) > len(best)):
+            best = root
+    rel = os.path.relpath(path, best) if best else os.path.basename(path)
+    module = os.path.splitext(rel)[0].replace(os.sep, ".")
+    return module[:-len(".__init__")] if module.endswith(".__init__") else module
+
+
+def top_allocations(limit: int = 20, depth: int = None) -> list:
+    """Live tracemalloc allocations summed per module, largest first.
+
+    ``depth`` truncates module names (depth=1 groups ``transformers.models.vit``
+    under ``transformers``). Empty when tracemalloc isn't running.
+    """
+    if not tracemalloc.is_tracing():
+        return []
+    totals = {}
+    for stat in tracemalloc.take_snapshot().statistics("filename"):
+        module = module_for(stat.traceback[0].filename)
+        if depth:
+            module = ".".join(module.split(".")[:depth])
+        size, count = totals.get(module, (0, 0))
+        totals[module] = (size + stat.size, count + stat.count)
+    ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+    return [{"module": module, "size_bytes": size, "count": count} for module, (size, count) in ranked]
+
+
+_route_peaks = {}
+_route_lock = threading.Lock()
+
+
+def record_request(route: str, rss_growth: int, traced_peak: int = None):
+    REQUEST_RSS_GROWTH.observe(max(rss_growth, 0), route=route)
+    if traced_peak is not None:
+        REQUEST_PEAK_TRACED.observe(traced_peak, route=route)
+    with _route_lock:
+        worst = _route_peaks.setdefault(route, {"requests": 0, "max_rss_growth_bytes": 0, "max_traced_peak_bytes": None})
+        worst["requests"] += 1
+        worst["max_rss_growth_bytes"] = max(worst["max_rss_growth_bytes"], rss_growth)
+        if traced_peak is not None:
+            worst["max_traced_peak_bytes"] = max(worst["max_traced_peak_bytes"] or 0, traced_peak)
+
+
+def report(limit: int = 20, depth: int = None) -> dict:
+    traced = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else None
+    with _route_lock:
+        routes = {route: dict(stats) for route, stats in _route_peaks.items()}
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": rss_bytes(),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "torch": torch_stats(),
+        "tracemalloc": {
+            "tracing": traced is not None,
+            "current_bytes": traced[0] if traced else None,
+            "peak_bytes": traced[1] if traced else None,
+            "top": top_allocations(limit, depth),
+        },
+        "requests": routes,
+    }
+
+
+class MemoryMiddleware:
+    """ASGI middleware recording each request's RSS growth and tracemalloc peak by route."""
+
+    def __init__(self, app):
+        self.app = app
+        self._inflight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        tracking = tracemalloc.is_tracing()
+        if tracking and self._inflight == 0:
+            # Only reset with nothing else in flight, so overlapping requests aren't undercounted
+            tracemalloc.reset_peak()
+        self._inflight += 1
+        start_rss = rss_bytes()
+        start_traced = tracemalloc.get_traced_memory()[0] if tracking else 0
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._inflight -= 1
+            traced_peak = max(tracemalloc.get_traced_memory()[1] - start_traced, 0) if tracking else None
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            record_request(route, rss_bytes() - start_rss, traced_peak)
+
+
+def growth_trend(samples, warmup: float = 0.2, min_growth_bytes: int = 32 * 1024 * 1024,
+                 min_rising_fraction: float = 0.7) -> dict:
+    """Decide whether a series of memory readings keeps growing.
+
+    Drops the first ``warmup`` fraction (allocator pools and caches filling
+    up), fits a least-squares slope to the rest, and flags a leak when the
+    fitted growth over the window exceeds ``min_growth_bytes`` and at least
+    ``min_rising_fraction`` of successive readings didn't go down.
+    """
+    values = list(samples)[int(len(samples) * warmup):]
+    if len(values) < 3:
+        return {"leak": False, "samples": len(values), "slope_bytes_per_sample": 0.0, "growth_bytes": 0, "rising_fraction": 0.0}
+    n = len(values)
+    mean_x, mean_y = (n - 1) / 2, sum(values) / n
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values)) / sum((x - mean_x) ** 2 for x in range(n))
+    rising = sum(b >= a for a, b in zip(values, values[1:])) / (n - 1)
+    growth = slope * (n - 1)
+    return {
+        "leak": growth > min_growth_bytes and rising >= min_rising_fraction,
+        "samples": n,
+        "slope_bytes_per_sample": round(slope, 1),
+        "growth_bytes": int(growth),
+        "rising_fraction": round(rising, 3),
+    }
+
+
+def soak(fn, payloads, iterations: int, sample_every: int = 50, **trend_options) -> dict:
+    """Call ``fn(payload)`` ``iterations`` times cycling through ``payloads``, sampling RSS as it goes."""
+    samples = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(payloads[i % len(payloads)])
+        if (i + 1) % sample_every == 0:
+            samples.append(rss_bytes())
+    elapsed = time.perf_counter() - start
+    return {
+        "iterations": iterations,
+        "seconds": round(elapsed, 2),
+        "rss_samples": samples,
+        "rss_start_bytes": samples[0] if samples else None,
+        "rss_end_bytes": samples[-1] if samples else None,
+        **growth_trend(samples, **trend_options),
+    }
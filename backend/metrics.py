@@ -0,0 +1,257 @@
+# nutrisnap-backend/metrics.py
+"""
+In-process counters, gauges and histograms in the Prometheus text format.
+
+Shared by the backend API and the Vertex inference app (which imports it as
+``backend.metrics``), so this module only uses the standard library. Each
+update is a dict lookup plus a short lock; ``render()`` formats a snapshot for
+``GET /metrics``. Values are per process: with several uvicorn workers, scrape
+each worker or run one worker per container.
+
+    FALLBACKS = metrics.counter("nutrisnap_fallbacks", "Fallback paths taken", ["kind"])
+    FALLBACKS.inc(kind="gemini")
+    with metrics.stage("pipeline.resize"):
+        ...
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import tracing
+except ImportError:  # imported as backend.metrics by the Vertex container
+    from backend import tracing
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Seconds; spans sub-millisecond cache hits to slow model calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}_total{_labels(self.labelnames, key)} {_number(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    """Set explicitly, or computed at scrape time by ``fn`` returning {label tuple: value} or a number."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), fn=None):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.fn is not None:
+            try:
+                values = self.fn()
+            except Exception:
+                return []
+            items = values.items() if isinstance(values, dict) else [((), values)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        # Re-registering returns the existing metric, so module reloads don't duplicate series
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            samples = metric.samples()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name, help, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name, help, labelnames=(), fn=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames, fn))
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+@contextmanager
+def timer(hist: Histogram, **labels):
+    """Observe the block's wall time into ``hist``, also when it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        hist.observe(time.perf_counter() - start, **labels)
+
+
+STAGE_SECONDS = histogram("nutrisnap_stage_seconds", "Time per processing stage", ["stage"])
+
+
+@contextmanager
+def stage(name: str):
+    """``with metrics.stage("pipeline.resize"):`` times the block into STAGE_SECONDS and traces it as a span."""
+    with tracing.span(name), timer(STAGE_SECONDS, stage=name):
+        yield
+
+
+HTTP_SECONDS = histogram(
+    "http_request_duration_seconds",
+    "Time from request start to response headers, by route template",
+    ["method", "route", "status"],
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request into HTTP_SECONDS.
+
+    Timing stops when the response headers are sent, so long-lived streams
+    (SSE, exports) record their time to first byte rather than their lifetime.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        observed = False
+
+        def observe(status):
+            route = scope.get("route")
+            # Templates ("/meals/{meal_id}") keep the label set small; unmatched paths share one label
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_SECONDS.observe(time.perf_counter() - start, method=scope["method"], route=path, status=status)
+
+        async def send_wrapper(message):
+            nonlocal observed
+            if message["type"] == "http.response.start" and not observed:
+                observed = True
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not observed:
+                observe(500)
+            raise
@@ -1,5 +1,5 @@
 # nutrisnap-backend/models.py
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Text, UniqueConstraint, inspect, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -32,7 +32,38 @@ class Meal(Base):
     carbs = Column(Float, default=0.0)
     fat = Column(Float, default=0.0)
     triggers = Column(String, nullable=True)
+    # "pending" while a background worker classifies the upload, then "complete" or "failed"
+    status = Column(String, default="complete", nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     user_id = Column(Integer, ForeignKey("users.id"))
-    owner = relationship("User", back_populates="meals")
\ No newline at end of file
+    owner = relationship("User", back_populates="meals")
+
+class IdempotencyKey(Base):
+    """Outcome of an upload sent with an Idempotency-Key header, replayed to retries until it expires."""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_id", "path", "key"),)
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    path = Column(String, nullable=False)
+    key = Column(String, nullable=False)
+    # Hash of the request body, so a key reused for a different upload is refused
+    request_hash = Column(String, nullable=False)
+    # "in_progress" while the first request runs, then "complete" with its response
+    status = Column(String, default="in_progress", nullable=False)
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+def upgrade_schema(engine):
+    """Add columns introduced after a table was first created; create_all never alters existing tables."""
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # IF NOT EXISTS keeps concurrent workers starting up from racing each other
+            conn.execute(text("ALTER TABLE meals ADD COLUMN IF NOT EXISTS status VARCHAR NOT NULL DEFAULT 'complete'"))
+            return
+        columns = {c["name"] for c in inspect(conn).get_columns("meals")}
+        if "status" not in columns:
+            conn.execute(text("ALTER TABLE meals ADD COLUMN status VARCHAR NOT NULL DEFAULT 'complete'"))
@@ -0,0 +1,688 @@
+# nutrisnap-backend/pipeline.py
+"""
+Meal image processing: resize, classify, trigger lookup and nutrition.
+
+log_food runs these stages inline by default. With MEAL_PIPELINE_MODE=async
+(or ?mode=async) the upload is written to UPLOAD_DIR, a pending Meal row is
+committed straight away and a job is queued; worker tasks then run the
+stages and fill the row in. Clients poll GET /meals/{id} for completion.
+
+MEAL_QUEUE_BACKEND selects the job queue:
+  memory       asyncio.Queue inside the API process (default)
+  redis        Redis list at CACHE_REDIS_URL (blocking BRPOP), so separate worker processes can consume
+  local-redis  in-process stand-in for the Redis list, for tests/dev
+
+With the memory queue the upload waits in UPLOAD_DIR and the worker updates
+the cache and SSE stream of its own process. Broker jobs may be taken by a
+worker on another host, so the image travels inside the job, and the worker
+publishes a completion notice on MEAL_EVENTS_CHANNEL that every API process
+relays to its own cache, read-your-writes pin and /events subscribers.
+
+Classification goes through inference_router: Vertex AI, the model service and
+local inference are tried in INFERENCE_BACKENDS order, each behind a circuit
+breaker, with optional hedging between the remote ones.
+"""
+import asyncio
+import base64
+import io
+import json
+import logging
+import os
+from pathlib import Path
+from typing import List
+
+import httpx
+from sqlalchemy import select, update
+from PIL import Image
+from starlette.concurrency import run_in_threadpool
+
+import cache
+import database
+import events
+import gemini_utils
+import inference_router
+import metrics
+import models
+import tracing
+import uploads
+import wire
+
+logger = logging.getLogger(__name__)
+
+MODEL_SERVICE_URL = os.getenv("MODEL_SERVICE_URL")
+# "frames" sends images to the model service as raw bytes (wire.py) rather than base64 JSON
+MODEL_SERVICE_TRANSPORT = os.getenv("MODEL_SERVICE_TRANSPORT", "frames")
+# With frames, > 0 sends pixels already resized to this square, so the service skips decoding
+MODEL_SERVICE_PIXELS_SIDE = int(os.getenv("MODEL_SERVICE_PIXELS_SIDE", "0"))
+MEAL_PIPELINE_MODE = os.getenv("MEAL_PIPELINE_MODE", "sync")
+MEAL_QUEUE_BACKEND = os.getenv("MEAL_QUEUE_BACKEND", "memory")
+MEAL_QUEUE_MAX = int(os.getenv("MEAL_QUEUE_MAX", "1000"))
+MEAL_WORKERS = int(os.getenv("MEAL_WORKERS", "2"))
+MEAL_EVENTS_CHANNEL = "nutrisnap:meal-events"
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "/tmp/nutrisnap-uploads"))
+# Point the Vertex client at a stand-in (load tests); VERTEX_AUTH=0 skips the ADC token
+VERTEX_API_BASE = os.getenv("VERTEX_API_BASE")
+VERTEX_AUTH = os.getenv("VERTEX_AUTH", "1") == "1"
+# Images per inference request for batch uploads (Vertex caps the payload at ~1.5MB)
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "8"))
+# Ordered backends, e.g. "vertex,model_service,local"; unset means the configured ones, then local
+INFERENCE_BACKENDS = os.getenv("INFERENCE_BACKENDS")
+# Local inference behind the remote backends. Off by default: it costs the torch import, a
+# model download and ~1GB of RSS, so when on, the model is loaded at startup rather than mid-outage
+INFERENCE_LOCAL_FALLBACK = os.getenv("INFERENCE_LOCAL_FALLBACK", "0") == "1"
+# Send a second request to the next remote backend once the first passes its p95 latency
+INFERENCE_HEDGE = os.getenv("INFERENCE_HEDGE", "0") == "1"
+INFERENCE_HEDGE_MIN_MS = float(os.getenv("INFERENCE_HEDGE_MIN_MS", "250"))
+INFERENCE_BREAKER_FAILURES = int(os.getenv("INFERENCE_BREAKER_FAILURES", "5"))
+INFERENCE_BREAKER_RESET_SECONDS = float(os.getenv("INFERENCE_BREAKER_RESET_SECONDS", "30"))
+
+# Simple nutrition lookup for prototype
+NUTRITION_LOOKUP = {
+    "ramen": {"protein": 10.0, "carbs": 40.0, "fat": 15.0},
+    "grilled salmon": {"protein": 30.0, "carbs": 0.0, "fat": 15.0},
+    "caesar salad": {"protein": 7.0, "carbs": 10.0, "fat": 12.0},
+    "pizza": {"protein": 12.0, "carbs": 30.0, "fat": 10.0},
+    "burger": {"protein": 25.0, "carbs": 35.0, "fat": 20.0},
+    "sushi": {"protein": 15.0, "carbs": 45.0, "fat": 5.0},
+    "pasta": {"protein": 12.0, "carbs": 60.0, "fat": 8.0},
+    "steak": {"protein": 40.0, "carbs": 0.0, "fat": 25.0},
+    "chicken breast": {"protein": 30.0, "carbs": 0.0, "fat": 3.0},
+    "rice": {"protein": 4.0, "carbs": 45.0, "fat": 0.5},
+}
+
+
+INFERENCE_REQUESTS = metrics.counter(
+    "nutrisnap_inference_requests", "Classification calls by backend and outcome", ["backend", "outcome"]
+)
+GEMINI_FALLBACKS = metrics.counter(
+    "nutrisnap_gemini_fallbacks", "Trigger lookups that fell back to the error placeholder"
+)
+MEAL_JOBS = metrics.counter("nutrisnap_meal_jobs", "Background meal jobs by outcome", ["outcome"])
+
+ROUTER = inference_router.Router(
+    hedge=INFERENCE_HEDGE,
+    hedge_min_ms=INFERENCE_HEDGE_MIN_MS,
+    failure_threshold=INFERENCE_BREAKER_FAILURES,
+    reset_seconds=INFERENCE_BREAKER_RESET_SECONDS,
+)
+metrics.gauge("nutrisnap_inference_circuit_open", "1 while a backend's circuit breaker is open or half-open", ["backend"],
+              fn=lambda: {(name,): int(state != inference_router.CLOSED) for name, state in ROUTER.states().items()})
+
+
+def run_inference(image_bytes: bytes) -> dict:
+    # Imported on first local call: torch/transformers cost seconds and hundreds of MB,
+    # which deployments using Vertex AI or the model service never need
+    import inference
+
+    return inference.predict(image_bytes)
+
+
+def run_inference_batch(images: List[bytes]) -> List[dict]:
+    import inference
+
+    return inference.predict_batch(images)
+
+
+def pixels_for(image_bytes: bytes, side: int) -> wire.Pixels:
+    """RGB pixels squashed to ``side`` x ``side``, as the ViT processor would resize them."""
+    image = uploads.open_bounded(image_bytes, side).resize((side, side), Image.BILINEAR)
+    return wire.Pixels(side, side, 3, image.tobytes())
+
+
+class PipelineError(Exception):
+    """A processing stage failed; the message is safe to return to the client."""
+
+
+class QueueFull(Exception):
+    pass
+
+
+def resize_image(image_bytes: bytes) -> bytes:
+    # Resize image to reduce payload size (Vertex AI limit ~1.5MB)
+    try:
+        # Convert to RGB (handle PNG/RGBA); large JPEGs decode at reduced scale
+        image = uploads.open_bounded(image_bytes, 512)
+
+        # Resize to max 512x512 (ViT usually takes 224x224, but 512 is safe for quality)
+        image.thumbnail((512, 512))
+
+        # Save to buffer as JPEG
+        buffered = io.BytesIO()
+        image.save(buffered, format="JPEG", quality=85)
+        return buffered.getvalue()
+    except Exception as e:
+        logger.error(f"Image processing failed: {e}")
+        # Fallback to original if resize fails (unlikely)
+        return image_bytes
+
+
+_http_client = None
+_http_loop = None
+
+
+def _http() -> httpx.AsyncClient:
+    """Shared client for inference calls, so Vertex and model service connections are reused."""
+    global _http_client, _http_loop
+    loop = asyncio.get_running_loop()
+    # Pooled connections belong to the loop that opened them
+    if _http_client is None or _http_loop is not loop:
+        _http_client = httpx.AsyncClient()
+        _http_loop = loop
+    return _http_client
+
+
+async def close_http():
+    global _http_client
+    client, _http_client = _http_client, None
+    # A client opened on an earlier, finished loop can't close its connections from this one
+    if client is not None and _http_loop is asyncio.get_running_loop():
+        await client.aclose()
+
+
+async def _vertex_predict(images: List[bytes], resized: List[bytes]) -> list:
+    # Vertex AI Configuration
+    vertex_endpoint_id = os.getenv("VERTEX_ENDPOINT_ID")
+    vertex_project_id = os.getenv("VERTEX_PROJECT_ID")
+    vertex_region = os.getenv("VERTEX_REGION", "us-central1")
+    try:
+        if not vertex_endpoint_id:
+            raise RuntimeError("VERTEX_ENDPOINT_ID is not set")
+        headers = {"Content-Type": "application/json"}
+        if VERTEX_AUTH:
+            # Get credentials
+            import google.auth
+            from google.auth.transport.requests import Request as GoogleRequest
+
+            with metrics.stage("pipeline.vertex_token"):
+                credentials, _ = await run_in_threadpool(google.auth.default)
+                await run_in_threadpool(credentials.refresh, GoogleRequest())
+            headers["Authorization"] = f"Bearer {credentials.token}"
+
+        # Encode images
+        encoded_images = [base64.b64encode(b).decode("utf-8") for b in resized]
+
+        # VERTEX_ENDPOINT_ID may be the full resource name (projects/.../endpoints/...)
+        # or just the ID. API expects: https://{REGION}-aiplatform.googleapis.com/v1/{ENDPOINT}:predict
+        api_base = VERTEX_API_BASE or f"https://{vertex_region}-aiplatform.googleapis.com"
+        if "projects/" in vertex_endpoint_id:
+             url = f"{api_base}/v1/{vertex_endpoint_id}:predict"
+        else:
+             url = f"{api_base}/v1/projects/{vertex_project_id}/locations/{vertex_region}/endpoints/{vertex_endpoint_id}:predict"
+
+        with metrics.stage("pipeline.vertex"):
+            response = await _http().post(
+                url,
+                json={"instances": encoded_images}, # Custom model expects list of strings
+                headers=tracing.inject(headers),
+                timeout=30.0
+            )
+        response.raise_for_status()
+        result = response.json()
+
+        # Adapt response. Vertex AI returns {"predictions": [...]}
+        # Our model returns {"top1": ..., "topk": ...} inside each prediction
+        return result.get("predictions") or []
+
+    except Exception as exc:
+        INFERENCE_REQUESTS.inc(backend="vertex", outcome="error")
+        logger.error(f"Vertex AI inference failed: {exc}")
+        raise PipelineError(f"Vertex AI inference failed: {exc}") from exc
+
+
+async def _model_service_predict(images: List[bytes], resized: List[bytes]) -> list:
+    # Legacy internal model service
+    try:
+        if not MODEL_SERVICE_URL:
+            raise RuntimeError("MODEL_SERVICE_URL is not set")
+        if MODEL_SERVICE_TRANSPORT == "frames":
+            if MODEL_SERVICE_PIXELS_SIDE > 0:
+                items = await run_in_threadpool(lambda: [pixels_for(b, MODEL_SERVICE_PIXELS_SIDE) for b in images])
+            else:
+                items = images
+            request = {"content": wire.encode_batch(items), "headers": tracing.inject({"Content-Type": wire.CONTENT_TYPE})}
+        else:
+            # Encode image to base64 for the Vertex/Model service
+            encoded_images = [base64.b64encode(b).decode("utf-8") for b in images]
+            request = {"json": {"instances": encoded_images}, "headers": tracing.inject()}
+
+        with metrics.stage("pipeline.model_service"):
+            response = await _http().post(f"{MODEL_SERVICE_URL}/predict", timeout=30.0, **request)
+        response.raise_for_status()
+        result = response.json()
+        return result.get("predictions") or []
+    except Exception as exc:
+        INFERENCE_REQUESTS.inc(backend="model_service", outcome="error")
+        logger.error(f"Model service failed: {exc}")
+        raise PipelineError(f"Model service failed: {exc}") from exc
+
+
+async def _local_predict(images: List[bytes], resized: List[bytes]) -> list:
+    try:
+        with metrics.stage("pipeline.local_inference"):
+            if len(images) == 1:
+                return [await run_in_threadpool(run_inference, images[0])]
+            return await run_in_threadpool(run_inference_batch, images)
+    except Exception as exc:
+        INFERENCE_REQUESTS.inc(backend="local", outcome="error")
+        raise PipelineError(f"Inference failed: {exc}") from exc
+
+
+BACKEND_CALLS = {"vertex": _vertex_predict, "model_service": _model_service_predict, "local": _local_predict}
+
+
+def inference_backends() -> List[str]:
+    """Backends to try, in order: INFERENCE_BACKENDS, or whatever is configured plus local."""
+    if INFERENCE_BACKENDS:
+        order = [name.strip() for name in INFERENCE_BACKENDS.split(",") if name.strip()]
+        unknown = [name for name in order if name not in BACKEND_CALLS]
+        if unknown:
+            raise ValueError(f"Unknown INFERENCE_BACKENDS entries: {unknown}")
+        return order
+    order = []
+    if os.getenv("VERTEX_ENDPOINT_ID"):
+        order.append("vertex")
+    if MODEL_SERVICE_URL:
+        order.append("model_service")
+    if INFERENCE_LOCAL_FALLBACK or not order:
+        order.append("local")
+    return order
+
+
+def warm_local_fallback() -> bool:
+    """Load the local model now if it backs up a remote backend; returns whether it did."""
+    order = inference_backends()
+    if "local" not in order or order == ["local"]:
+        return False
+    try:
+        import inference
+
+        inference.get_bundle()
+    except Exception:
+        # Remote backends still serve; the first local call retries the load
+        logger.exception("Could not preload the local inference fallback")
+        return False
+    return True
+
+
+async def classify_batch(images: List[bytes], resized: List[bytes]) -> List[dict]:
+    """Predictions for each image, in order, from the first backend that answers.
+
+    An item whose prediction is missing comes back as an empty dict.
+    """
+    try:
+        backend, predictions = await ROUTER.call(
+            inference_backends(), lambda name: BACKEND_CALLS[name](images, resized)
+        )
+    except inference_router.AllBackendsFailed as exc:
+        raise PipelineError(str(exc)) from exc
+
+    INFERENCE_REQUESTS.inc(backend=backend, outcome="ok")
+    predictions = list(predictions)[:len(images)]
+    return predictions + [{}] * (len(images) - len(predictions))
+
+
+async def classify(image_bytes: bytes, resized_bytes: bytes) -> dict:
+    predictions = (await classify_batch([image_bytes], [resized_bytes]))[0]
+    if not predictions.get("top1"):
+        raise PipelineError("Model returned no predictions.")
+    return predictions
+
+
+def label_for(predictions: dict) -> str:
+    top_label = predictions["top1"][0]["label"]
+    # Format label: replace underscores with spaces and title case
+    return top_label.replace("_", " ").title()
+
+
+def nutrition_for(identified_foods: str) -> dict:
+    return NUTRITION_LOOKUP.get(identified_foods.lower(), {"protein": 0.0, "carbs": 0.0, "fat": 0.0})
+
+
+async def lookup_triggers(label: str, resized_bytes: bytes) -> str:
+    with metrics.stage("pipeline.gemini"):
+        triggers = await run_in_threadpool(gemini_utils.get_food_triggers, label, resized_bytes)
+    if triggers == gemini_utils.TRIGGER_ERROR:
+        GEMINI_FALLBACKS.inc()
+    return triggers
+
+
+async def process_image(image_bytes: bytes) -> dict:
+    """Run every stage and return the Meal column values."""
+    with metrics.stage("pipeline.resize"):
+        resized_bytes = await run_in_threadpool(resize_image, image_bytes)
+    predictions = await classify(image_bytes, resized_bytes)
+
+    identified_foods = label_for(predictions)
+
+    # Get triggers from Gemini
+    triggers = await lookup_triggers(identified_foods, resized_bytes)
+
+    return {"identified_foods": identified_foods, "triggers": triggers, **nutrition_for(identified_foods)}
+
+
+async def process_batch(images: List[bytes]) -> List[dict]:
+    """Meal column values for each image, or {"error": ...} for items that failed.
+
+    Inference runs in chunks of INFERENCE_BATCH_SIZE, and Gemini is asked once
+    per distinct label rather than once per image.
+    """
+    with metrics.stage("pipeline.resize"):
+        resized = await run_in_threadpool(lambda: [resize_image(b) for b in images])
+    predictions = []
+    for start in range(0, len(images), INFERENCE_BATCH_SIZE):
+        chunk = slice(start, start + INFERENCE_BATCH_SIZE)
+        try:
+            predictions.extend(await classify_batch(images[chunk], resized[chunk]))
+        except PipelineError as exc:
+            predictions.extend({"error": str(exc)} for _ in images[chunk])
+
+    labels = {}
+    for idx, prediction in enumerate(predictions):
+        if prediction.get("top1"):
+            labels.setdefault(label_for(prediction), idx)
+
+    async def lookup(label, idx):
+        return label, await lookup_triggers(label, resized[idx])
+
+    triggers = dict(await asyncio.gather(*(lookup(label, idx) for label, idx in labels.items())))
+
+    results = []
+    for prediction in predictions:
+        if not prediction.get("top1"):
+            results.append({"error": prediction.get("error", "Model returned no predictions.")})
+            continue
+        label = label_for(prediction)
+        results.append({"identified_foods": label, "triggers": triggers[label], **nutrition_for(label)})
+    return results
+
+
+class MemoryQueue:
+    """Bounded asyncio queue living in the API process."""
+
+    def __init__(self, maxsize: int = MEAL_QUEUE_MAX):
+        self._queue = asyncio.Queue(maxsize=maxsize)
+
+    async def put(self, job: dict):
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull as exc:
+            raise QueueFull() from exc
+
+    async def get(self) -> dict:
+        return await self._queue.get()
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def announce(self, notice: dict):
+        # Workers share the API process, so apply the notice here
+        apply_notice(notice)
+
+
+class BrokerQueue:
+    """Job queue on a Redis list (LPUSH / BRPOP).
+
+    The client is the synchronous redis-py one, so every command runs in the
+    threadpool. Workers block in BRPOP for up to ``block_seconds`` at a time;
+    a job popped after close() is pushed back for the next consumer.
+    """
+
+    def __init__(self, client, name: str = "nutrisnap:meal-jobs", maxsize: int = MEAL_QUEUE_MAX, block_seconds: float = 1):
+        self.client = client
+        self.name = name
+        self.maxsize = maxsize
+        self.block_seconds = block_seconds
+        self.closed = False
+
+    def _put(self, raw: str):
+        if self.client.llen(self.name) >= self.maxsize:
+            raise QueueFull()
+        self.client.lpush(self.name, raw)
+
+    def _pop(self):
+        popped = self.client.brpop(self.name, timeout=self.block_seconds)
+        if popped is not None and self.closed:
+            # The worker waiting for this was cancelled: return it to the consuming end
+            self.client.rpush(self.name, popped[1])
+            return None
+        return popped
+
+    async def put(self, job: dict):
+        await run_in_threadpool(self._put, json.dumps(job))
+
+    async def get(self) -> dict:
+        while True:
+            popped = await run_in_threadpool(self._pop)
+            if popped is not None:
+                return json.loads(popped[1])
+
+    def depth(self) -> int:
+        return self.client.llen(self.name)
+
+    def close(self):
+        self.closed = True
+
+    async def announce(self, notice: dict):
+        await run_in_threadpool(self.client.publish, MEAL_EVENTS_CHANNEL, json.dumps(notice))
+
+    async def relay(self, pubsub):
+        """Apply completion notices from any worker to this process until cancelled."""
+        try:
+            while True:
+                message = await run_in_threadpool(pubsub.get_message, True, self.block_seconds)
+                if message is not None and message["type"] == "message":
+                    apply_notice(json.loads(message["data"]))
+        finally:
+            pubsub.close()
+
+
+def _build_queue(name: str):
+    if name == "redis":
+        import redis
+
+        return BrokerQueue(redis.Redis.from_url(cache.CACHE_REDIS_URL))
+    if name == "local-redis":
+        return BrokerQueue(cache.LocalRedis())
+    return MemoryQueue()
+
+
+_queue = None
+_workers = []
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        _queue = _build_queue(MEAL_QUEUE_BACKEND)
+    return _queue
+
+
+def set_queue(queue):
+    global _queue
+    _queue = queue
+
+
+metrics.gauge("nutrisnap_meal_queue_depth", "Meal jobs waiting for a worker", fn=lambda: _queue.depth() if _queue is not None else 0)
+
+
+def upload_path_for(meal_id: int) -> Path:
+    # Named by meal so a restart can match leftover files to their pending rows
+    return UPLOAD_DIR / f"meal-{meal_id}.img"
+
+
+def store_upload(image_bytes: bytes, meal_id: int) -> str:
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    path = upload_path_for(meal_id)
+    path.write_bytes(image_bytes)
+    return str(path)
+
+
+def discard_upload(upload_path: str):
+    Path(upload_path).unlink(missing_ok=True)
+
+
+async def enqueue(meal_id: int, user_id: int, image_bytes: bytes):
+    """Queue ``image_bytes`` for a worker; raises QueueFull when the queue is at its bound."""
+    queue = get_queue()
+    job = {"meal_id": meal_id, "user_id": user_id}
+    if isinstance(queue, BrokerQueue):
+        # The worker may be on another host, so the image goes with the job
+        job["image"] = base64.b64encode(image_bytes).decode()
+        await queue.put(job)
+        return
+    job["upload_path"] = await run_in_threadpool(store_upload, image_bytes, meal_id)
+    try:
+        await queue.put(job)
+    except QueueFull:
+        await run_in_threadpool(discard_upload, job["upload_path"])
+        raise
+
+
+def _finish_meal(meal_id: int, values: dict):
+    with database.session_factory()() as db:
+        db.query(models.Meal).filter(models.Meal.id == meal_id).update(values)
+        db.commit()
+
+
+def apply_notice(notice: dict):
+    """Reflect a finished meal in this process: read pin, cached dashboard and SSE."""
+    database.record_write(notice["user_id"])
+    cache.invalidate_user(notice["user_id"])
+    events.publish(notice["user_id"], "meal", {"op": "updated", "id": notice["meal_id"], **notice["values"]})
+
+
+def _sweep_uploads():
+    """Match pending meals to their upload files after a restart.
+
+    Returns jobs for meals whose file survived; the other pending meals are
+    marked failed (returned as notices), and files with no pending meal are deleted.
+    """
+    with database.session_factory()() as db:
+        pending = db.execute(
+            select(models.Meal.id, models.Meal.user_id).where(models.Meal.status == "pending").order_by(models.Meal.id)
+        ).all()
+        jobs, lost = [], []
+        for meal_id, user_id in pending:
+            path = upload_path_for(meal_id)
+            if path.exists():
+                jobs.append({"meal_id": meal_id, "user_id": user_id, "upload_path": str(path)})
+            else:
+                lost.append({"user_id": user_id, "meal_id": meal_id, "values": {"status": "failed"}})
+        if lost:
+            db.execute(update(models.Meal).where(models.Meal.id.in_([n["meal_id"] for n in lost])).values(status="failed"))
+            db.commit()
+    keep = {job["upload_path"] for job in jobs}
+    if UPLOAD_DIR.exists():
+        for path in UPLOAD_DIR.glob("*.img"):
+            if str(path) not in keep:
+                path.unlink(missing_ok=True)
+    return jobs, lost
+
+
+async def recover_pending():
+    """Requeue pending meals left by a previous process, fail those whose upload is gone.
+
+    Only for the in-process queue, whose jobs die with the process; Redis jobs
+    outlive it. With several workers sharing UPLOAD_DIR a starting worker
+    can't tell orphans from another worker's jobs, so recovery is skipped.
+    """
+    queue = get_queue()
+    if not isinstance(queue, MemoryQueue):
+        return
+    if cache.WEB_CONCURRENCY > 1:
+        logger.warning("Skipping pending meal recovery: the memory queue can't recover across %d workers; "
+                       "use MEAL_QUEUE_BACKEND=redis", cache.WEB_CONCURRENCY)
+        return
+    jobs, lost = await run_in_threadpool(_sweep_uploads)
+    requeued = 0
+    for job in jobs:
+        try:
+            await queue.put(job)
+            requeued += 1
+        except QueueFull:
+            await run_in_threadpool(_finish_meal, job["meal_id"], {"status": "failed"})
+            await run_in_threadpool(discard_upload, job["upload_path"])
+            lost.append({"user_id": job["user_id"], "meal_id": job["meal_id"], "values": {"status": "failed"}})
+    for notice in lost:
+        apply_notice(notice)
+    if requeued or lost:
+        logger.info(f"Recovered pending meals: {requeued} requeued, {len(lost)} failed")
+
+
+async def _job_image(job: dict) -> bytes:
+    if "image" in job:
+        return base64.b64decode(job["image"])
+    return await run_in_threadpool(Path(job["upload_path"]).read_bytes)
+
+
+async def handle_job(job: dict, queue=None):
+    """Process one queued upload and complete (or fail) its Meal row."""
+    queue = queue or get_queue()
+    try:
+        image_bytes = await _job_image(job)
+        values = await process_image(image_bytes)
+        values["status"] = "complete"
+        MEAL_JOBS.inc(outcome="complete")
+    except Exception as exc:
+        MEAL_JOBS.inc(outcome="failed")
+        logger.error(f"Background processing failed for meal {job['meal_id']}: {exc}")
+        values = {"status": "failed"}
+
+    await run_in_threadpool(_finish_meal, job["meal_id"], values)
+    if "upload_path" in job:
+        await run_in_threadpool(discard_upload, job["upload_path"])
+    await queue.announce({"user_id": job["user_id"], "meal_id": job["meal_id"], "values": values})
+
+
+async def _worker_loop(queue):
+    while True:
+        job = await queue.get()
+        try:
+            await handle_job(job, queue)
+        except Exception:
+            logger.exception("Meal worker crashed on job %s", job)
+
+
+def start_workers(count: int = MEAL_WORKERS):
+    """Spawn ``count`` worker tasks on the running event loop."""
+    queue = get_queue()
+    for _ in range(count):
+        _workers.append(asyncio.create_task(_worker_loop(queue)))
+
+
+async def start_relay():
+    """With a broker queue, apply completion notices from every worker to this process."""
+    queue = get_queue()
+    if isinstance(queue, BrokerQueue):
+        pubsub = queue.client.pubsub()
+        # Subscribed before returning, so no notice published after startup is missed
+        await run_in_threadpool(pubsub.subscribe, MEAL_EVENTS_CHANNEL)
+        _workers.append(asyncio.create_task(queue.relay(pubsub)))
+
+
+async def stop_workers():
+    global _queue
+    # Close first so a BRPOP still running in the threadpool hands its job back
+    if isinstance(_queue, BrokerQueue):
+        _queue.close()
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    # An in-process queue is tied to this event loop and dies with it; a closed broker queue is rebuilt
+    _queue = None
+
+
+if __name__ == "__main__":
+    # Standalone worker process for MEAL_QUEUE_BACKEND=redis:  python pipeline.py
+    if MEAL_QUEUE_BACKEND != "redis":
+        raise SystemExit("Standalone meal workers need MEAL_QUEUE_BACKEND=redis; other queues live inside the API process.")
+
+    async def _main():
+        start_workers()
+        try:
+            await asyncio.gather(*_workers)
+        finally:
+            await close_http()
+
+    asyncio.run(_main())
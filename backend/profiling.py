@@ -0,0 +1,179 @@
+# nutrisnap-backend/profiling.py
+"""
+Opt-in sampling profiler for the live API and inference processes.
+
+A background thread snapshots every thread's Python stack with
+``sys._current_frames()`` each PROFILE_INTERVAL_MS and counts identical
+stacks. Output is the "collapsed" format (``thread;outer;...;leaf count`` per
+line) read by flamegraph.pl, speedscope and inferno.
+
+Three ways in, all off unless PROFILING_ENABLED=1:
+  GET /admin/profile?seconds=10   profile the worker serving the request for N seconds
+  kill -USR2 <pid>                profile for PROFILE_SIGNAL_SECONDS, written to PROFILE_DIR
+  PROFILE_EVERY_N=K               middleware profiles every K-th request into PROFILE_DIR
+
+Nothing runs while disabled: no sampler thread, and the middleware is only
+added when PROFILE_EVERY_N > 0. A request profile samples every thread, so
+requests running concurrently on the same worker show up in it too.
+
+Only the standard library is used, so the Vertex app imports it as
+``backend.profiling``.
+"""
+import asyncio
+import hmac
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_SIGNAL_SECONDS = float(os.getenv("PROFILE_SIGNAL_SECONDS", "10"))
+PROFILE_EVERY_N = int(os.getenv("PROFILE_EVERY_N", "0")) if PROFILING_ENABLED else 0
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "/tmp/nutrisnap-profiles"))
+# When set, /admin/profile and /debug/memory require a matching X-Admin-Token header
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")
+
+# Leaf frames of threads parked waiting for work; dropped unless include_idle
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("_thread.py", "_worker"),
+}
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class Sampler:
+    """Counts stacks of all threads (except its own) until stopped."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            code = frame.f_code
+            if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}").replace(";", ":"))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile_for(seconds: float, interval: float = PROFILE_INTERVAL_MS / 1000, include_idle: bool = False) -> str:
+    """Sample the process for ``seconds`` (capped at PROFILE_MAX_SECONDS); returns collapsed stacks."""
+    sampler = Sampler(interval, include_idle).start()
+    time.sleep(max(0.0, min(seconds, PROFILE_MAX_SECONDS)))
+    return sampler.stop().collapsed()
+
+
+def token_ok(token: str = None) -> bool:
+    """Whether ``token`` matches PROFILE_ADMIN_TOKEN (always true when none is set)."""
+    return PROFILE_ADMIN_TOKEN is None or hmac.compare_digest(token or "", PROFILE_ADMIN_TOKEN)
+
+
+def allowed(token: str = None) -> bool:
+    """Whether an /admin/profile request may run."""
+    return PROFILING_ENABLED and token_ok(token)
+
+
+def write_profile(collapsed: str, label: str) -> Path:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in label).strip("_") or "profile"
+    path = PROFILE_DIR / f"{safe}-{os.getpid()}-{time.time_ns()}.collapsed"
+    path.write_text(collapsed)
+    return path
+
+
+def install_signal_handler(signum=getattr(signal, "SIGUSR2", None), seconds: float = None):
+    """Profile for ``seconds`` into PROFILE_DIR whenever the process gets ``signum``.
+
+    Must be called from the main thread; returns False where signals aren't available.
+    """
+    if not PROFILING_ENABLED or signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def handle(_signum, _frame):
+        # The handler only spawns a thread; sampling and the file write happen off the signal path
+        duration = PROFILE_SIGNAL_SECONDS if seconds is None else seconds
+        threading.Thread(
+            target=lambda: print(f"🔥 Profile written to {write_profile(profile_for(duration), 'signal')}"),
+            name="profiler-signal", daemon=True,
+        ).start()
+
+    signal.signal(signum, handle)
+    return True
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that samples every ``every``-th HTTP request into PROFILE_DIR."""
+
+    def __init__(self, app, every: int = None, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.app = app
+        self.every = PROFILE_EVERY_N if every is None else every
+        self.interval = interval
+        self._count = 0
+        self._lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.every <= 0:
+            await self.app(scope, receive, send)
+            return
+        with self._lock:
+            self._count += 1
+            sampled = self._count % self.every == 0
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        sampler = Sampler(self.interval).start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or scope["path"]
+            # Joining the sampler and writing the file both block, so keep them off the event loop
+            await asyncio.to_thread(self._finish, sampler, f"{scope['method']}{route}")
+
+    @staticmethod
+    def _finish(sampler, label: str):
+        write_profile(sampler.stop().collapsed(), label)
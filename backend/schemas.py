@@ -1,6 +1,6 @@
 # nutrisnap-backend/schemas.py
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class MealCreate(BaseModel):
@@ -13,6 +13,7 @@ class MealOut(BaseModel):
     carbs: float
     fat: float
     triggers: Optional[str] = None
+    status: str = "complete"
     created_at: datetime
     user_id: int
     class Config:
@@ -23,6 +24,10 @@ class SymptomCreate(BaseModel):
     severity: int
     notes: Optional[str] = None
 
+class SymptomBatchItem(SymptomCreate):
+    # Lets offline clients backfill entries with the time they were recorded
+    created_at: Optional[datetime] = None
+
 class SymptomOut(BaseModel):
     id: int
     symptom_name: str
@@ -31,4 +36,24 @@ class SymptomOut(BaseModel):
     created_at: datetime
     user_id: int
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class BatchItemResult(BaseModel):
+    index: int
+    ok: bool
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class BatchResult(BaseModel):
+    created: int
+    failed: int
+    results: List[BatchItemResult]
+
+class TriggerAssociation(BaseModel):
+    trigger: str
+    symptom: str
+    lag_hours: float
+    meals_with_trigger: int
+    followed_by_symptom: int
+    lift: float
+    odds_ratio: float
@@ -1,14 +1,30 @@
-from database import engine, SessionLocal, Base
+import database
 import models
+import seed_synthetic
 from datetime import datetime, timedelta
+from seed_synthetic import PATTERNS
+
+def generate_history(days: int = 30, meals_per_day: int = 3, symptoms_per_day: float = 2.0, seed: int = 0,
+                     patterns=PATTERNS, start: datetime = None):
+    """Deterministic synthetic (meals, symptoms) for one user, as row dicts in time order.
+
+    A single-user run of ``seed_synthetic.generate``: symptoms follow patterned
+    triggers with the given probability and delay, the rest are background
+    noise, so associations have a realistic base rate.
+    """
+    data = seed_synthetic.generate(1, days * meals_per_day, round(days * symptoms_per_day), days=days, seed=seed,
+                                   patterns=patterns, start=start or datetime(2024, 1, 1))
+    meals, symptoms = (sorted(seed_synthetic.rows(data[table]), key=lambda row: row["created_at"])
+                       for table in ("meals", "symptoms"))
+    return meals, symptoms
 
 
 def reset_and_seed_example():
     print("⚠️  Wiping database...")
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.Base.metadata.create_all(bind=database.engine)
     
-    db = SessionLocal()
+    db = database.SessionLocal()
     try:
         print("🌱 Seeding comprehensive example data...")
         
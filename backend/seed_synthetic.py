@@ -0,0 +1,222 @@
+# nutrisnap-backend/seed_synthetic.py
+"""
+High-volume synthetic data for load and scale testing.
+
+    python seed_synthetic.py --users 1000 --meals 1000 --symptoms 400 --seed 7
+    python seed_synthetic.py --users 10 --meals 50000 --patterns '{"Lactose": ["Bloating", 0.9, [0.5, 2]]}'
+
+Creates N users, each with M meals and K symptoms spread over --days. A symptom
+follows a meal whose triggers match a pattern with that pattern's probability
+and delay; the rest are background noise. Everything is generated with NumPy
+from --seed, so the same arguments always produce the same rows. Rows are
+written with Postgres COPY when available, otherwise batched executemany.
+"""
+import argparse
+import csv
+import io
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import insert, select
+
+import database
+import models
+
+# Foods the synthetic generator picks from, with the triggers Gemini would report
+MENU = [
+    ("Greek Yogurt Parfait", "Lactose"),
+    ("Grilled Chicken Salad", "None"),
+    ("Pepperoni Pizza", "Gluten, Lactose, High Sodium"),
+    ("Scrambled Eggs & Avocado", "None"),
+    ("Turkey Sandwich on Wheat", "Gluten"),
+    ("Spicy Beef Tacos", "Spicy Food, Gluten"),
+    ("Oatmeal with Berries", "None"),
+    ("Pasta Carbonara", "Gluten, Lactose"),
+    ("Chocolate Ice Cream", "Lactose, Sugar"),
+    ("Grilled Salmon with Rice", "None"),
+    ("Green Smoothie", "None"),
+    ("Chicken Curry", "Spicy Food"),
+    ("Cheeseburger", "Gluten, Lactose, Red Meat"),
+    ("Cereal with Whole Milk", "Lactose, Gluten"),
+    ("Sushi Roll", "None"),
+]
+
+# trigger -> (symptom, probability a meal with it causes the symptom, delay range in hours)
+PATTERNS = {
+    "Lactose": ("Bloating", 0.6, (0.5, 4.0)),
+    "Gluten": ("Lethargy", 0.5, (1.0, 3.0)),
+    "Spicy Food": ("Heartburn", 0.7, (0.5, 2.0)),
+}
+BACKGROUND_SYMPTOMS = ["Bloating", "Lethargy", "Heartburn", "Headache", "Nausea"]
+
+MEAL_COLUMNS = ("user_id", "image_url", "identified_foods", "protein", "carbs", "fat", "triggers", "status", "created_at")
+SYMPTOM_COLUMNS = ("user_id", "symptom_name", "severity", "notes", "created_at")
+
+
+def _menu_patterns(patterns, symptom_names):
+    """Per menu item: code of the symptom its first patterned trigger causes (-1 if none), probability, delay range."""
+    code = np.full(len(MENU), -1)
+    prob = np.zeros(len(MENU))
+    low = np.zeros(len(MENU))
+    high = np.zeros(len(MENU))
+    for i, (_, triggers) in enumerate(MENU):
+        for trigger in triggers.split(", "):
+            if trigger in patterns:
+                name, probability, (lo, hi) = patterns[trigger]
+                code[i], prob[i], low[i], high[i] = symptom_names.index(name), probability, lo, hi
+                break
+    return code, prob, low, high
+
+
+def generate(users: int, meals: int, symptoms: int, days: int = 365, seed: int = 0,
+             patterns=PATTERNS, start: datetime = datetime(2024, 1, 1)) -> dict:
+    """Column arrays for ``users`` x ``meals`` meals and ``users`` x ``symptoms`` symptoms.
+
+    User ids run 1..users. Returns {"meals": {column: array}, "symptoms": {...}}.
+    """
+    rng = np.random.default_rng(seed)
+    span = days * 86400
+    origin = np.datetime64(start, "s")
+    symptom_names = sorted(set(BACKGROUND_SYMPTOMS) | {p[0] for p in patterns.values()})
+
+    n_meals = users * meals
+    meal_user = np.repeat(np.arange(1, users + 1), meals)
+    meal_offset = rng.integers(0, span, n_meals)
+    menu = rng.integers(0, len(MENU), n_meals)
+    foods = np.array([m[0] for m in MENU], dtype=object)
+    triggers = np.array([m[1] for m in MENU], dtype=object)
+
+    # Each symptom picks one of its user's meals; if that meal carries a patterned
+    # trigger and the pattern fires, the symptom follows it after the pattern's delay
+    n_symptoms = users * symptoms
+    symptom_user = np.repeat(np.arange(1, users + 1), symptoms)
+    source = (symptom_user - 1) * meals + rng.integers(0, max(meals, 1), n_symptoms)
+    code, prob, low, high = _menu_patterns(patterns, symptom_names)
+    if meals:
+        src_menu, src_offset = menu[source], meal_offset[source]
+        patterned = (code[src_menu] >= 0) & (rng.random(n_symptoms) < prob[src_menu])
+    else:
+        src_menu, src_offset = np.zeros(n_symptoms, dtype=np.int64), np.zeros(n_symptoms, dtype=np.int64)
+        patterned = np.zeros(n_symptoms, dtype=bool)
+    delay = (low[src_menu] + rng.random(n_symptoms) * (high[src_menu] - low[src_menu])) * 3600
+    noise_code = rng.integers(0, len(symptom_names), n_symptoms)
+    noise_offset = rng.integers(0, span, n_symptoms)
+    symptom_code = np.where(patterned, code[src_menu], noise_code)
+    symptom_offset = np.where(patterned, src_offset + delay.astype(np.int64), noise_offset)
+    severity = np.where(patterned, rng.integers(3, 9, n_symptoms), rng.integers(1, 6, n_symptoms))
+
+    return {
+        "meals": {
+            "user_id": meal_user,
+            "image_url": np.full(n_meals, "https://via.placeholder.com/150", dtype=object),
+            "identified_foods": foods[menu],
+            "protein": np.round(rng.uniform(5, 40, n_meals), 1),
+            "carbs": np.round(rng.uniform(10, 90, n_meals), 1),
+            "fat": np.round(rng.uniform(2, 35, n_meals), 1),
+            "triggers": triggers[menu],
+            "status": np.full(n_meals, "complete", dtype=object),
+            "created_at": origin + meal_offset.astype("timedelta64[s]"),
+        },
+        "symptoms": {
+            "user_id": symptom_user,
+            "symptom_name": np.array(symptom_names, dtype=object)[symptom_code],
+            "severity": severity,
+            "notes": np.full(n_symptoms, None, dtype=object),
+            "created_at": origin + symptom_offset.astype("timedelta64[s]"),
+        },
+    }
+
+
+def _column_lists(columns: dict, names, start: int, stop: int):
+    out = []
+    for name in names:
+        values = columns[name][start:stop]
+        out.append(values.astype("datetime64[us]").tolist() if values.dtype.kind == "M" else values.tolist())
+    return out
+
+
+def rows(columns: dict) -> list:
+    """One table's column arrays from ``generate`` as row dicts, e.g. for ORM inserts."""
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*_column_lists(columns, names, 0, len(columns[names[0]])))]
+
+
+def _copy(raw, table: str, columns: dict, names, chunk_rows: int):
+    total = len(columns[names[0]])
+    with raw.cursor() as cursor:
+        for start in range(0, total, chunk_rows):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            lists = _column_lists(columns, names, start, start + chunk_rows)
+            # None -> empty unquoted field, which COPY csv reads as NULL
+            writer.writerows(zip(*lists))
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {table} ({', '.join(names)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def _executemany(conn, table, columns: dict, names, chunk_rows: int):
+    total = len(columns[names[0]])
+    for start in range(0, total, chunk_rows):
+        lists = _column_lists(columns, names, start, start + chunk_rows)
+        conn.execute(insert(table), [dict(zip(names, row)) for row in zip(*lists)])
+
+
+def write(engine, data: dict, users: int, chunk_rows: int = 50000, use_copy: bool = None):
+    """Insert the demo users and generated rows in one transaction."""
+    if use_copy is None:
+        use_copy = engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2"
+    with engine.begin() as conn:
+        existing = set(conn.execute(select(models.User.id).where(models.User.id <= users)).scalars())
+        new_users = [
+            {"id": uid, "email": f"user{uid}@synthetic.test", "name": f"Synthetic {uid}"}
+            for uid in range(1, users + 1) if uid not in existing
+        ]
+        if new_users:
+            conn.execute(insert(models.User.__table__), new_users)
+        if use_copy:
+            raw = conn.connection.dbapi_connection
+            _copy(raw, "meals", data["meals"], MEAL_COLUMNS, chunk_rows)
+            _copy(raw, "symptoms", data["symptoms"], SYMPTOM_COLUMNS, chunk_rows)
+        else:
+            _executemany(conn, models.Meal.__table__, data["meals"], MEAL_COLUMNS, chunk_rows)
+            _executemany(conn, models.Symptom.__table__, data["symptoms"], SYMPTOM_COLUMNS, chunk_rows)
+        if engine.dialect.name == "postgresql":
+            # Explicit user ids leave the sequence behind; move it past them
+            conn.exec_driver_sql("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT MAX(id) FROM users))")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--meals", type=int, default=1000, help="Meals per user")
+    parser.add_argument("--symptoms", type=int, default=400, help="Symptoms per user")
+    parser.add_argument("--days", type=int, default=365, help="History length")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--patterns", help='JSON: {"Trigger": ["Symptom", probability, [min_hours, max_hours]]}')
+    parser.add_argument("--chunk-rows", type=int, default=50000)
+    parser.add_argument("--no-copy", action="store_true", help="Use executemany even on Postgres")
+    parser.add_argument("--keep", action="store_true", help="Don't wipe existing tables first")
+    args = parser.parse_args(argv)
+
+    patterns = json.loads(args.patterns) if args.patterns else PATTERNS
+    engine = database.get_engine()
+    if not args.keep:
+        print("⚠️  Wiping database...")
+        models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+
+    start = time.perf_counter()
+    data = generate(args.users, args.meals, args.symptoms, args.days, args.seed, patterns)
+    generated = time.perf_counter()
+    write(engine, data, args.users, args.chunk_rows, use_copy=False if args.no_copy else None)
+    done = time.perf_counter()
+
+    rows = args.users * (args.meals + args.symptoms)
+    print(f"🌱 {rows:,} rows for {args.users:,} users: generated in {generated - start:.2f}s, "
+          f"written in {done - generated:.2f}s ({rows / max(done - generated, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
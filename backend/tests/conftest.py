@@ -1,5 +1,9 @@
 import pytest
+import socket
+import threading
+import time
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
 import sys
@@ -9,13 +13,29 @@ from pathlib import Path
 backend_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(backend_dir))
 
+import cache
 import database
 import models
+import pipeline
 from main import app
 
 # Use SQLite for tests (fast, in-memory)
 SQLALCHEMY_TEST_URL = "sqlite:///./test.db"
 
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    """Give every test an empty dashboard cache"""
+    cache.set_backend(cache.MemoryBackend())
+    yield
+    cache.set_backend(cache.MemoryBackend())
+
+@pytest.fixture(autouse=True)
+def fresh_router():
+    """Close every inference circuit breaker and forget latencies between tests"""
+    pipeline.ROUTER.reset()
+    yield
+    pipeline.ROUTER.reset()
+
 @pytest.fixture
 def test_db():
     """Create a test database for each test"""
@@ -29,15 +49,7 @@ def test_db():
         db.close()
         models.Base.metadata.drop_all(bind=engine)
 
-@pytest.fixture
-def client(test_db, monkeypatch):
-    """Create a test client with mocked inference and database"""
-    def override_get_db():
-        try:
-            yield test_db
-        finally:
-            pass
-
+def _mock_services(monkeypatch):
     # Mock inference to avoid loading model
     def mock_predict(image_bytes):
         return {
@@ -48,16 +60,94 @@ def client(test_db, monkeypatch):
             ]
         }
 
-    monkeypatch.setattr("main.run_inference", mock_predict)
+    monkeypatch.setattr("pipeline.run_inference", mock_predict)
+    monkeypatch.setattr("pipeline.run_inference_batch", lambda images: [mock_predict(b) for b in images])
     
     # Mock Gemini
     def mock_get_triggers(food_label, image_bytes):
         return "Gluten, Soy"
     
     monkeypatch.setattr("gemini_utils.get_food_triggers", mock_get_triggers)
+
+@pytest.fixture
+def client(test_db, monkeypatch):
+    """Create a test client with mocked inference and database"""
+    def override_get_db():
+        try:
+            yield test_db
+        finally:
+            pass
+
+    _mock_services(monkeypatch)
     app.dependency_overrides[database.get_db] = override_get_db
+    app.dependency_overrides[database.get_read_db] = override_get_db
 
     with TestClient(app) as c:
         yield c
 
     app.dependency_overrides.clear()
+
+@pytest.fixture
+def async_client(test_db, monkeypatch):
+    """Test client whose requests run on an aiosqlite AsyncSession"""
+    async_engine = database.make_async_engine(SQLALCHEMY_TEST_URL)
+    AsyncTestingSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def override_get_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
+    _mock_services(monkeypatch)
+    app.dependency_overrides[database.get_db] = override_get_db
+    app.dependency_overrides[database.get_read_db] = override_get_db
+
+    with TestClient(app) as c:
+        yield c
+        c.portal.call(async_engine.dispose)
+
+    app.dependency_overrides.clear()
+
+@pytest.fixture
+def replica_client(tmp_path, monkeypatch):
+    """Test client routed through the real read/write router with a second SQLite file as the replica"""
+    primary_url = f"sqlite:///{tmp_path / 'primary.db'}"
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    monkeypatch.setattr(database, "SQLALCHEMY_DATABASE_URL", primary_url)
+    monkeypatch.setattr(database, "REPLICA_DATABASE_URL", replica_url)
+    monkeypatch.setattr(database, "_engines", {})
+    monkeypatch.setattr(database, "_sessionmakers", {})
+    monkeypatch.setattr(database, "_last_write", {})
+    for role in ("primary", "replica"):
+        models.Base.metadata.create_all(bind=database.get_engine(role))
+
+    _mock_services(monkeypatch)
+    with TestClient(app) as c:
+        yield c
+
+    for engine in database._engines.values():
+        engine.dispose()
+
+
+@pytest.fixture
+def fake_services():
+    """Run benchmarks/fake_services.py on a local port; yields (base_url, module)"""
+    import uvicorn
+    sys.path.insert(0, str(backend_dir / "benchmarks"))
+    import fake_services as fakes
+
+    fakes.stats.clear()
+    fakes.spans.clear()
+    for name in fakes.behaviour:
+        fakes.behaviour[name] = fakes.Behaviour(seed=0)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(fakes.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}", fakes
+    server.should_exit = True
+    thread.join(timeout=5)
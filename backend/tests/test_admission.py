@@ -0,0 +1,119 @@
+import asyncio
+import io
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import admission
+import database
+import models
+import pipeline
+from main import app
+
+
+def test_limiter_queues_then_sheds():
+    """Test requests past the limit queue, and past the queue are shed"""
+    limiter = admission.Limiter("test", limit=2, queue_size=1, timeout=1.0)
+    order = []
+
+    async def job(name, hold):
+        try:
+            async with limiter.slot():
+                order.append(name)
+                await asyncio.sleep(hold)
+        except admission.Overloaded as exc:
+            order.append(f"{name}:{exc.reason}:{exc.retry_after}")
+
+    async def scenario():
+        tasks = [asyncio.create_task(job(name, 0.05)) for name in "abcd"]
+        await asyncio.sleep(0)
+        assert (limiter.active, limiter.waiting()) == (2, 1)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    # a and b run, c waits for a slot, d finds the queue full
+    assert order[:3] == ["a", "b", "d:queue_full:1"]
+    assert order[3] == "c"
+    assert (limiter.active, limiter.waiting()) == (0, 0)
+
+
+def test_limiter_wait_times_out():
+    """Test a queued request is shed when its wait times out"""
+    limiter = admission.Limiter("test", limit=1, queue_size=5, timeout=0.05)
+
+    async def scenario():
+        async with limiter.slot():
+            with pytest.raises(admission.Overloaded, match="timeout"):
+                async with limiter.slot():
+                    pass
+        async with limiter.slot():
+            return limiter.active
+
+    assert asyncio.run(scenario()) == 1
+    assert limiter.active == 0
+
+
+def test_overload_sheds_uploads_but_not_reads(client, test_db, monkeypatch):
+    """Test saturated uploads get 503s while dashboard reads stay fast"""
+    test_db.add(models.User(id=1, email="demo@test.com", name="Demo"))
+    test_db.commit()
+    # A session per request, like production, so overlapping requests don't share one
+    Session = sessionmaker(bind=test_db.get_bind())
+
+    def per_request_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[database.get_db] = per_request_db
+    app.dependency_overrides[database.get_read_db] = per_request_db
+
+    async def slow_pipeline(image_bytes):
+        # A stalled Vertex/Gemini call that also holds a threadpool thread
+        await run_in_threadpool(time.sleep, 0.4)
+        return {"identified_foods": "Ramen", "triggers": "Gluten", "protein": 10.0, "carbs": 40.0, "fat": 15.0}
+
+    monkeypatch.setattr(pipeline, "process_image", slow_pipeline)
+    monkeypatch.setattr(admission.UPLOADS, "limit", 2)
+    monkeypatch.setattr(admission.UPLOADS, "queue_size", 2)
+    monkeypatch.setattr(admission.UPLOADS, "timeout", 5.0)
+    shed_before = admission.ADMISSION_SHED.value(pool="uploads", reason="queue_full")
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            async def upload():
+                files = {"file": ("meal.jpg", io.BytesIO(b"fake image"), "image/jpeg")}
+                return await http.post("/log/food", files=files)
+
+            async def read():
+                start = time.perf_counter()
+                response = await http.get("/dashboard/recent")
+                return response.status_code, time.perf_counter() - start
+
+            uploads = [asyncio.create_task(upload()) for _ in range(10)]
+            await asyncio.sleep(0.05)
+            reads = await asyncio.gather(*(read() for _ in range(5)))
+            return await asyncio.gather(*uploads), reads
+
+    uploads, reads = asyncio.run(scenario())
+    statuses = sorted(r.status_code for r in uploads)
+    assert statuses == [200] * 4 + [503] * 6
+    shed = next(r for r in uploads if r.status_code == 503)
+    assert int(shed.headers["retry-after"]) >= 1
+    assert admission.ADMISSION_SHED.value(pool="uploads", reason="queue_full") == shed_before + 6
+
+    # Reads are served while the admitted uploads are still stuck
+    assert all(status == 200 for status, _ in reads)
+    assert max(seconds for _, seconds in reads) < 0.3
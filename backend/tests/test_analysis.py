@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+import sys
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import analysis
+import models
+import seed_example
+
+
+def _history(meals, symptoms):
+    return analysis.build_history(
+        [m[0] for m in meals], [m[1] for m in meals],
+        [s[0] for s in symptoms], [s[1] for s in symptoms],
+    )
+
+
+def test_followed_by_window_edges():
+    """Test outcome flags use (meal, meal + lag] per symptom type"""
+    t = datetime(2024, 1, 1, 12)
+    history = _history(
+        [(t, "Lactose"), (t + timedelta(hours=10), "None")],
+        [(t + timedelta(hours=2), "Bloating"), (t, "Headache"), (t + timedelta(hours=13), "Headache")],
+    )
+    assert history.symptom_names == ["Bloating", "Headache"]
+    flags = analysis.followed_by(history, [2, 3])
+    # lag 2h: first meal -> Bloating at exactly +2h, not Headache at +0h
+    assert flags[0].tolist() == [[1, 0], [0, 0]]
+    assert flags[1].tolist() == [[1, 0], [0, 1]]
+
+
+def test_associations_match_hand_counts():
+    """Test lift and odds ratio against a hand-computed 2x2 table"""
+    t = datetime(2024, 1, 1)
+    meals, symptoms = [], []
+    for day in range(10):
+        when = t + timedelta(days=day)
+        dairy = day < 4
+        meals.append((when, "Lactose" if dairy else "None"))
+        # Every dairy meal and one of the six others is followed by bloating
+        if dairy or day == 9:
+            symptoms.append((when + timedelta(hours=1), "Bloating"))
+
+    rows = analysis.associations(_history(meals, symptoms), lags_hours=[2], min_meals=3)
+    assert len(rows) == 1
+    row = rows[0]
+    assert (row["trigger"], row["symptom"], row["meals_with_trigger"], row["followed_by_symptom"]) == ("Lactose", "Bloating", 4, 4)
+    # P(bloat | lactose) = 1, P(bloat) = 5/10
+    assert row["lift"] == 2.0
+    # a=4, b=0, c=1, d=5 with +0.5 correction
+    assert row["odds_ratio"] == round((4.5 * 5.5) / (0.5 * 1.5), 4)
+
+
+def test_associations_recover_generated_patterns():
+    """Test the synthetic generator's trigger -> symptom patterns come out on top"""
+    meals, symptoms = seed_example.generate_history(days=365, seed=1)
+    history = analysis.build_history(
+        [m["created_at"] for m in meals], [m["triggers"] for m in meals],
+        [s["created_at"] for s in symptoms], [s["symptom_name"] for s in symptoms],
+    )
+    rows = analysis.associations(history, lags_hours=[6])
+    best = {}
+    for row in rows:
+        best.setdefault(row["trigger"], row)
+    assert best["Spicy Food"]["symptom"] == "Heartburn"
+    assert best["Lactose"]["symptom"] == "Bloating"
+    assert best["Spicy Food"]["lift"] > 2
+
+
+def test_associations_empty_history():
+    assert analysis.associations(_history([], [])) == []
+
+
+def test_associations_endpoint(client, test_db):
+    """Test the endpoint reads the user's history and validates lags"""
+    test_db.add(models.User(id=1, email="test@test.com", name="Test User"))
+    t = datetime(2024, 1, 1)
+    for day in range(5):
+        test_db.add(models.Meal(image_url="x", identified_foods="pizza", protein=1, carbs=1, fat=1,
+                                triggers="Gluten, Lactose", user_id=1, created_at=t + timedelta(days=day)))
+        test_db.add(models.Symptom(symptom_name="Bloating", severity=5, user_id=1,
+                                   created_at=t + timedelta(days=day, hours=3)))
+    test_db.commit()
+
+    data = client.get("/dashboard/associations", params={"lags": "1,4"}).json()
+    assert {(r["trigger"], r["lag_hours"]) for r in data} == {("Gluten", 4.0), ("Lactose", 4.0)}
+    assert client.get("/dashboard/associations", params={"lags": "abc"}).status_code == 400
+    for lags in ("inf", "nan", "1e30", "0", "-2", f"{24 * 14 + 1}"):
+        assert client.get("/dashboard/associations", params={"lags": lags}).status_code == 400
+    assert client.get("/dashboard/associations", params={"min_meals": -1}).status_code == 400
+
+
+def test_window_trigger_counts_match_per_symptom_scan():
+    """Test the vectorized window counts equal the old per-symptom query loop"""
+    meals, symptoms = seed_example.generate_history(days=60, seed=3)
+    meal_times = [m["created_at"] for m in meals]
+    meal_triggers = [m["triggers"] for m in meals]
+    symptom_times = [s["created_at"] for s in symptoms]
+    # Boundary cases: a symptom exactly 6h after a meal, and one at the same instant
+    symptom_times += [meal_times[5] + timedelta(hours=6), meal_times[9]]
+
+    expected = {}
+    for when in symptom_times:
+        for eaten, triggers in zip(meal_times, meal_triggers):
+            if when - timedelta(hours=6) <= eaten <= when:
+                for part in analysis.split_triggers(triggers):
+                    expected[part] = expected.get(part, 0) + 1
+
+    assert analysis.window_trigger_counts(meal_times, meal_triggers, symptom_times, window_hours=6) == expected
+
+
+def test_split_triggers():
+    """Test trigger strings split into names, with empty and 'None' meaning no triggers"""
+    assert analysis.split_triggers("Gluten,  Soy") == ["Gluten", "Soy"]
+    assert analysis.split_triggers("None") == []
+    assert analysis.split_triggers(None) == []
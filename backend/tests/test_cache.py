@@ -0,0 +1,66 @@
+from pathlib import Path
+import sys
+
+import pytest
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import cache
+
+
+def test_memory_backend_lru_and_ttl(monkeypatch):
+    """Test entries expire after their TTL and the LRU bound evicts oldest first"""
+    backend = cache.MemoryBackend(max_entries=2)
+    backend.set("a", b"1")
+    backend.set("b", b"2")
+    backend.get("a")
+    backend.set("c", b"3")
+    assert backend.get("b") is None
+    assert backend.get("a") == b"1"
+
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    backend.set("ttl", b"x", ttl=10)
+    now[0] += 11
+    assert backend.get("ttl") is None
+
+
+def test_local_redis_speaks_redis_commands():
+    """Test the stand-in honours SET NX and INCR like redis-py"""
+    client = cache.LocalRedis()
+    assert client.set("k", 5, nx=True) is True
+    assert client.set("k", 9, nx=True) is None
+    assert client.get("k") == b"5"
+    assert client.incr("k") == 6
+    assert client.get("k") == b"6"
+
+
+def test_invalidate_bumps_version_on_every_backend():
+    """Test version counters move forward on both pluggable backends"""
+    for backend in (cache.MemoryBackend(), cache.RedisBackend(cache.LocalRedis())):
+        cache.set_backend(backend)
+        before = cache.user_version(7)
+        assert cache.user_version(7) == before
+        cache.invalidate_user(7)
+        assert cache.user_version(7) == before + 1
+        # Other users are unaffected
+        assert cache.user_version(8) != before + 1
+
+
+def test_etag_matching():
+    """Test If-None-Match accepts lists, weak validators and *"""
+    assert cache._etag_matches('"1-5"', '"1-5"')
+    assert cache._etag_matches('"1-4", W/"1-5"', '"1-5"')
+    assert cache._etag_matches("*", '"1-5"')
+    assert not cache._etag_matches('"1-4"', '"1-5"')
+
+
+def test_per_process_backends_refused_with_several_workers():
+    """Test only a shared backend (or none) is accepted when WEB_CONCURRENCY > 1"""
+    for name in ("memory", "local-redis"):
+        with pytest.raises(RuntimeError, match="CACHE_BACKEND=redis"):
+            cache._build_backend(name, workers=4)
+    assert cache._build_backend("none", workers=4) is None
+    assert isinstance(cache._build_backend("memory", workers=1), cache.MemoryBackend)
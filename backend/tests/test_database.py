@@ -0,0 +1,119 @@
+import contextlib
+from pathlib import Path
+import sys
+
+import pytest
+from sqlalchemy import create_engine, exc
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import database
+
+
+def test_async_url_maps_drivers():
+    """Test sync URLs are mapped onto their asyncio drivers"""
+    assert database.async_url("sqlite:///./test.db") == "sqlite+aiosqlite:///./test.db"
+    assert database.async_url("postgresql://u:p@db:5432/x") == "postgresql+asyncpg://u:p@db:5432/x"
+    assert database.async_url("postgresql+psycopg2://u:p@db/x") == "postgresql+asyncpg://u:p@db/x"
+    assert database.async_url("postgresql+asyncpg://u:p@db/x") == "postgresql+asyncpg://u:p@db/x"
+
+
+def test_async_url_rejects_unknown_driver():
+    """Test unknown dialects fail loudly instead of silently staying sync"""
+    with pytest.raises(ValueError):
+        database.async_url("mysql://u:p@db/x")
+
+
+class _FlakyEngine:
+    """Engine stand-in whose connect() fails a set number of times"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.attempts = 0
+
+    def connect(self):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("db not ready")
+        return contextlib.nullcontext()
+
+
+def test_wait_for_database_backs_off_exponentially():
+    """Test startup retries grow their delay instead of sleeping a fixed 2s"""
+    engine = _FlakyEngine(failures=4)
+    delays = []
+    database.wait_for_database(engine, deadline=60, max_delay=8, sleep=delays.append)
+    assert engine.attempts == 5
+    assert len(delays) == 4
+    # Jitter keeps each delay within [0.5, 1.0] of the doubling schedule
+    for attempt, delay in enumerate(delays):
+        assert 0.25 * 2 ** attempt * 0.5 <= delay <= 0.25 * 2 ** attempt
+
+
+def test_wait_for_database_gives_up_at_deadline():
+    """Test an unreachable database raises instead of looping forever"""
+    engine = _FlakyEngine(failures=10**6)
+    with pytest.raises(RuntimeError, match="Database unavailable"):
+        database.wait_for_database(engine, deadline=0.0, sleep=lambda s: None)
+    assert engine.attempts == 1
+
+
+def test_pool_metrics_track_checkouts(tmp_path):
+    """Test pool stats report checkouts and current occupancy"""
+    engine = database.make_engine(f"sqlite:///{tmp_path / 'pool.db'}", name="test-checkouts")
+    with engine.connect():
+        stats = database.POOL_METRICS["test-checkouts"].snapshot(engine.pool)
+        assert stats["checkouts"] == 1
+        assert stats["checked_out"] == 1
+    engine.dispose()
+
+
+def test_pool_metrics_count_timeouts(tmp_path):
+    """Test a saturated pool records the checkout timeout"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=database.TimedQueuePool,
+        pool_logging_name="test-timeouts",
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    with engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+    stats = database.POOL_METRICS["test-timeouts"].snapshot(engine.pool)
+    assert stats["timeouts"] == 1
+    assert stats["wait_seconds_max"] >= 0.05
+    engine.dispose()
+
+
+def test_postgres_engine_options(monkeypatch):
+    """Test pool sizing and statement timeout are passed through for Postgres"""
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 20)
+    monkeypatch.setattr(database, "DB_STATEMENT_TIMEOUT_MS", 5000)
+    options = database.engine_options("postgresql://u:p@db/x", "primary")
+    assert options["pool_size"] == 20
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"] == {"options": "-c statement_timeout=5000"}
+
+    async_options = database.engine_options("postgresql+asyncpg://u:p@db/x", "primary-async")
+    assert async_options["poolclass"] is database.TimedAsyncQueuePool
+    assert async_options["connect_args"] == {"server_settings": {"statement_timeout": "5000"}}
+
+
+def test_read_role_without_replica(monkeypatch):
+    """Test reads stay on the primary when no replica is configured"""
+    monkeypatch.setattr(database, "REPLICA_DATABASE_URL", None)
+    assert database.read_role(1) == "primary"
+
+
+def test_read_role_pins_recent_writers(monkeypatch):
+    """Test read-your-writes only affects the user who wrote"""
+    monkeypatch.setattr(database, "REPLICA_DATABASE_URL", "sqlite:///replica.db")
+    monkeypatch.setattr(database, "DB_READ_YOUR_WRITES_SECONDS", 30)
+    monkeypatch.setattr(database, "_last_write", {})
+    database.record_write(1)
+    assert database.read_role(1) == "primary"
+    assert database.read_role(2) == "replica"
@@ -0,0 +1,92 @@
+import asyncio
+import json
+from pathlib import Path
+import sys
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import events
+
+
+def _parse(frame):
+    fields = dict(line.split(": ", 1) for line in frame.strip().splitlines())
+    return fields["id"], fields["event"], json.loads(fields["data"])
+
+
+async def _take(stream, n):
+    return [await stream.__anext__() for _ in range(n)]
+
+
+def test_live_events_and_heartbeat():
+    """Test subscribers receive published deltas and heartbeats while idle"""
+    async def scenario():
+        broker = events.EventBroker()
+        stream = broker.stream(1, heartbeat=0.01)
+        assert (await stream.__anext__()).startswith("retry:")
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        broker.publish(1, "symptom", {"op": "created", "id": 3})
+        broker.publish(2, "symptom", {"op": "created", "id": 4})  # other user
+        _, event, data = _parse(await pending)
+        assert event == "symptom" and data == {"op": "created", "id": 3}
+        assert await stream.__anext__() == ": ping\n\n"
+        assert broker.connections() == 1
+        await stream.aclose()
+        assert broker.connections() == 0
+
+    asyncio.run(scenario())
+
+
+def test_resume_from_last_event_id():
+    """Test reconnecting clients get only the events they missed"""
+    async def scenario():
+        broker = events.EventBroker()
+        for i in range(3):
+            broker.publish(1, "meal", {"op": "created", "id": i})
+        first_id = f"{broker.boot}-1"
+        stream = broker.stream(1, last_event_id=first_id)
+        frames = await _take(stream, 3)
+        assert [_parse(f)[2]["id"] for f in frames[1:]] == [1, 2]
+        await stream.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_unknown_resume_point_sends_reset():
+    """Test ids from another process or beyond the replay ring trigger a reset"""
+    async def scenario():
+        broker = events.EventBroker(replay_size=2)
+        for i in range(5):
+            broker.publish(1, "meal", {"op": "created", "id": i})
+        for last_id in ("deadbeef-1", f"{broker.boot}-1"):
+            stream = broker.stream(1, last_event_id=last_id)
+            frames = await _take(stream, 2)
+            assert _parse(frames[1])[1] == "reset"
+            await stream.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_slow_consumer_is_disconnected():
+    """Test a full per-connection buffer closes the stream instead of growing"""
+    async def scenario():
+        broker = events.EventBroker(buffer_size=2)
+        stream = broker.stream(1, heartbeat=10)
+        await stream.__anext__()
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        for i in range(5):
+            broker.publish(1, "meal", {"op": "created", "id": i})
+        # The reader never got scheduled, so its backlog overflowed and the stream ends
+        try:
+            await pending
+            raise AssertionError("stream should have ended")
+        except StopAsyncIteration:
+            pass
+        assert broker.connections() == 0
+        # The events stay in the replay ring for the reconnect
+        assert len(broker._history[1]) == 5
+
+    asyncio.run(scenario())
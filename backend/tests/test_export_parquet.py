@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+import sys
+
+import pytest
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+import export_parquet
+import models
+
+
+def _add_meals(db, start_day, days):
+    base = datetime(2024, 3, 1, 9)
+    for day in range(start_day, start_day + days):
+        db.add(models.Meal(image_url="x", identified_foods=f"meal {day}", protein=1, carbs=2, fat=3,
+                           triggers="Gluten, Lactose" if day % 2 else "None", user_id=1,
+                           created_at=base + timedelta(days=day)))
+    db.commit()
+
+
+def test_export_is_partitioned_and_resumable(test_db, tmp_path):
+    """Test rows land in date partitions and a second run only exports new rows"""
+    test_db.add(models.User(id=1, email="test@test.com", name="Test User"))
+    _add_meals(test_db, 0, 4)
+
+    assert export_parquet.export_table(test_db, "meals", tmp_path, chunk_rows=3) == 4
+    partitions = sorted(p.name for p in (tmp_path / "meals").iterdir())
+    assert partitions == ["date=2024-03-01", "date=2024-03-02", "date=2024-03-03", "date=2024-03-04"]
+    assert export_parquet.load_watermarks(tmp_path)["meals"]["rows"] == 4
+
+    table = pq.read_table(tmp_path / "meals" / "date=2024-03-02")
+    assert table.column("triggers").to_pylist() == [["Gluten", "Lactose"]]
+
+    # Nothing new: nothing written
+    assert export_parquet.export_table(test_db, "meals", tmp_path) == 0
+
+    _add_meals(test_db, 4, 2)
+    assert export_parquet.export_table(test_db, "meals", tmp_path) == 2
+    marks = export_parquet.load_watermarks(tmp_path)["meals"]
+    assert marks["rows"] == 6
+    all_rows = pq.read_table(tmp_path / "meals").to_pylist()
+    assert sorted(r["id"] for r in all_rows) == list(range(1, 7))
+
+
+def test_pending_meal_is_exported_once_complete(test_db, tmp_path):
+    """Test a meal still processing holds the watermark and is exported after it completes"""
+    test_db.add(models.User(id=1, email="test@test.com", name="Test User"))
+    _add_meals(test_db, 0, 1)
+    pending = models.Meal(image_url="x", identified_foods="Processing...", status="pending", user_id=1,
+                          created_at=datetime(2024, 3, 2, 9))
+    failed = models.Meal(image_url="x", identified_foods="Processing failed", status="failed", user_id=1,
+                         created_at=datetime(2024, 3, 2, 10))
+    test_db.add_all([pending, failed])
+    test_db.commit()
+    _add_meals(test_db, 2, 1)
+
+    # Only the meal below the pending one is final
+    assert export_parquet.export_table(test_db, "meals", tmp_path) == 1
+    assert export_parquet.load_watermarks(tmp_path)["meals"]["last_id"] == pending.id - 1
+
+    pending.identified_foods, pending.triggers, pending.status = "ramen", "Gluten", "complete"
+    test_db.commit()
+    assert export_parquet.export_table(test_db, "meals", tmp_path) == 2
+    rows = pq.read_table(tmp_path / "meals").to_pylist()
+    assert {r["identified_foods"] for r in rows} == {"meal 0", "ramen", "meal 2"}
+    assert all(r["status"] == "complete" for r in rows)
+    assert export_parquet.load_watermarks(tmp_path)["meals"]["last_id"] == 4
+
+
+def test_recent_rows_wait_to_settle(test_db, tmp_path):
+    """Test rows newer than the settle window are left for the next run"""
+    test_db.add(models.User(id=1, email="test@test.com", name="Test User"))
+    test_db.add(models.Symptom(symptom_name="Bloating", severity=3, user_id=1))
+    test_db.commit()
+
+    assert export_parquet.export_table(test_db, "symptoms", tmp_path, settle_seconds=300) == 0
+    assert export_parquet.export_table(test_db, "symptoms", tmp_path, settle_seconds=0) == 1
+
+
+def test_crash_before_watermark_does_not_duplicate_rows(test_db, tmp_path, monkeypatch):
+    """Test files written by a run that died before saving its watermark are replaced, not kept"""
+    test_db.add(models.User(id=1, email="test@test.com", name="Test User"))
+    _add_meals(test_db, 0, 2)
+
+    def crash(out_dir, marks):
+        raise RuntimeError("killed")
+
+    monkeypatch.setattr(export_parquet, "save_watermarks", crash)
+    with pytest.raises(RuntimeError):
+        export_parquet.export_table(test_db, "meals", tmp_path)
+    monkeypatch.undo()
+
+    # The rerun chunks differently: a new row lands in an already written day
+    test_db.add(models.Meal(image_url="x", identified_foods="late", user_id=1, created_at=datetime(2024, 3, 1, 20)))
+    test_db.commit()
+    assert export_parquet.export_table(test_db, "meals", tmp_path) == 3
+    ids = [r["id"] for r in pq.read_table(tmp_path / "meals").to_pylist()]
+    assert sorted(ids) == [1, 2, 3]
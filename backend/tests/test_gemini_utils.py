@@ -16,10 +16,21 @@ def test_get_food_triggers_success():
     mock_model = MagicMock()
     mock_model.generate_content.return_value = mock_response
     
-    # Mock GenerativeModel constructor
-    with patch("gemini_utils.GenerativeModel", return_value=mock_model):
-        # Also need to mock _init_vertex or vertexai.init to avoid errors if env vars missing
-        with patch("gemini_utils.vertexai.init"):
-            triggers = gemini_utils.get_food_triggers("ramen", b"fake_image")
-            assert triggers == "Gluten, Soy"
+    # A model already built skips the SDK import and vertexai.init
+    with patch("gemini_utils._model", mock_model):
+        triggers = gemini_utils.get_food_triggers("ramen", b"fake_image")
+        assert triggers == "Gluten, Soy"
 
+
+
+def test_get_food_triggers_rest_endpoint(fake_services, monkeypatch):
+    """Test GEMINI_API_BASE sends generateContent over REST instead of the SDK"""
+    url, fakes = fake_services
+    monkeypatch.setattr(gemini_utils, "GEMINI_API_BASE", url)
+    with patch("gemini_utils._init_vertex") as sdk:
+        assert gemini_utils.get_food_triggers("Caesar Salad", b"img") == "Lactose"
+        sdk.assert_not_called()
+    assert fakes.stats["gemini"] == 1
+
+    fakes.behaviour["gemini"].error_rate = 1.0
+    assert gemini_utils.get_food_triggers("Caesar Salad", b"img") == "Error analyzing triggers"
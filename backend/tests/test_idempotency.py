@@ -0,0 +1,199 @@
+import asyncio
+import io
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+import pytest
+from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import database
+import idempotency
+import models
+import pipeline
+from main import app
+
+MEAL_VALUES = {"identified_foods": "Ramen", "triggers": "Gluten", "protein": 10.0, "carbs": 40.0, "fat": 15.0}
+
+
+def _upload(client, key=None, data=b"fake image"):
+    headers = {"Idempotency-Key": key} if key else {}
+    return client.post("/log/food", files={"file": ("meal.jpg", io.BytesIO(data), "image/jpeg")}, headers=headers)
+
+
+def _count_pipeline_calls(monkeypatch):
+    calls = []
+
+    async def counting_pipeline(image_bytes):
+        calls.append(image_bytes)
+        return dict(MEAL_VALUES)
+
+    monkeypatch.setattr(pipeline, "process_image", counting_pipeline)
+    return calls
+
+
+def test_retry_replays_stored_response(client, test_db, monkeypatch):
+    """Test a retried key replays the first response without rerunning the pipeline"""
+    calls = _count_pipeline_calls(monkeypatch)
+    first = _upload(client, "retry-1")
+    second = _upload(client, "retry-1")
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert len(calls) == 1
+    assert test_db.query(models.Meal).count() == 1
+
+
+def test_requests_without_key_are_not_deduplicated(client, test_db, monkeypatch):
+    """Test uploads without an Idempotency-Key each create a meal"""
+    calls = _count_pipeline_calls(monkeypatch)
+    _upload(client)
+    _upload(client)
+    assert len(calls) == 2
+    assert test_db.query(models.Meal).count() == 2
+
+
+def test_key_reused_for_different_upload_is_refused(client, monkeypatch):
+    """Test reusing a key for a different image is refused with 422"""
+    _count_pipeline_calls(monkeypatch)
+    assert _upload(client, "reused", b"first image").status_code == 200
+    response = _upload(client, "reused", b"other image")
+    assert response.status_code == 422
+    assert "different request" in response.json()["detail"]
+
+
+def test_failed_request_releases_key(client, test_db, monkeypatch):
+    """Test a failed request frees its key so the retry runs"""
+    async def failing_pipeline(image_bytes):
+        raise pipeline.PipelineError("Vertex AI inference failed: timeout")
+
+    monkeypatch.setattr(pipeline, "process_image", failing_pipeline)
+    assert _upload(client, "flaky").status_code == 500
+
+    calls = _count_pipeline_calls(monkeypatch)
+    assert _upload(client, "flaky").status_code == 200
+    assert len(calls) == 1
+    assert test_db.query(models.IdempotencyKey).one().status == "complete"
+
+
+def test_key_completes_in_the_meal_commit(client, test_db, monkeypatch):
+    """Test a failure after the meal is saved can't let the retry insert a second one"""
+    calls = _count_pipeline_calls(monkeypatch)
+
+    def crash(user_id):
+        raise RuntimeError("worker died after commit")
+
+    monkeypatch.setattr("main._after_write", crash)
+    with pytest.raises(RuntimeError):
+        _upload(client, "crashy")
+    monkeypatch.undo()
+    calls = _count_pipeline_calls(monkeypatch)
+
+    response = _upload(client, "crashy")
+    assert response.headers["idempotent-replayed"] == "true"
+    assert calls == []
+    assert test_db.query(models.Meal).count() == 1
+
+
+def test_shed_async_upload_frees_its_key(client, test_db, monkeypatch, tmp_path):
+    """Test an async upload shed by a full queue leaves no key behind"""
+    client.portal.call(pipeline.stop_workers)
+    queue = pipeline.MemoryQueue(maxsize=1)
+    pipeline.set_queue(queue)
+    client.portal.call(queue.put, {"meal_id": 0})
+    monkeypatch.setattr(pipeline, "UPLOAD_DIR", tmp_path)
+    try:
+        response = client.post("/log/food?mode=async", files={"file": ("meal.jpg", io.BytesIO(b"fake image"), "image/jpeg")},
+                               headers={"Idempotency-Key": "shed"})
+    finally:
+        pipeline.set_queue(None)
+    assert response.status_code == 503
+    assert test_db.query(models.IdempotencyKey).count() == 0
+
+
+def test_expired_key_runs_again(client, test_db, monkeypatch):
+    """Test a key past its TTL no longer replays"""
+    calls = _count_pipeline_calls(monkeypatch)
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_TTL_SECONDS", -1)
+    _upload(client, "short-lived")
+    response = _upload(client, "short-lived")
+    assert "idempotent-replayed" not in response.headers
+    assert len(calls) == 2
+
+
+def test_batch_retry_replays_results(client, test_db, monkeypatch):
+    """Test a retried batch replays its per-file results"""
+    def files():
+        return [("files", (f"{i}.jpg", io.BytesIO(data), "image/jpeg")) for i, data in enumerate([b"a", b"b", b""])]
+
+    first = client.post("/log/food/batch", files=files(), headers={"Idempotency-Key": "batch-1"})
+    second = client.post("/log/food/batch", files=files(), headers={"Idempotency-Key": "batch-1"})
+    assert first.json()["created"] == 2
+    assert second.json() == first.json()
+    assert second.headers["idempotent-replayed"] == "true"
+    assert test_db.query(models.Meal).count() == 2
+
+
+def test_concurrent_duplicates_wait_for_first(client, test_db, monkeypatch):
+    """Test concurrent duplicates wait for the first request and replay it"""
+    test_db.add(models.User(id=1, email="demo@test.com", name="Demo"))
+    test_db.commit()
+    # A session per request, like production, so overlapping requests don't share one
+    Session = sessionmaker(bind=test_db.get_bind())
+
+    def per_request_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[database.get_db] = per_request_db
+    calls = []
+
+    async def slow_pipeline(image_bytes):
+        calls.append(image_bytes)
+        await run_in_threadpool(time.sleep, 0.3)
+        return dict(MEAL_VALUES)
+
+    monkeypatch.setattr(pipeline, "process_image", slow_pipeline)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            async def upload():
+                files = {"file": ("meal.jpg", io.BytesIO(b"fake image"), "image/jpeg")}
+                return await http.post("/log/food", files=files, headers={"Idempotency-Key": "double-tap"})
+
+            return await asyncio.gather(*(upload() for _ in range(4)))
+
+    responses = asyncio.run(scenario())
+    assert [r.status_code for r in responses] == [200] * 4
+    assert len({r.json()["id"] for r in responses}) == 1
+    assert sum(r.headers.get("idempotent-replayed") == "true" for r in responses) == 3
+    assert len(calls) == 1
+    assert test_db.query(models.Meal).count() == 1
+
+
+def test_in_flight_duplicate_times_out_with_409(client, test_db, monkeypatch):
+    """Test a duplicate gets 409 while the key is held past the wait"""
+    _count_pipeline_calls(monkeypatch)
+    # Another worker holds the key and hasn't finished
+    request_hash = idempotency.fingerprint(pipeline.MEAL_PIPELINE_MODE, b"fake image")
+    test_db.add(models.IdempotencyKey(
+        user_id=1, path="/log/food", key="stuck", request_hash=request_hash,
+        expires_at=datetime.utcnow() + timedelta(seconds=60),
+    ))
+    test_db.commit()
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 0.1)
+    response = _upload(client, "stuck")
+    assert response.status_code == 409
@@ -0,0 +1,46 @@
+"""
+Import cost of the API process, measured in a fresh interpreter with
+`python -X importtime`. Heavy ML/cloud SDKs must stay out of `import main` so
+remote-inference deployments start fast; they load on first local use.
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+backend_dir = Path(__file__).parent.parent
+
+# Loaded lazily by pipeline.run_inference / gemini_utils._init_vertex
+LAZY_MODULES = ("torch", "transformers", "gcsfs", "vertexai", "google.cloud.aiplatform")
+IMPORT_BUDGET_MS = 1500 * float(os.getenv("PERF_BUDGET_SCALE", "1"))
+
+
+def importtime(module: str) -> dict:
+    """Cumulative import time in ms for every module imported by `import <module>`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=backend_dir, env={**os.environ, "TESTING": "1"}, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def test_main_does_not_import_heavy_dependencies():
+    times = importtime("main")
+    assert "main" in times
+    loaded = [name for name in LAZY_MODULES if name in times]
+    assert loaded == [], f"import main pulled in {loaded}"
+
+
+@pytest.mark.perf
+def test_main_import_time_budget():
+    # Best of three, so one slow cold-cache run doesn't fail the suite
+    elapsed = min(importtime("main")["main"] for _ in range(3))
+    assert elapsed < IMPORT_BUDGET_MS, f"import main took {elapsed:.0f}ms (budget {IMPORT_BUDGET_MS:.0f}ms)"
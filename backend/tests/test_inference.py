@@ -77,3 +77,36 @@ def test_predict_error():
     with patch("inference.Image.open", side_effect=Exception("Invalid image")):
         with pytest.raises(Exception):
             predict(b"bad_data")
+
+def test_predict_batch_with_tiny_model():
+    """Test the staged batch path end to end on a randomly initialized ViT"""
+    import io
+    import torch
+    from PIL import Image
+    from transformers import ViTConfig, ViTForImageClassification, ViTImageProcessor
+    import inference
+
+    torch.manual_seed(0)
+    config = ViTConfig(image_size=32, patch_size=16, hidden_size=16, num_hidden_layers=1,
+                       num_attention_heads=2, intermediate_size=32, num_labels=7)
+    config.id2label = {i: f"food_{i}" for i in range(7)}
+    bundle = {
+        "processor": ViTImageProcessor(size={"height": 32, "width": 32}),
+        "model": ViTForImageClassification(config).eval(),
+        "device": torch.device("cpu"),
+        "id2label": config.id2label,
+    }
+    images = []
+    for color in ("red", "blue"):
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 48), color).save(buffer, format="JPEG")
+        images.append(buffer.getvalue())
+
+    with patch("inference.get_bundle", return_value=bundle):
+        results = inference.predict_batch(images)
+        single = inference.predict(images[1])
+
+    assert len(results) == 2
+    assert all(len(r["topk"]) == 5 and r["top1"][0]["label"].startswith("food_") for r in results)
+    assert single["top1"][0]["label"] == results[1]["top1"][0]["label"]
+    assert abs(single["top1"][0]["score"] - results[1]["top1"][0]["score"]) < 1e-5
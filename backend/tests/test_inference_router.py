@@ -0,0 +1,167 @@
+"""
+Inference routing: failover between backends, circuit breakers and hedged
+requests, exercised against the fake Vertex/model services with injected
+latency and errors.
+"""
+import asyncio
+import sys
+import time
+import types
+
+import pytest
+
+import inference_router
+import pipeline
+
+
+@pytest.fixture
+def remote_backends(fake_services, monkeypatch):
+    """Vertex and the model service both pointed at the fakes; local inference off"""
+    url, fakes = fake_services
+    monkeypatch.setenv("VERTEX_ENDPOINT_ID", "projects/p/locations/us-central1/endpoints/1")
+    monkeypatch.setattr(pipeline, "VERTEX_API_BASE", url)
+    monkeypatch.setattr(pipeline, "VERTEX_AUTH", False)
+    monkeypatch.setattr(pipeline, "MODEL_SERVICE_URL", url)
+    monkeypatch.setattr(pipeline, "INFERENCE_LOCAL_FALLBACK", False)
+    return fakes
+
+
+def test_circuit_breaker_opens_then_probes():
+    now = [0.0]
+    breaker = inference_router.CircuitBreaker(failure_threshold=2, reset_seconds=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.allow() and breaker.state == inference_router.CLOSED
+    breaker.record_failure()
+    assert breaker.state == inference_router.OPEN and not breaker.allow()
+
+    now[0] = 10.0
+    assert breaker.allow() and breaker.state == inference_router.HALF_OPEN
+    # Only one probe at a time while half-open
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == inference_router.OPEN and not breaker.allow()
+
+    now[0] = 20.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == inference_router.CLOSED and breaker.allow()
+
+
+def test_hedge_delay_follows_recent_latency():
+    router = inference_router.Router(hedge_min_ms=50, hedge_min_samples=5)
+    assert router.hedge_delay("vertex") == 0.05
+    for seconds in (0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1,
+                    0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.9):
+        router.window("vertex").add(seconds)
+    # p95 of twenty samples ignores the single outlier
+    assert router.hedge_delay("vertex") == 0.1
+
+
+def test_fails_over_to_model_service(remote_backends):
+    fakes = remote_backends
+    fakes.behaviour["vertex"].error_rate = 1.0
+    assert pipeline.inference_backends() == ["vertex", "model_service"]
+
+    predictions = asyncio.run(pipeline.classify_batch([b"a"], [b"a"]))
+    assert predictions[0]["top1"][0]["label"] in fakes.LABELS
+    assert fakes.stats["vertex"] == 1
+    assert fakes.stats["model"] == 1
+
+
+def test_open_circuit_skips_failing_backend(remote_backends, monkeypatch):
+    fakes = remote_backends
+    monkeypatch.setattr(pipeline.ROUTER, "failure_threshold", 2)
+    fakes.behaviour["vertex"].error_rate = 1.0
+    skipped = inference_router.ROUTER_SKIPPED.value(backend="vertex")
+
+    for _ in range(5):
+        asyncio.run(pipeline.classify_batch([b"a"], [b"a"]))
+    assert fakes.stats["vertex"] == 2
+    assert fakes.stats["model"] == 5
+    assert pipeline.ROUTER.states()["vertex"] == inference_router.OPEN
+    assert inference_router.ROUTER_SKIPPED.value(backend="vertex") == skipped + 3
+
+
+def test_all_backends_failing_raises_every_error(remote_backends):
+    fakes = remote_backends
+    fakes.behaviour["vertex"].error_rate = 1.0
+    fakes.behaviour["model"].error_rate = 1.0
+    with pytest.raises(pipeline.PipelineError, match="(?s)Vertex AI inference failed.*Model service failed"):
+        asyncio.run(pipeline.classify_batch([b"a"], [b"a"]))
+
+
+def test_hedge_beats_slow_primary(remote_backends, monkeypatch):
+    fakes = remote_backends
+    monkeypatch.setattr(pipeline.ROUTER, "hedge", True)
+    monkeypatch.setattr(pipeline.ROUTER, "hedge_min_ms", 50)
+    fakes.behaviour["vertex"] = fakes.Behaviour(latency_ms=2000)
+    hedges = inference_router.ROUTER_HEDGES.value(backend="model_service")
+
+    start = time.perf_counter()
+    predictions = asyncio.run(pipeline.classify_batch([b"a"], [b"a"]))
+    elapsed = time.perf_counter() - start
+
+    assert predictions[0]["top1"][0]["label"] in fakes.LABELS
+    assert elapsed < 1.0
+    assert inference_router.ROUTER_HEDGES.value(backend="model_service") == hedges + 1
+    assert fakes.stats["model"] == 1
+    # The cancelled primary is neither a success nor a failure
+    assert pipeline.ROUTER.breaker("vertex").failures == 0
+
+
+def test_no_hedge_when_primary_is_fast(remote_backends, monkeypatch):
+    fakes = remote_backends
+    monkeypatch.setattr(pipeline.ROUTER, "hedge", True)
+    monkeypatch.setattr(pipeline.ROUTER, "hedge_min_ms", 500)
+    fakes.behaviour["vertex"] = fakes.Behaviour(latency_ms=20)
+
+    asyncio.run(pipeline.classify_batch([b"a"], [b"a"]))
+    assert fakes.stats["vertex"] == 1
+    assert fakes.stats["model"] == 0
+
+
+def test_falls_back_to_local_inference(remote_backends, monkeypatch):
+    fakes = remote_backends
+    monkeypatch.setattr(pipeline, "MODEL_SERVICE_URL", None)
+    monkeypatch.setattr(pipeline, "INFERENCE_LOCAL_FALLBACK", True)
+    monkeypatch.setattr(pipeline, "run_inference", lambda image: {"top1": [{"label": "pizza", "score": 0.9}]})
+    fakes.behaviour["vertex"].error_rate = 1.0
+
+    assert pipeline.inference_backends() == ["vertex", "local"]
+    predictions = asyncio.run(pipeline.classify_batch([b"a"], [b"a"]))
+    assert predictions[0]["top1"][0]["label"] == "pizza"
+    assert fakes.stats["vertex"] == 1
+
+
+def test_remote_backends_share_one_http_client(remote_backends):
+    async def two_calls():
+        await pipeline._model_service_predict([b"a"], [b"a"])
+        client = pipeline._http_client
+        await pipeline._vertex_predict([b"a"], [b"a"])
+        assert pipeline._http_client is client and not client.is_closed
+        await pipeline.close_http()
+        assert pipeline._http_client is None and client.is_closed
+
+    asyncio.run(two_calls())
+    assert remote_backends.stats["model"] == 1 and remote_backends.stats["vertex"] == 1
+
+
+def test_explicit_backend_order(monkeypatch):
+    monkeypatch.setattr(pipeline, "INFERENCE_BACKENDS", "model_service, local")
+    assert pipeline.inference_backends() == ["model_service", "local"]
+    monkeypatch.setattr(pipeline, "INFERENCE_BACKENDS", "vertex,gpu")
+    with pytest.raises(ValueError, match="gpu"):
+        pipeline.inference_backends()
+
+
+def test_local_fallback_is_opt_in_and_preloaded(monkeypatch):
+    monkeypatch.setattr(pipeline, "MODEL_SERVICE_URL", "http://model")
+    assert pipeline.inference_backends() == ["model_service"]
+    assert pipeline.warm_local_fallback() is False
+
+    loaded = []
+    monkeypatch.setitem(sys.modules, "inference", types.SimpleNamespace(get_bundle=lambda: loaded.append(True)))
+    monkeypatch.setattr(pipeline, "INFERENCE_LOCAL_FALLBACK", True)
+    assert pipeline.inference_backends() == ["model_service", "local"]
+    assert pipeline.warm_local_fallback() is True
+    assert loaded == [True]
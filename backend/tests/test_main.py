@@ -1,4 +1,5 @@
 import io
+import json
 from pathlib import Path
 import sys
 from datetime import datetime, timedelta
@@ -7,7 +8,11 @@ from datetime import datetime, timedelta
 backend_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(backend_dir))
 
+import cache
+import database
+import events
 import models
+import schemas
 
 
 def test_read_root(client):
@@ -249,3 +254,277 @@ def test_nutrition_lookup(client):
     assert data["carbs"] == 40.0
     assert data["fat"] == 15.0
     assert data["triggers"] == "Gluten, Soy"
+
+
+def test_async_session_dashboard(async_client, test_db):
+    """Test dashboard reads go through an AsyncSession when DB_ASYNC is enabled"""
+    user = models.User(id=1, email="test@test.com", name="Test User")
+    test_db.add(user)
+    test_db.commit()
+    test_db.add(models.Meal(image_url="x", identified_foods="sushi", protein=15, carbs=45, fat=5, user_id=1))
+    test_db.commit()
+
+    response = async_client.get("/dashboard")
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 1
+    assert data[0]["identified_foods"] == "sushi"
+
+
+def test_async_session_log_endpoints(async_client):
+    """Test writes commit through an AsyncSession and are visible to later reads"""
+    files = {"file": ("test.jpg", io.BytesIO(b"fake image data"), "image/jpeg")}
+    response = async_client.post("/log/food", files=files)
+    assert response.status_code == 200
+    assert response.json()["identified_foods"] == "Ramen"
+
+    response = async_client.post("/log/symptom", json={"symptom_name": "Nausea", "severity": 3})
+    assert response.status_code == 200
+    assert response.json()["user_id"] == 1
+
+    recent = async_client.get("/dashboard/recent").json()
+    assert {item["type"] for item in recent} == {"meal", "symptom"}
+
+
+def test_database_health(client):
+    """Test pool stats endpoint responds"""
+    response = client.get("/health/db")
+    assert response.status_code == 200
+    assert "pools" in response.json()
+
+
+def test_dashboard_reads_use_replica(replica_client):
+    """Test read-only endpoints are served by the replica engine"""
+    Replica = database.session_factory("replica")
+    with Replica() as db:
+        db.add(models.User(id=1, email="test@test.com", name="Test User"))
+        db.add(models.Symptom(symptom_name="Replica only", severity=2, user_id=1))
+        db.commit()
+
+    data = replica_client.get("/dashboard/symptoms").json()
+    assert [s["symptom_name"] for s in data] == ["Replica only"]
+
+
+def test_reads_follow_own_writes_to_primary(replica_client, monkeypatch):
+    """Test a user's reads stay on the primary right after they write"""
+    # Bypass the response cache so each read hits an engine
+    cache.set_backend(None)
+    response = replica_client.post("/log/symptom", json={"symptom_name": "Nausea", "severity": 6})
+    assert response.status_code == 200
+
+    # Replica hasn't caught up yet, but read-your-writes pins us to the primary
+    data = replica_client.get("/dashboard/symptoms").json()
+    assert [s["symptom_name"] for s in data] == ["Nausea"]
+
+    # Once the window lapses, reads go back to the (still lagging) replica
+    monkeypatch.setattr(database, "DB_READ_YOUR_WRITES_SECONDS", 0)
+    assert replica_client.get("/dashboard/symptoms").json() == []
+
+
+def test_replica_reads_are_not_cached(replica_client, monkeypatch):
+    """Test bodies built from a lagging replica are neither cached nor given the current ETag"""
+    response = replica_client.post("/log/symptom", json={"symptom_name": "Nausea", "severity": 6})
+    assert response.status_code == 200
+    monkeypatch.setattr(database, "DB_READ_YOUR_WRITES_SECONDS", 0)
+
+    stale = replica_client.get("/dashboard/symptoms")
+    assert stale.json() == []
+    assert "etag" not in stale.headers
+
+    # Back on the primary, the same version must not hit the replica's body
+    monkeypatch.setattr(database, "REPLICA_DATABASE_URL", None)
+    fresh = replica_client.get("/dashboard/symptoms")
+    assert [s["symptom_name"] for s in fresh.json()] == ["Nausea"]
+    assert "etag" in fresh.headers
+
+
+def test_dashboard_wire_format_matches_schemas(client, test_db):
+    """Test column-projected responses serialize exactly like MealOut/SymptomOut"""
+    user = models.User(id=1, email="test@test.com", name="Test User")
+    test_db.add(user)
+    test_db.commit()
+    test_db.add(models.Meal(image_url="x", identified_foods="ramen", protein=10, carbs=40.5, fat=5, triggers=None, user_id=1))
+    test_db.add(models.Symptom(symptom_name="Headache", severity=7, notes=None, user_id=1))
+    test_db.commit()
+
+    meals = test_db.query(models.Meal).all()
+    expected = [schemas.MealOut.model_validate(m).model_dump(mode="json") for m in meals]
+    assert client.get("/dashboard").json() == expected
+
+    symptoms = test_db.query(models.Symptom).all()
+    expected = [schemas.SymptomOut.model_validate(s).model_dump(mode="json") for s in symptoms]
+    assert client.get("/dashboard/symptoms").json() == expected
+
+    recent = client.get("/dashboard/recent").json()
+    meal_item = next(item for item in recent if item["type"] == "meal")
+    assert meal_item["data"]["image_url"] == "x"
+    assert meal_item["date"] == meal_item["data"]["created_at"]
+
+
+def test_large_dashboard_responses_are_gzipped(client, test_db):
+    """Test long histories are compressed when the client accepts gzip"""
+    user = models.User(id=1, email="test@test.com", name="Test User")
+    test_db.add(user)
+    test_db.add_all(
+        models.Meal(image_url="x", identified_foods=f"meal {i}", protein=1, carbs=2, fat=3, triggers="Gluten", user_id=1)
+        for i in range(50)
+    )
+    test_db.commit()
+
+    response = client.get("/dashboard", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 50
+
+    # Small payloads skip compression
+    small = client.get("/dashboard/triggers", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+
+
+def test_dashboard_etag_and_not_modified(client, test_db):
+    """Test dashboard responses carry an ETag and answer 304 until the next write"""
+    first = client.get("/dashboard")
+    etag = first.headers["etag"]
+    assert first.status_code == 200
+
+    cached = client.get("/dashboard", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    client.post("/log/symptom", json={"symptom_name": "Nausea", "severity": 6})
+    after_write = client.get("/dashboard", headers={"If-None-Match": etag})
+    assert after_write.status_code == 200
+    assert after_write.headers["etag"] != etag
+
+
+def test_dashboard_served_from_cache_until_invalidated(client, test_db):
+    """Test cached bodies are reused between writes and refreshed by log_food"""
+    assert client.get("/dashboard").json() == []
+
+    # Rows written behind the API's back are not seen until a write invalidates
+    test_db.add(models.User(id=1, email="test@test.com", name="Test User"))
+    test_db.add(models.Meal(image_url="x", identified_foods="sushi", protein=1, carbs=1, fat=1, user_id=1))
+    test_db.commit()
+    assert client.get("/dashboard").json() == []
+
+    files = {"file": ("test.jpg", io.BytesIO(b"fake image data"), "image/jpeg")}
+    assert client.post("/log/food", files=files).status_code == 200
+    assert len(client.get("/dashboard").json()) == 2
+
+
+def test_dashboard_cache_local_redis_backend(client):
+    """Test the Redis-like backend serves the same ETag flow"""
+    cache.set_backend(cache.RedisBackend(cache.LocalRedis()))
+    etag = client.get("/dashboard/symptoms").headers["etag"]
+    assert client.get("/dashboard/symptoms", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_events_endpoint_replays_after_last_event_id(client, monkeypatch):
+    """Test /events resumes from Last-Event-ID with deltas from log_symptom"""
+    monkeypatch.setattr(events, "broker", events.EventBroker())
+    monkeypatch.setattr(events, "SSE_MAX_CONNECTION_SECONDS", 0.2)
+    client.post("/log/symptom", json={"symptom_name": "Nausea", "severity": 6})
+    client.post("/log/symptom", json={"symptom_name": "Bloating", "severity": 3})
+
+    headers = {"Last-Event-ID": f"{events.broker.boot}-1"}
+    with client.stream("GET", "/events", headers=headers) as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        data_lines = [line for line in response.iter_lines() if line.startswith("data: ")]
+    assert len(data_lines) == 1
+    payload = json.loads(data_lines[0][len("data: "):])
+    assert payload["op"] == "created"
+    assert payload["symptom_name"] == "Bloating"
+
+
+def test_log_symptom_batch(client):
+    """Test batch symptom logging inserts valid items and reports invalid ones"""
+    items = [
+        {"symptom_name": "Bloating", "severity": 4},
+        {"symptom_name": "Headache"},
+        {"symptom_name": "Nausea", "severity": 2, "notes": "after lunch", "created_at": "2024-01-02T08:00:00"},
+    ]
+    response = client.post("/log/symptom/batch", json=items)
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["created"], body["failed"]) == (2, 1)
+    assert body["results"][1]["ok"] is False
+    assert "severity" in body["results"][1]["error"]
+
+    symptoms = {s["symptom_name"]: s for s in client.get("/dashboard/symptoms").json()}
+    assert set(symptoms) == {"Bloating", "Nausea"}
+    assert symptoms["Nausea"]["created_at"].startswith("2024-01-02T08:00:00")
+    assert symptoms["Nausea"]["id"] == body["results"][2]["id"]
+
+
+def test_log_symptom_batch_limit(client, monkeypatch):
+    """Test oversized batches are rejected up front"""
+    import main
+    monkeypatch.setattr(main, "BATCH_MAX_ITEMS", 2)
+    response = client.post("/log/symptom/batch", json=[{"symptom_name": "x", "severity": 1}] * 3)
+    assert response.status_code == 400
+
+
+def _seed_history(test_db, days=30):
+    test_db.add(models.User(id=1, email="test@test.com", name="Test User"))
+    base = datetime(2024, 1, 1, 12)
+    for day in range(days):
+        when = base + timedelta(days=day)
+        test_db.add(models.Meal(image_url="x", identified_foods=f"meal {day}", protein=1, carbs=2, fat=3,
+                                triggers="Gluten, Dairy", user_id=1, created_at=when))
+        test_db.add(models.Symptom(symptom_name="Bloating", severity=day % 10, notes="a, \"quoted\" note",
+                                   user_id=1, created_at=when + timedelta(hours=2)))
+    test_db.commit()
+
+
+def test_export_ndjson_streams_all_history(client, test_db, monkeypatch):
+    """Test NDJSON export includes every meal and symptom in chronological order"""
+    import export
+    monkeypatch.setattr(export, "EXPORT_CHUNK_ROWS", 7)
+    _seed_history(test_db)
+
+    response = client.get("/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    meals = [r for r in lines if r["type"] == "meal"]
+    symptoms = [r for r in lines if r["type"] == "symptom"]
+    assert len(meals) == 30 and len(symptoms) == 30
+    assert [m["identified_foods"] for m in meals[:2]] == ["meal 0", "meal 1"]
+    assert "user_id" not in meals[0]
+
+    chunks = list(export.iter_chunks(test_db, export.export_query("meals", 1), 7))
+    assert [len(c) for c in chunks] == [7, 7, 7, 7, 2]
+
+
+def test_export_csv_date_range(client, test_db):
+    """Test CSV export of one table honours start (inclusive) and end (exclusive)"""
+    import csv
+    _seed_history(test_db)
+
+    response = client.get("/export", params={"format": "csv", "kind": "symptoms",
+                                             "start": "2024-01-05T00:00:00", "end": "2024-01-08T14:00:00"})
+    assert response.status_code == 200
+    assert "attachment" in response.headers["content-disposition"]
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["id", "created_at", "symptom_name", "severity", "notes"]
+    assert [r[1] for r in rows[1:]] == ["2024-01-05T14:00:00", "2024-01-06T14:00:00", "2024-01-07T14:00:00"]
+    assert rows[1][4] == 'a, "quoted" note'
+
+    assert client.get("/export", params={"format": "csv"}).status_code == 400
+    assert client.get("/export", params={"format": "xml"}).status_code == 400
+
+
+def test_export_is_gzipped(client, test_db):
+    """Test large exports are compressed for clients that accept gzip"""
+    _seed_history(test_db, days=60)
+    response = client.get("/export", headers={"Accept-Encoding": "gzip"})
+    assert response.headers.get("content-encoding") == "gzip"
+    assert len(response.text.splitlines()) == 120
+
+
+def test_export_async_session(async_client, test_db):
+    """Test export streams through AsyncSession.stream on the async engine"""
+    _seed_history(test_db, days=5)
+    response = async_client.get("/export", params={"kind": "meals"})
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == 5
@@ -0,0 +1,77 @@
+import sys
+import tracemalloc
+from pathlib import Path
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import memstats
+import profiling
+
+MiB = 1024 * 1024
+
+
+def test_growth_trend_flags_sustained_growth_only():
+    flat = [500 * MiB + (i % 3) * MiB for i in range(100)]
+    assert not memstats.growth_trend(flat)["leak"]
+
+    # Warmup growth followed by a plateau is allocator caches filling up, not a leak
+    plateau = [min(i, 20) * 10 * MiB for i in range(100)]
+    assert not memstats.growth_trend(plateau)["leak"]
+
+    leaking = [500 * MiB + i * MiB for i in range(100)]
+    trend = memstats.growth_trend(leaking)
+    assert trend["leak"]
+    assert trend["rising_fraction"] == 1.0
+    assert abs(trend["slope_bytes_per_sample"] - MiB) < 1
+
+
+def test_soak_detects_injected_leak():
+    kept = []
+    result = memstats.soak(lambda size: kept.append(bytearray(size)), [256 * 1024], iterations=400,
+                           sample_every=10, min_growth_bytes=20 * MiB)
+    assert result["iterations"] == 400 and len(result["rss_samples"]) == 40
+    assert result["leak"]
+
+    result = memstats.soak(lambda size: bytearray(size), [256 * 1024], iterations=400,
+                           sample_every=10, min_growth_bytes=20 * MiB)
+    assert not result["leak"]
+
+
+def test_top_allocations_by_module():
+    assert memstats.module_for(str(backend_dir / "memstats.py")) == "memstats"
+    assert memstats.top_allocations() == []
+
+    tracemalloc.start()
+    try:
+        blob = [bytearray(1024) for _ in range(2000)]
+        top = memstats.top_allocations(limit=50)
+    finally:
+        tracemalloc.stop()
+    mine = next(item for item in top if item["module"].endswith("test_memstats"))
+    assert mine["size_bytes"] >= 2000 * 1024
+    assert len(blob) == 2000
+
+
+def test_debug_memory_is_off_by_default(client, monkeypatch):
+    assert client.get("/debug/memory").status_code == 404
+    monkeypatch.setattr(memstats, "MEMORY_DEBUG_ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILE_ADMIN_TOKEN", "s3cret")
+    assert client.get("/debug/memory", headers={"X-Admin-Token": "wrong"}).status_code == 404
+    assert client.get("/debug/memory", headers={"X-Admin-Token": "s3cret"}).status_code == 200
+
+
+def test_debug_memory_reports_process_and_routes(client, monkeypatch):
+    monkeypatch.setattr(memstats, "MEMORY_DEBUG_ENABLED", True)
+    client.get("/dashboard")
+    report = client.get("/debug/memory").json()
+    assert report["rss_bytes"] > 0
+    assert report["peak_rss_bytes"] >= report["rss_bytes"] // 2
+    assert report["torch"]["loaded"] in (True, False)
+    assert report["tracemalloc"]["tracing"] is False
+    assert report["requests"]["/dashboard"]["requests"] >= 1
+
+    text = client.get("/metrics").text
+    assert 'nutrisnap_request_rss_growth_bytes_count{route="/dashboard"}' in text
+    assert "nutrisnap_process_rss_bytes" in text
@@ -0,0 +1,85 @@
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import metrics
+
+
+def _sample(text: str, line_prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{line_prefix} not in output")
+
+
+def test_counter_and_histogram_render():
+    registry = metrics.Registry()
+    hits = registry.register(metrics.Counter("test_hits", "Hits", ["result"]))
+    latency = registry.register(metrics.Histogram("test_latency_seconds", "Latency", buckets=(0.1, 1.0)))
+
+    hits.inc(result="hit")
+    hits.inc(2, result="miss")
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+
+    text = registry.render()
+    assert "# TYPE test_hits counter" in text
+    assert _sample(text, 'test_hits_total{result="hit"}') == 1
+    assert _sample(text, 'test_hits_total{result="miss"}') == 2
+    # Buckets are cumulative and end with +Inf == count
+    assert _sample(text, 'test_latency_seconds_bucket{le="0.1"}') == 1
+    assert _sample(text, 'test_latency_seconds_bucket{le="1.0"}') == 2
+    assert _sample(text, 'test_latency_seconds_bucket{le="+Inf"}') == 3
+    assert _sample(text, "test_latency_seconds_count") == 3
+    assert _sample(text, "test_latency_seconds_sum") == pytest.approx(5.55)
+
+
+def test_labels_are_checked_and_escaped():
+    registry = metrics.Registry()
+    counter = registry.register(metrics.Counter("test_errors", "Errors", ["kind"]))
+    with pytest.raises(ValueError):
+        counter.inc(other="x")
+    counter.inc(kind='bad "quote"\n')
+    assert 'test_errors_total{kind="bad \\"quote\\"\\n"} 1' in registry.render()
+
+
+def test_callback_gauge_and_register_is_idempotent():
+    registry = metrics.Registry()
+    depth = registry.register(metrics.Gauge("test_depth", "Depth", ["pool"], fn=lambda: {("primary",): 3}))
+    assert registry.register(metrics.Gauge("test_depth", "Other")) is depth
+    assert 'test_depth{pool="primary"} 3' in registry.render()
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    counter = metrics.Counter("test_off", "Off")
+    counter.inc()
+    with metrics.timer(metrics.Histogram("test_off_seconds", "Off")):
+        pass
+    assert counter.value() == 0
+
+
+def test_metrics_endpoint_reports_stages_and_cache(client):
+    before = metrics.STAGE_SECONDS.count(stage="log_food.db_commit")
+    response = client.post("/log/food", files={"file": ("meal.jpg", io.BytesIO(b"fake image"), "image/jpeg")})
+    assert response.status_code == 200
+    client.get("/dashboard")
+    client.get("/dashboard")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert metrics.STAGE_SECONDS.count(stage="log_food.db_commit") == before + 1
+    for stage in ("pipeline.resize", "pipeline.local_inference", "pipeline.gemini"):
+        assert f'nutrisnap_stage_seconds_count{{stage="{stage}"}}' in text
+    assert _sample(text, 'nutrisnap_cache_requests_total{result="hit"}') >= 1
+    assert 'nutrisnap_inference_requests_total{backend="local",outcome="ok"}' in text
+    assert 'http_request_duration_seconds_count{method="POST",route="/log/food",status="200"}' in text
+    assert "nutrisnap_meal_queue_depth" in text
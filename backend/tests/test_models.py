@@ -5,6 +5,8 @@ import sys
 backend_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(backend_dir))
 
+from sqlalchemy import create_engine, inspect, text
+
 import models
 
 
@@ -84,3 +86,17 @@ def test_meal_creation(test_db):
 
     # Verify relationship
     assert meal.owner.email == "mealtest@example.com"
+
+
+def test_upgrade_schema_adds_meal_status(tmp_path):
+    """Test a meals table from before the status column is upgraded in place, and only once"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE meals (id INTEGER PRIMARY KEY, identified_foods VARCHAR)"))
+        conn.execute(text("INSERT INTO meals (identified_foods) VALUES ('ramen')"))
+
+    models.upgrade_schema(engine)
+    models.upgrade_schema(engine)
+    assert "status" in {c["name"] for c in inspect(engine).get_columns("meals")}
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT status FROM meals")).scalar() == "complete"
@@ -0,0 +1,154 @@
+"""
+Performance regression tests: query counts per endpoint, latency budgets and
+data-size scaling. Deselected by default; run with `pytest -m perf`.
+
+Budgets are generous so they only trip on real regressions (a per-row query,
+a quadratic loop); scale them on slow machines with PERF_BUDGET_SCALE=2.
+"""
+import io
+import os
+import statistics
+import time
+from pathlib import Path
+import sys
+
+import pytest
+from sqlalchemy import event
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import cache
+import main
+import seed_synthetic
+
+pytestmark = pytest.mark.perf
+
+BUDGET_SCALE = float(os.getenv("PERF_BUDGET_SCALE", "1"))
+
+READ_QUERY_BUDGETS = {
+    "/dashboard": 1,
+    "/dashboard/symptoms": 1,
+    "/dashboard/recent": 2,
+    "/dashboard/triggers": 2,
+    "/dashboard/associations": 2,
+    "/export?kind=meals": 1,
+}
+
+
+@pytest.fixture
+def queries(test_db):
+    """Statements sent to the test database while the test runs"""
+    statements = []
+    engine = test_db.get_bind()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine, "before_cursor_execute", record)
+
+
+@pytest.fixture
+def uncached(client):
+    # Measure the real work, not cache hits
+    cache.set_backend(None)
+    return client
+
+
+def _seed(test_db, meals, symptoms, seed=0):
+    data = seed_synthetic.generate(1, meals, symptoms, days=max(30, meals // 3), seed=seed)
+    seed_synthetic.write(test_db.get_bind(), data, users=1)
+    test_db.expire_all()
+
+
+def _median_ms(fn, repeat=5):
+    fn()  # warm up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def _jpeg():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), "orange").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("path", list(READ_QUERY_BUDGETS))
+def test_read_query_count_is_constant(uncached, test_db, queries, path):
+    """Read endpoints issue a fixed number of queries however long the history is"""
+    counts = []
+    for meals, symptoms in ((10, 5), (300, 150)):
+        _seed(test_db, meals, symptoms, seed=meals)
+        queries.clear()
+        assert uncached.get(path).status_code == 200
+        counts.append(len(queries))
+    assert counts[0] == counts[1], f"{path} query count grew with data: {counts}"
+    assert counts[1] <= READ_QUERY_BUDGETS[path], f"{path} ran {counts[1]} queries: {queries}"
+
+
+def test_write_query_counts(uncached, queries):
+    """Single and batch writes stay within a fixed number of statements"""
+    image = _jpeg()
+    uncached.post("/log/symptom", json={"symptom_name": "warmup", "severity": 1})
+
+    queries.clear()
+    uncached.post("/log/food", files={"file": ("a.jpg", image, "image/jpeg")})
+    assert len(queries) <= 4, queries
+
+    queries.clear()
+    uncached.post("/log/symptom", json={"symptom_name": "Bloating", "severity": 3})
+    assert len(queries) <= 4, queries
+
+    for size in (2, 50):
+        queries.clear()
+        body = uncached.post("/log/symptom/batch", json=[{"symptom_name": "Bloating", "severity": 3}] * size).json()
+        assert body["created"] == size
+        # Bulk insert: statement count doesn't depend on batch size
+        assert len(queries) <= 4, f"batch of {size}: {queries}"
+
+    for size in (2, 12):
+        queries.clear()
+        files = [("files", (f"{i}.jpg", image, "image/jpeg")) for i in range(size)]
+        assert uncached.post("/log/food/batch", files=files).json()["created"] == size
+        assert len(queries) <= 4, f"batch of {size}: {queries}"
+
+
+def test_read_latency_budgets(uncached, test_db):
+    """Dashboard reads over ~3 years of history stay well under interactive latency"""
+    _seed(test_db, 3000, 2000)
+    budgets_ms = {
+        "/dashboard": 250,
+        "/dashboard/symptoms": 200,
+        "/dashboard/recent": 50,
+        "/dashboard/triggers": 150,
+        "/dashboard/associations": 150,
+    }
+    for path, budget in budgets_ms.items():
+        elapsed = _median_ms(lambda: uncached.get(path))
+        assert elapsed < budget * BUDGET_SCALE, f"{path}: {elapsed:.1f} ms > {budget} ms"
+
+
+def test_log_food_latency_budget(uncached):
+    """Upload handling around (mocked) inference adds little latency"""
+    files = {"file": ("a.jpg", _jpeg(), "image/jpeg")}
+    elapsed = _median_ms(lambda: uncached.post("/log/food", files=files), repeat=10)
+    assert elapsed < 60 * BUDGET_SCALE, f"/log/food: {elapsed:.1f} ms"
+
+
+@pytest.mark.parametrize("fn", [main._triggers, main._list_meals, main._list_symptoms])
+def test_scaling_is_linear_or_better(test_db, fn):
+    """Quadrupling the history at most roughly quadruples the work"""
+    _seed(test_db, 500, 300, seed=1)
+    small = _median_ms(lambda: fn(test_db, 1))
+    _seed(test_db, 1500, 900, seed=2)
+    large = _median_ms(lambda: fn(test_db, 1))
+    # 4x the rows; allow constant overheads and timer noise but not quadratic (16x)
+    assert large < max(small * 6, 5.0), f"{fn.__name__}: {small:.2f} ms -> {large:.2f} ms"
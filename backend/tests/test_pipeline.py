@@ -0,0 +1,232 @@
+import asyncio
+import io
+import time
+from pathlib import Path
+import sys
+
+import pytest
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import cache
+import models
+import pipeline
+
+
+def _wait_for_status(client, meal_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        meal = client.get(f"/meals/{meal_id}").json()
+        if meal["status"] != "pending":
+            return meal
+        time.sleep(0.01)
+    raise AssertionError(f"meal {meal_id} still pending")
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "UPLOAD_DIR", tmp_path / "uploads")
+    yield tmp_path / "uploads"
+    # Drop any queue a test swapped in
+    pipeline.set_queue(None)
+
+
+def test_async_upload_returns_pending_then_completes(client, upload_dir):
+    """Test async mode accepts the upload immediately and a worker completes the meal"""
+    files = {"file": ("test.jpg", io.BytesIO(b"fake image data"), "image/jpeg")}
+    response = client.post("/log/food?mode=async", files=files)
+    assert response.status_code == 202
+    pending = response.json()
+    assert pending["status"] == "pending"
+
+    meal = _wait_for_status(client, pending["id"])
+    assert meal["status"] == "complete"
+    assert meal["identified_foods"] == "Ramen"
+    assert meal["protein"] == 10.0
+    assert meal["triggers"] == "Gluten, Soy"
+    # Stored upload is removed once processed
+    assert list(upload_dir.iterdir()) == []
+    # Dashboard cache was invalidated by the worker
+    assert client.get("/dashboard").json()[0]["status"] == "complete"
+
+
+def test_async_upload_marks_failed_meals(client, upload_dir, monkeypatch):
+    """Test a failing classification leaves the meal in the failed state"""
+    def broken_predict(image_bytes):
+        raise RuntimeError("model exploded")
+
+    monkeypatch.setattr(pipeline, "run_inference", broken_predict)
+    files = {"file": ("test.jpg", io.BytesIO(b"fake image data"), "image/jpeg")}
+    pending = client.post("/log/food?mode=async", files=files).json()
+    assert _wait_for_status(client, pending["id"])["status"] == "failed"
+
+
+def test_async_upload_through_local_broker(client, upload_dir, monkeypatch):
+    """Test the Redis-list broker stand-in carries the image to a worker and relays its completion"""
+    client.portal.call(pipeline.stop_workers)
+    redis = cache.LocalRedis()
+    pipeline.set_queue(pipeline.BrokerQueue(redis, block_seconds=0.05))
+    client.portal.call(pipeline.start_relay)
+    etag = client.get("/dashboard").headers["ETag"]
+    published = []
+    monkeypatch.setattr(redis, "publish", lambda channel, message: published.append(channel) or
+                        cache.LocalRedis.publish(redis, channel, message))
+    client.portal.call(_start_one_worker)
+
+    files = {"file": ("test.jpg", io.BytesIO(b"fake image data"), "image/jpeg")}
+    pending = client.post("/log/food?mode=async", files=files).json()
+    assert not upload_dir.exists() or list(upload_dir.iterdir()) == []
+    assert _wait_for_status(client, pending["id"])["status"] == "complete"
+
+    deadline = time.monotonic() + 5
+    while client.get("/dashboard").headers["ETag"] == etag and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert published == [pipeline.MEAL_EVENTS_CHANNEL]
+    assert client.get("/dashboard").json()[0]["status"] == "complete"
+
+
+async def _start_one_worker():
+    pipeline.start_workers(1)
+
+
+def test_full_queue_sheds_with_503(client, test_db, upload_dir):
+    """Test uploads fail fast when the job queue is saturated"""
+    client.portal.call(pipeline.stop_workers)
+    queue = pipeline.MemoryQueue(maxsize=1)
+    pipeline.set_queue(queue)
+    client.portal.call(queue.put, {"meal_id": 0})
+
+    files = {"file": ("test.jpg", io.BytesIO(b"fake image data"), "image/jpeg")}
+    etag = client.get("/dashboard").headers["ETag"]
+    response = client.post("/log/food?mode=async", files=files)
+    assert response.status_code == 503
+    # Neither the stored upload nor a meal row survives the 503
+    assert list(upload_dir.iterdir()) == []
+    assert test_db.query(models.Meal).count() == 0
+    assert client.get("/dashboard").headers["ETag"] != etag
+    assert client.get("/dashboard").json() == []
+
+
+def test_restart_recovers_pending_meals(client, test_db, upload_dir):
+    """Test startup requeues pending meals with an upload, fails the rest and drops stray files"""
+    client.portal.call(pipeline.stop_workers)
+    queue = pipeline.MemoryQueue()
+    pipeline.set_queue(queue)
+    test_db.add(models.User(id=1, email="demo@test.com", name="Demo"))
+    kept, lost = (models.Meal(image_url="x", identified_foods="Processing", status="pending", user_id=1) for _ in range(2))
+    test_db.add_all([kept, lost])
+    test_db.commit()
+    upload_dir.mkdir(parents=True)
+    pipeline.upload_path_for(kept.id).write_bytes(b"fake image data")
+    (upload_dir / "meal-999.img").write_bytes(b"orphan")
+
+    client.portal.call(pipeline.recover_pending)
+    assert queue.depth() == 1
+    assert [p.name for p in upload_dir.iterdir()] == [f"meal-{kept.id}.img"]
+    test_db.expire_all()
+    assert test_db.get(models.Meal, lost.id).status == "failed"
+
+    client.portal.call(_start_one_worker)
+    assert _wait_for_status(client, kept.id)["status"] == "complete"
+
+
+def test_broker_queue_blocks_until_a_job_arrives():
+    """Test BRPOP-based get waits for a push and a closed queue hands popped jobs back"""
+    async def scenario():
+        queue = pipeline.BrokerQueue(cache.LocalRedis(), block_seconds=0.05)
+        waiter = asyncio.create_task(queue.get())
+        await asyncio.sleep(0.1)
+        assert not waiter.done()
+        await queue.put({"meal_id": 1})
+        assert await asyncio.wait_for(waiter, 1) == {"meal_id": 1}
+
+        await queue.put({"meal_id": 2})
+        queue.close()
+        assert queue._pop() is None
+        assert queue.depth() == 1
+
+    asyncio.run(scenario())
+
+
+def test_get_meal_not_found(client):
+    """Test polling an unknown meal returns 404"""
+    assert client.get("/meals/999").status_code == 404
+
+
+def test_memory_queue_bound():
+    """Test the in-process queue rejects jobs beyond its bound"""
+    async def scenario():
+        queue = pipeline.MemoryQueue(maxsize=1)
+        await queue.put({"meal_id": 1})
+        with pytest.raises(pipeline.QueueFull):
+            await queue.put({"meal_id": 2})
+        assert queue.depth() == 1
+        assert await queue.get() == {"meal_id": 1}
+
+    asyncio.run(scenario())
+
+
+def test_food_batch_dedupes_trigger_lookups(client, monkeypatch):
+    """Test a batch upload runs inference in chunks and asks Gemini once per label"""
+    batches, lookups = [], []
+
+    def fake_batch(images):
+        batches.append(len(images))
+        labels = ["ramen", "pizza"]
+        return [{"top1": [{"label": labels[i % 2], "score": 0.9}], "topk": []} for i in range(len(images))]
+
+    def fake_triggers(label, image_bytes):
+        lookups.append(label)
+        return "Gluten"
+
+    monkeypatch.setattr(pipeline, "run_inference_batch", fake_batch)
+    monkeypatch.setattr(pipeline, "INFERENCE_BATCH_SIZE", 3)
+    monkeypatch.setattr("gemini_utils.get_food_triggers", fake_triggers)
+
+    files = [("files", (f"{i}.jpg", io.BytesIO(b"img %d" % i), "image/jpeg")) for i in range(5)]
+    files.insert(2, ("files", ("empty.jpg", io.BytesIO(b""), "image/jpeg")))
+    response = client.post("/log/food/batch", files=files)
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["created"], body["failed"]) == (5, 1)
+    assert body["results"][2] == {"index": 2, "ok": False, "id": None, "error": "Uploaded file is empty."}
+    assert batches == [3, 2]
+    assert sorted(lookups) == ["Pizza", "Ramen"]
+
+    meals = client.get("/dashboard").json()
+    assert len(meals) == 5
+    assert {m["identified_foods"] for m in meals} == {"Ramen", "Pizza"}
+
+
+def test_food_batch_reports_inference_errors(client, monkeypatch):
+    """Test a failed inference chunk marks only its own items as failed"""
+    def fake_batch(images):
+        if b"bad" in images[0]:
+            raise RuntimeError("model exploded")
+        return [{"top1": [{"label": "ramen", "score": 0.9}], "topk": []}] * len(images)
+
+    monkeypatch.setattr(pipeline, "run_inference_batch", fake_batch)
+    monkeypatch.setattr(pipeline, "INFERENCE_BATCH_SIZE", 2)
+
+    files = [("files", (f"{i}.jpg", io.BytesIO(data), "image/jpeg")) for i, data in enumerate([b"ok", b"ok", b"bad", b"bad"])]
+    body = client.post("/log/food/batch", files=files).json()
+    assert [r["ok"] for r in body["results"]] == [True, True, False, False]
+    assert "model exploded" in body["results"][3]["error"]
+
+
+def test_vertex_api_base_without_auth(fake_services, monkeypatch):
+    """Test the Vertex client can target a stand-in endpoint without fetching ADC tokens"""
+    url, fakes = fake_services
+    monkeypatch.setenv("VERTEX_ENDPOINT_ID", "projects/p/locations/us-central1/endpoints/1")
+    monkeypatch.setattr(pipeline, "VERTEX_API_BASE", url)
+    monkeypatch.setattr(pipeline, "VERTEX_AUTH", False)
+    monkeypatch.setattr(pipeline, "INFERENCE_LOCAL_FALLBACK", False)
+    predictions = asyncio.run(pipeline.classify_batch([b"a", b"b"], [b"a", b"b"]))
+    assert [p["top1"][0]["label"] in fakes.LABELS for p in predictions] == [True, True]
+    assert fakes.stats["vertex"] == 1
+
+    fakes.behaviour["vertex"].error_rate = 1.0
+    with pytest.raises(pipeline.PipelineError, match="Vertex AI inference failed"):
+        asyncio.run(pipeline.classify_batch([b"a"], [b"a"]))
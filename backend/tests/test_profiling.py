@@ -0,0 +1,102 @@
+import os
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import profiling
+
+
+def _spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+def _parse(collapsed: str) -> dict:
+    stacks = {}
+    for line in collapsed.splitlines():
+        stack, _, count = line.rpartition(" ")
+        stacks[stack] = int(count)
+    return stacks
+
+
+@pytest.fixture
+def enabled(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", tmp_path)
+    return tmp_path
+
+
+def test_sampler_emits_collapsed_stacks():
+    worker = threading.Thread(target=_spin, args=(0.3,), name="busy")
+    sampler = profiling.Sampler(interval=0.002).start()
+    worker.start()
+    worker.join()
+    stacks = _parse(sampler.stop().collapsed())
+
+    busy = {stack: n for stack, n in stacks.items() if stack.startswith("busy;")}
+    assert sum(busy.values()) > 10
+    assert all("_spin (test_profiling.py:" in stack for stack in busy)
+    # Frames are root-first, and idle threads are skipped by default
+    assert next(iter(busy)).split(";")[1].startswith("_bootstrap")
+    assert not any(stack.rsplit(";", 1)[-1].startswith("wait (threading.py:") for stack in stacks)
+
+
+def test_admin_profile_is_off_by_default(client):
+    assert client.get("/admin/profile?seconds=0").status_code == 404
+
+
+def test_admin_profile_returns_stacks(client, enabled, monkeypatch):
+    worker = threading.Thread(target=_spin, args=(0.5,), name="busy")
+    worker.start()
+    response = client.get("/admin/profile?seconds=0.2&interval_ms=2")
+    worker.join()
+    assert response.status_code == 200
+    assert any(stack.startswith("busy;") for stack in _parse(response.text))
+
+    monkeypatch.setattr(profiling, "PROFILE_ADMIN_TOKEN", "secret")
+    assert client.get("/admin/profile?seconds=0").status_code == 404
+    assert client.get("/admin/profile?seconds=0", headers={"X-Admin-Token": "secret"}).status_code == 200
+
+
+def test_middleware_profiles_every_nth_request(enabled):
+    app = FastAPI()
+    app.add_middleware(profiling.ProfilingMiddleware, every=3, interval=0.001)
+
+    @app.get("/work/{n}")
+    def work(n: int):
+        _spin(0.05)
+        return {"n": n}
+
+    with TestClient(app) as client:
+        for n in range(6):
+            assert client.get(f"/work/{n}").status_code == 200
+
+    files = sorted(enabled.glob("*.collapsed"))
+    assert len(files) == 2
+    assert files[0].name.startswith("GET_work_")
+    assert "work (test_profiling.py:" in files[0].read_text()
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGUSR2"), reason="no SIGUSR2 on this platform")
+def test_signal_writes_profile(enabled):
+    previous = signal.getsignal(signal.SIGUSR2)
+    try:
+        assert profiling.install_signal_handler(seconds=0.05)
+        os.kill(os.getpid(), signal.SIGUSR2)
+        deadline = time.monotonic() + 5
+        while not list(enabled.glob("signal-*.collapsed")) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert list(enabled.glob("signal-*.collapsed"))
+    finally:
+        signal.signal(signal.SIGUSR2, previous)
@@ -0,0 +1,52 @@
+from pathlib import Path
+import sys
+
+import numpy as np
+from sqlalchemy import func, select
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import analysis
+import database
+import models
+import seed_synthetic
+
+
+def test_generate_is_deterministic_by_seed():
+    a = seed_synthetic.generate(3, 50, 20, seed=5)
+    b = seed_synthetic.generate(3, 50, 20, seed=5)
+    c = seed_synthetic.generate(3, 50, 20, seed=6)
+    for table in ("meals", "symptoms"):
+        for column in a[table]:
+            assert np.array_equal(a[table][column], b[table][column])
+    assert not np.array_equal(a["meals"]["created_at"], c["meals"]["created_at"])
+    assert len(a["meals"]["user_id"]) == 150 and len(a["symptoms"]["user_id"]) == 60
+
+
+def test_generated_patterns_are_recoverable():
+    """Test a configured trigger -> symptom pattern dominates the association analysis"""
+    patterns = {"Spicy Food": ["Nausea", 0.95, [0.5, 1.5]]}
+    data = seed_synthetic.generate(1, 2000, 600, days=400, seed=1, patterns=patterns)
+    meals, symptoms = data["meals"], data["symptoms"]
+    history = analysis.build_history(
+        meals["created_at"], list(meals["triggers"]), symptoms["created_at"], list(symptoms["symptom_name"]),
+    )
+    top = analysis.associations(history, lags_hours=[2])[0]
+    assert (top["trigger"], top["symptom"]) == ("Spicy Food", "Nausea")
+
+
+def test_write_bulk_inserts(tmp_path):
+    engine = database.make_engine(f"sqlite:///{tmp_path / 'synthetic.db'}", name="synthetic-test")
+    models.Base.metadata.create_all(bind=engine)
+    data = seed_synthetic.generate(4, 30, 10, seed=2)
+    seed_synthetic.write(engine, data, users=4, chunk_rows=25)
+    # A second run on the same users reuses them instead of failing on their ids
+    seed_synthetic.write(engine, data, users=4, chunk_rows=25)
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(models.User)).scalar() == 4
+        assert conn.execute(select(func.count()).select_from(models.Meal)).scalar() == 240
+        per_user = conn.execute(select(func.count()).where(models.Symptom.user_id == 3)).scalar()
+    assert per_user == 20
+    engine.dispose()
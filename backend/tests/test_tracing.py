@@ -0,0 +1,147 @@
+import asyncio
+import io
+import json
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import pipeline
+import tracing
+
+INCOMING = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+
+@pytest.fixture
+def spans(test_db):
+    """Record spans in memory, including SQL run through the test session"""
+    exporter = tracing.MemoryExporter()
+    tracing.set_exporter(exporter)
+    tracing.instrument_engine(test_db.get_bind())
+    yield exporter.spans
+    tracing.set_exporter(None)
+
+
+def test_traceparent_round_trip():
+    assert tracing.parse_traceparent(INCOMING) == ("0af7651916cd43dd8448eb211c80319c", "b7ad6b7169203331", True)
+    assert tracing.parse_traceparent("garbage") is None
+    assert tracing.inject({"a": "b"}) == {"a": "b"}
+
+    tracing.set_exporter(tracing.MemoryExporter())
+    try:
+        with tracing.root_span("root", INCOMING) as root:
+            header = tracing.inject()["traceparent"]
+        assert header == f"00-{root.trace_id}-{root.span_id}-01"
+        assert root.parent_id == "b7ad6b7169203331"
+    finally:
+        tracing.set_exporter(None)
+
+
+def test_log_food_trace_covers_stages_and_sql(client, spans):
+    response = client.post("/log/food", files={"file": ("meal.jpg", io.BytesIO(b"fake image"), "image/jpeg")})
+    assert response.status_code == 200
+    trace_id = response.headers["x-trace-id"]
+
+    trace = [s for s in spans if s["trace_id"] == trace_id]
+    by_name = {s["name"]: s for s in trace}
+    root = by_name["POST /log/food"]
+    assert root["parent_id"] is None
+    assert root["attributes"]["http.status"] == 200
+    for stage in ("log_food.read", "pipeline.resize", "pipeline.local_inference", "pipeline.gemini", "log_food.db_commit"):
+        assert by_name[stage]["parent_id"] == root["span_id"]
+
+    # SQL runs in the threadpool under the commit stage and still joins the trace
+    sql = [s for s in trace if s["name"] == "sql"]
+    assert any(s["attributes"]["statement"].startswith("INSERT INTO meals") for s in sql)
+    assert {s["parent_id"] for s in sql} <= {by_name["log_food.db_commit"]["span_id"], root["span_id"]}
+
+
+def test_incoming_traceparent_is_continued(client, spans):
+    response = client.get("/dashboard", headers={"traceparent": INCOMING})
+    assert response.headers["x-trace-id"] == "0af7651916cd43dd8448eb211c80319c"
+    root = next(s for s in spans if s["name"] == "GET /dashboard")
+    assert root["parent_id"] == "b7ad6b7169203331"
+
+    spans.clear()
+    unsampled = INCOMING[:-2] + "00"
+    response = client.get("/dashboard", headers={"traceparent": unsampled})
+    assert "x-trace-id" not in response.headers
+    assert spans == []
+
+
+def test_streamed_response_root_spans_the_body(client, spans):
+    """Test streamed responses are flagged and record time to headers separately"""
+    client.post("/log/symptom", json={"symptom_name": "Bloating", "severity": 4})
+    spans.clear()
+    assert client.get("/export?kind=symptoms").status_code == 200
+    root = next(s for s in spans if s["name"] == "GET /export")
+    assert root["attributes"]["http.streamed"] is True
+    assert root["attributes"]["http.headers_ms"] <= root["duration_ms"]
+
+    spans.clear()
+    client.get("/dashboard")
+    root = next(s for s in spans if s["name"] == "GET /dashboard")
+    assert "http.streamed" not in root["attributes"]
+
+
+def test_tracing_disabled_records_nothing(client):
+    response = client.get("/dashboard")
+    assert response.status_code == 200
+    assert "x-trace-id" not in response.headers
+    assert isinstance(tracing.get_exporter(), tracing.NullExporter)
+
+
+def test_vertex_call_forwards_traceparent(fake_services, monkeypatch):
+    url, fakes = fake_services
+    monkeypatch.setenv("VERTEX_ENDPOINT_ID", "projects/p/locations/us-central1/endpoints/1")
+    monkeypatch.setattr(pipeline, "VERTEX_API_BASE", url)
+    monkeypatch.setattr(pipeline, "VERTEX_AUTH", False)
+    exporter = tracing.MemoryExporter()
+    tracing.set_exporter(exporter)
+
+    async def traced():
+        with tracing.root_span("upload"):
+            return await pipeline.classify_batch([b"a"], [b"a"])
+
+    try:
+        asyncio.run(traced())
+    finally:
+        tracing.set_exporter(None)
+    assert fakes.stats["vertex_traced"] == 1
+    assert [s["name"] for s in exporter.spans] == ["pipeline.vertex", "upload"]
+
+
+def test_http_exporter_ships_to_collector(fake_services):
+    url, fakes = fake_services
+    exporter = tracing.HttpExporter(f"{url}/v1/traces")
+    exporter._queue.put_nowait({"trace_id": "t", "span_id": "s", "name": "sql"})
+    exporter.flush()
+    assert httpx.get(f"{url}/v1/traces").json()["spans"][0]["name"] == "sql"
+    assert exporter.dropped == 0
+
+
+def test_file_exporter_and_trace_tree(tmp_path, capsys):
+    path = tmp_path / "traces.jsonl"
+    tracing.set_exporter(tracing.FileExporter(str(path)))
+    try:
+        with tracing.root_span("GET /slow"):
+            with tracing.span("pipeline.gemini"):
+                pass
+            with pytest.raises(ValueError), tracing.span("sql", statement="SELECT 1"):
+                raise ValueError("boom")
+    finally:
+        tracing.set_exporter(None)
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [s["name"] for s in lines] == ["pipeline.gemini", "sql", "GET /slow"]
+    assert lines[1]["status"] == "error"
+
+    tracing.main([str(path), "--slowest", "1"])
+    out = capsys.readouterr().out.splitlines()
+    assert out[1].startswith("GET /slow")
+    assert out[2].startswith("  pipeline.gemini") and out[3].startswith("  sql")
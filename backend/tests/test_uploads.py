@@ -0,0 +1,160 @@
+import asyncio
+import io
+import struct
+import sys
+import tracemalloc
+import zlib
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import memstats
+import pipeline
+import uploads
+
+MiB = 1024 * 1024
+
+
+def png_bomb(width: int, height: int) -> bytes:
+    """A tiny PNG declaring huge dimensions: a few KB on the wire, gigabytes once decoded."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    rows = zlib.compress(b"\x00" * (width * 3 + 1) * 4, 9)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", rows) + chunk(b"IEND", b"")
+
+
+def jpeg(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "orange").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class EndlessUpload:
+    """UploadFile stand-in that never runs out of bytes and has no known size."""
+
+    size = None
+
+    def __init__(self):
+        self.served = 0
+
+    async def read(self, n=-1):
+        self.served += n
+        return b"\xff" * n
+
+
+def test_read_upload_stops_at_cap_with_flat_memory():
+    """Test reading an endless upload stops at the cap without buffering it"""
+    upload = EndlessUpload()
+    tracemalloc.start()
+    try:
+        with pytest.raises(uploads.UploadRejected, match="exceeds 2 MB"):
+            asyncio.run(uploads.read_upload(upload, max_bytes=2 * MiB))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert upload.served <= 2 * MiB + uploads.UPLOAD_CHUNK_BYTES
+    assert peak < 6 * MiB
+
+
+def test_check_image_rejects_dimensions_from_header_only():
+    """Test oversized images are rejected from their header dimensions"""
+    assert uploads.check_image(jpeg(64, 48)) == ("JPEG", 64, 48)
+    assert uploads.check_image(b"not an image") is None
+    with pytest.raises(uploads.UploadRejected, match="too large"):
+        uploads.check_image(png_bomb(30000, 30000))
+    with pytest.raises(uploads.UploadRejected, match="8000x8000"):
+        uploads.check_image(png_bomb(8000, 8000))
+    with pytest.raises(uploads.UploadRejected, match="20000x10"):
+        uploads.check_image(png_bomb(20000, 10))
+
+
+def test_png_bomb_is_rejected_before_decoding(client, monkeypatch):
+    """Test a decompression bomb gets a 413 before the pipeline decodes it"""
+    calls = []
+    monkeypatch.setattr(pipeline, "process_image", lambda image_bytes: calls.append(image_bytes))
+    bomb = png_bomb(30000, 30000)
+    assert len(bomb) < 10 * 1024
+
+    before = memstats.rss_bytes()
+    response = client.post("/log/food", files={"file": ("bomb.png", bomb, "image/png")})
+    assert response.status_code == 413
+    assert "too large" in response.json()["detail"]
+    # Decoding would need 2.7 GB; the header check keeps the worker flat
+    assert memstats.rss_bytes() - before < 50 * MiB
+    assert calls == []
+
+
+def test_oversize_upload_is_rejected(client, monkeypatch):
+    """Test oversize single and batch uploads are rejected per file"""
+    monkeypatch.setattr(uploads, "UPLOAD_MAX_BYTES", 1 * MiB)
+    response = client.post("/log/food", files={"file": ("big.jpg", b"\xff" * (3 * MiB), "image/jpeg")})
+    assert response.status_code == 413
+
+    response = client.post("/log/food/batch", files=[
+        ("files", ("big.jpg", b"\xff" * (3 * MiB), "image/jpeg")),
+        ("files", ("bomb.png", png_bomb(30000, 30000), "image/png")),
+        ("files", ("wide.png", png_bomb(20000, 10), "image/png")),
+        ("files", ("ok.jpg", jpeg(64, 48), "image/jpeg")),
+    ])
+    results = response.json()["results"]
+    assert [r["ok"] for r in results] == [False, False, False, True]
+    assert "exceeds 1 MB" in results[0]["error"]
+    assert "too large" in results[1]["error"]
+    assert "20000x10" in results[2]["error"]
+
+
+def _call(middleware, headers, chunks):
+    """Drive an ASGI app directly; returns (status, body chunks the app consumed)."""
+    consumed, sent = [], []
+    pending = list(chunks)
+
+    async def receive():
+        body = pending.pop(0) if pending else b""
+        consumed.append(body)
+        return {"type": "http.request", "body": body, "more_body": bool(pending)}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/log/food", "headers": headers}
+    asyncio.run(middleware(scope, receive, send))
+    return sent[0]["status"], consumed
+
+
+def test_body_limit_middleware_stops_reading_streamed_body():
+    """Test the body limit refuses streamed and declared bodies over the cap"""
+    async def app(scope, receive, send):
+        while (await receive()).get("more_body"):
+            pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    limited = uploads.BodyLimitMiddleware(app, max_bytes=1 * MiB)
+    chunk = b"x" * (64 * 1024)
+
+    # Chunked upload (no Content-Length) of 64 MB: reading stops just past the cap
+    status, consumed = _call(limited, [], [chunk] * 1024)
+    assert status == 413
+    assert sum(map(len, consumed)) <= 1 * MiB + len(chunk)
+
+    # A declared Content-Length over the cap is refused without reading anything
+    status, consumed = _call(limited, [(b"content-length", str(64 * MiB).encode())], [chunk])
+    assert status == 413 and consumed == []
+
+    status, _ = _call(limited, [], [chunk] * 4)
+    assert status == 200
+
+
+def test_large_jpeg_decodes_at_reduced_resolution():
+    """Test large JPEGs are decoded at a reduced scale"""
+    image = uploads.open_bounded(jpeg(2400, 1600), 512)
+    assert image.mode == "RGB"
+    assert image.size == (1200, 800)  # 1/2 scale keeps both sides >= 512
+    assert Image.open(io.BytesIO(pipeline.resize_image(jpeg(2400, 1600)))).size == (512, 341)
@@ -0,0 +1,134 @@
+import asyncio
+import base64
+import importlib.util
+import io
+import json
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+# Add backend to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import pipeline
+import wire
+
+
+def _jpeg(color=(200, 80, 40), size=(64, 48)) -> bytes:
+    buffered = io.BytesIO()
+    Image.new("RGB", size, color).save(buffered, format="JPEG")
+    return buffered.getvalue()
+
+
+def test_frames_round_trip():
+    pixels = wire.Pixels(2, 3, 3, bytes(range(18)))
+    body = wire.encode_batch([b"jpeg-1", pixels, b""])
+    assert body[:4] == wire.MAGIC
+    assert wire.decode_batch(body) == [b"jpeg-1", pixels, b""]
+
+
+@pytest.mark.parametrize("body, message", [
+    (b"NSF", "shorter"),
+    (b"XXXX\x00\x00\x00\x01", "magic"),
+    (wire.encode_batch([b"abc"])[:-1], "truncated"),
+    (wire.encode_batch([b"abc"]) + b"!", "trailing"),
+    (b"NSF1\x00\x00\x00\x02" + wire.encode_batch([b"abc"])[8:], "missing"),
+    (b"NSF1\x00\x10\x00\x00", "limit"),
+    (b"NSF1\x00\x00\x00\x01\x01\x00\x02\x00\x02\x04" + bytes(16), "shape"),
+    (b"NSF1\x00\x00\x00\x01\x07", "unknown kind"),
+])
+def test_malformed_frames_are_rejected(body, message):
+    with pytest.raises(wire.FrameError, match=message):
+        wire.decode_batch(body)
+
+
+def test_frames_are_smaller_than_base64_json():
+    images = [_jpeg(size=(512, 384)) for _ in range(4)]
+    as_json = json.dumps({"instances": [base64.b64encode(b).decode() for b in images]}).encode()
+    assert len(wire.encode_batch(images)) < 0.8 * len(as_json)
+
+
+@pytest.fixture
+def model_service(fake_services, monkeypatch):
+    url, fakes = fake_services
+    monkeypatch.delenv("VERTEX_ENDPOINT_ID", raising=False)
+    monkeypatch.setattr(pipeline, "MODEL_SERVICE_URL", url)
+    monkeypatch.setattr(pipeline, "INFERENCE_LOCAL_FALLBACK", False)
+    return fakes
+
+
+def test_model_service_gets_frames_with_same_predictions(model_service, monkeypatch):
+    fakes = model_service
+    images = [_jpeg((i * 40, 10, 10)) for i in range(3)]
+    framed = asyncio.run(pipeline.classify_batch(images, images))
+    assert fakes.stats["model_frames"] == 1
+
+    monkeypatch.setattr(pipeline, "MODEL_SERVICE_TRANSPORT", "json")
+    as_json = asyncio.run(pipeline.classify_batch(images, images))
+    assert fakes.stats["model_frames"] == 1
+    assert framed == as_json
+
+
+def test_model_service_gets_presized_pixels(model_service, monkeypatch):
+    fakes = model_service
+    monkeypatch.setattr(pipeline, "MODEL_SERVICE_PIXELS_SIDE", 32)
+    predictions = asyncio.run(pipeline.classify_batch([_jpeg()], [_jpeg()]))
+    assert predictions[0]["top1"][0]["label"] in fakes.LABELS
+    assert fakes.stats["model_frames"] == 1
+
+    pixels = pipeline.pixels_for(_jpeg(size=(640, 480)), 32)
+    assert (pixels.height, pixels.width, pixels.channels, len(pixels.data)) == (32, 32, 3, 32 * 32 * 3)
+
+
+@pytest.fixture
+def vertex_app(monkeypatch):
+    """The Vertex serving app with the model replaced by a stub that reports what it was given"""
+    pytest.importorskip("torch")
+    monkeypatch.syspath_prepend(str(backend_dir.parent))
+    spec = importlib.util.spec_from_file_location("vertex_app", backend_dir.parent / "src/deploy/vertex/app.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    def fake_predict(image):
+        if isinstance(image, module.wire.Pixels):
+            label = f"pixels_{image.height}x{image.width}"
+        else:
+            label = f"bytes_{len(image)}"
+        top = [{"label": label, "score": 1.0}]
+        return {"top1": top, "topk": top}
+
+    monkeypatch.setattr(module.core, "predict", fake_predict)
+    return TestClient(module.app), module
+
+
+def _labels(response):
+    assert response.status_code == 200, response.text
+    return [p["top1"][0]["label"] for p in response.json()["predictions"]]
+
+
+def test_vertex_app_accepts_json_and_binary_transports(vertex_app):
+    client, module = vertex_app
+    image = _jpeg()
+    expected = f"bytes_{len(image)}"
+
+    assert _labels(client.post("/predict", json={"instances": [base64.b64encode(image).decode()]})) == [expected]
+    frames = module.wire.encode_batch([image, module.wire.Pixels(4, 5, 3, bytes(60))])
+    assert _labels(client.post("/predict", content=frames, headers={"Content-Type": module.wire.CONTENT_TYPE})) == [
+        expected, "pixels_4x5"]
+    files = [("instances", ("a.jpg", image, "image/jpeg")), ("instances", ("b.jpg", image, "image/jpeg"))]
+    assert _labels(client.post("/predict", files=files)) == [expected, expected]
+    assert _labels(client.post("/predict", content=image, headers={"Content-Type": "image/jpeg"})) == [expected]
+
+
+def test_vertex_app_rejects_bad_payloads(vertex_app):
+    client, module = vertex_app
+    assert client.post("/predict", json={"instances": []}).status_code == 400
+    assert client.post("/predict", json={"images": []}).status_code == 422
+    assert client.post("/predict", json={"instances": ["not base64!"]}).status_code == 400
+    bad = client.post("/predict", content=b"NSF1junk", headers={"Content-Type": module.wire.CONTENT_TYPE})
+    assert bad.status_code == 400 and "Invalid frames" in bad.json()["detail"]
+    assert client.post("/predict", content=b"x", headers={"Content-Type": "text/plain"}).status_code == 415
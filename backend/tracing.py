@@ -0,0 +1,388 @@
+# nutrisnap-backend/tracing.py
+"""
+Request-scoped trace spans with a local exporter.
+
+Each HTTP request gets a trace (continued from an incoming W3C ``traceparent``
+header when present), and ``span(name)`` blocks inside it record their timing
+as children of whatever span is current. ``metrics.stage`` opens a span too,
+so every timed stage shows up in traces; SQL statements are recorded by
+``instrument_engine``. Outgoing calls forward the trace with ``inject(headers)``,
+which is how the Vertex app's decode/inference spans join the backend's trace.
+
+TRACE_EXPORTER selects where finished spans go:
+  none   tracing off (default); span() is a no-op
+  file   JSON lines appended to TRACE_FILE
+  http   batched POSTs of {"spans": [...]} to TRACE_COLLECTOR_URL
+         (benchmarks/fake_services.py serves a stand-in at /v1/traces)
+
+Like metrics, this module only uses the standard library so the Vertex app
+can import it as ``backend.tracing``.
+
+    python tracing.py traces.jsonl --slowest 5   # span trees of the slowest requests
+"""
+import argparse
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from contextlib import contextmanager
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL", "http://localhost:4318/v1/traces")
+# Fraction of new traces recorded; requests arriving with a sampled traceparent are always recorded
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "nutrisnap-backend")
+# Longer SQL is truncated in the span attributes
+TRACE_SQL_MAX_CHARS = 500
+
+_current = contextvars.ContextVar("nutrisnap_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "service", "attributes", "start", "_t0", "status")
+
+    def __init__(self, name: str, trace_id: str, parent_id=None, service: str = TRACE_SERVICE_NAME, attributes=None):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.service = service
+        self.attributes = attributes or {}
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.status = "ok"
+
+    def end(self, error: BaseException = None):
+        if error is not None:
+            self.status = "error"
+            self.attributes["error"] = f"{type(error).__name__}: {error}"[:200]
+        _exporter.export({
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "start": self.start,
+            "duration_ms": round((time.perf_counter() - self._t0) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        })
+
+
+class NullExporter:
+    def export(self, span: dict):
+        pass
+
+
+class MemoryExporter:
+    """Keeps finished spans in a list (tests)."""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span: dict):
+        self.spans.append(span)
+
+
+class FileExporter:
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def export(self, span: dict):
+        line = json.dumps(span, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", buffering=1)
+            self._file.write(line)
+
+
+class HttpExporter:
+    """Ships spans from a background thread so requests never wait on the collector."""
+
+    def __init__(self, url: str = TRACE_COLLECTOR_URL, batch_size: int = 256, interval: float = 1.0, max_queue: int = 10000):
+        self.url = url
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def export(self, span: dict):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self, first):
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._drain(self._queue.get())
+            self.send(batch)
+            time.sleep(self.interval)
+
+    def send(self, batch):
+        body = json.dumps({"spans": batch}, default=str).encode()
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except Exception:
+            self.dropped += len(batch)
+
+    def flush(self):
+        """Send everything queued so far from the calling thread."""
+        while not self._queue.empty():
+            self.send(self._drain(self._queue.get_nowait()))
+
+
+def _build_exporter(name: str):
+    if name == "file":
+        return FileExporter()
+    if name == "http":
+        return HttpExporter()
+    return None
+
+
+_exporter = _build_exporter(TRACE_EXPORTER) or NullExporter()
+ENABLED = TRACE_EXPORTER in ("file", "http")
+
+
+def set_exporter(exporter):
+    """Replace the exporter; None turns tracing off."""
+    global _exporter, ENABLED
+    _exporter = exporter or NullExporter()
+    ENABLED = exporter is not None
+
+
+def get_exporter():
+    return _exporter
+
+
+def current_span():
+    return _current.get()
+
+
+def parse_traceparent(header: str):
+    """(trace_id, parent span_id, sampled) from a W3C traceparent, or None if malformed."""
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+
+
+def inject(headers: dict = None) -> dict:
+    """``headers`` plus a traceparent for the current span (unchanged when not tracing)."""
+    headers = dict(headers or {})
+    parent = _current.get()
+    if parent is not None:
+        headers["traceparent"] = f"00-{parent.trace_id}-{parent.span_id}-01"
+    return headers
+
+
+def start_span(name: str, **attributes):
+    """A child of the current span that is not made current; call ``.end()`` on it. None when not tracing."""
+    parent = _current.get()
+    if parent is None:
+        return None
+    return Span(name, parent.trace_id, parent.span_id, parent.service, attributes)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record the block as a child of the current span; a no-op outside a traced request."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace_id, parent.span_id, parent.service, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        child.end(exc)
+        raise
+    else:
+        child.end()
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def root_span(name: str, traceparent: str = None, service: str = TRACE_SERVICE_NAME, **attributes):
+    """Start (or continue, from ``traceparent``) a trace; yields None when unsampled."""
+    incoming = parse_traceparent(traceparent) if traceparent else None
+    if not ENABLED or (incoming and not incoming[2]) or (not incoming and random.random() >= TRACE_SAMPLE_RATE):
+        yield None
+        return
+    trace_id, parent_id = (incoming[0], incoming[1]) if incoming else (f"{random.getrandbits(128):032x}", None)
+    root = Span(name, trace_id, parent_id, service, attributes)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as exc:
+        root.end(exc)
+        raise
+    else:
+        root.end()
+    finally:
+        _current.reset(token)
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a root span per HTTP request.
+
+    The span is named after the route template and ends once the app has sent
+    the whole response body, so for streamed responses (``/events``, ``/export``)
+    it lasts as long as the connection. ``http.headers_ms`` records the time to
+    the response headers, and streamed responses (no Content-Length) are
+    marked ``http.streamed`` so they can be left out of latency analysis. The
+    trace id is returned in ``X-Trace-Id``.
+    """
+
+    def __init__(self, app, service: str = TRACE_SERVICE_NAME):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+        traceparent = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+
+        with root_span(f"{scope['method']} {scope['path']}", traceparent, self.service) as root:
+            if root is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    route = getattr(scope.get("route"), "path", None)
+                    if route:
+                        root.name = f"{scope['method']} {route}"
+                    root.attributes["http.status"] = message["status"]
+                    root.attributes["http.headers_ms"] = round((time.perf_counter() - root._t0) * 1000, 3)
+                    headers = list(message.get("headers", []))
+                    if not any(key.lower() == b"content-length" for key, _ in headers):
+                        root.attributes["http.streamed"] = True
+                    message = dict(message)
+                    message["headers"] = headers + [(b"x-trace-id", root.trace_id.encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+
+def instrument_engine(engine):
+    """Record every SQL statement run through ``engine`` (sync or async) as a span."""
+    from sqlalchemy import event
+
+    target = getattr(engine, "sync_engine", engine)
+    if getattr(target, "_nutrisnap_traced", False):
+        return engine
+
+    @event.listens_for(target, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        sql_span = start_span("sql", statement=statement[:TRACE_SQL_MAX_CHARS], executemany=executemany,
+                              db=target.dialect.name)
+        if sql_span is not None:
+            conn.info.setdefault("nutrisnap_spans", []).append(sql_span)
+
+    @event.listens_for(target, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("nutrisnap_spans")
+        if spans:
+            sql_span = spans.pop()
+            if cursor is not None and cursor.rowcount >= 0:
+                sql_span.attributes["rows"] = cursor.rowcount
+            sql_span.end()
+
+    @event.listens_for(target, "handle_error")
+    def _error(context):
+        spans = context.connection.info.get("nutrisnap_spans") if context.connection is not None else None
+        if spans:
+            spans.pop().end(context.original_exception)
+
+    target._nutrisnap_traced = True
+    return engine
+
+
+def load(path: str):
+    """Spans from a TRACE_FILE, grouped by trace id."""
+    traces = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                traces[item["trace_id"]].append(item)
+    return traces
+
+
+def format_trace(spans) -> str:
+    """Indented span tree; each line shows duration and start offset from the root."""
+    by_parent = defaultdict(list)
+    ids = {s["span_id"] for s in spans}
+    for s in spans:
+        by_parent[s["parent_id"] if s["parent_id"] in ids else None].append(s)
+    origin = min(s["start"] for s in spans)
+    lines = []
+
+    def walk(parent_id, depth):
+        for s in sorted(by_parent.get(parent_id, []), key=lambda s: s["start"]):
+            offset = (s["start"] - origin) * 1000
+            detail = s["attributes"].get("statement", "")[:80]
+            flag = " !" if s["status"] == "error" else ""
+            lines.append(f"{'  ' * depth}{s['name']} [{s['service']}] {s['duration_ms']:.1f}ms @+{offset:.1f}ms{flag} {detail}".rstrip())
+            walk(s["span_id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print the span trees of the slowest traces in a TRACE_FILE.")
+    parser.add_argument("path", nargs="?", default=TRACE_FILE)
+    parser.add_argument("--slowest", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    traces = load(args.path)
+
+    def total(spans):
+        # Longest span of the trace, normally the root request
+        return max(s["duration_ms"] for s in spans)
+
+    for trace_id, spans in sorted(traces.items(), key=lambda item: total(item[1]), reverse=True)[:args.slowest]:
+        print(f"trace {trace_id}  {total(spans):.1f}ms")
+        print(format_trace(spans))
+        print()
+
+
+if __name__ == "__main__":
+    main()
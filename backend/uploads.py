@@ -0,0 +1,162 @@
+# nutrisnap-backend/uploads.py
+"""
+Bounded ingestion of meal photos.
+
+Three layers keep one oversized or malicious upload from spiking a worker's
+memory and CPU:
+
+1. BodyLimitMiddleware counts request body bytes as they stream in and answers
+   413 once UPLOAD_MAX_REQUEST_BYTES is passed (immediately when Content-Length
+   already says so), before the multipart parser spools the rest to disk.
+2. read_upload() reads each file in UPLOAD_CHUNK_BYTES chunks and stops at
+   UPLOAD_MAX_BYTES, so memory per upload is capped no matter what was sent.
+3. check_image() parses only the image header and rejects pixel dimensions
+   beyond UPLOAD_MAX_PIXELS / UPLOAD_MAX_SIDE before anything is decoded; that
+   is what stops a 50 KB PNG that inflates to gigabytes.
+
+Decoding then goes through open_bounded(), which asks JPEGs for a reduced
+resolution straight from the DCT (``Image.draft``) and treats Pillow's
+decompression-bomb warning as an error.
+"""
+import io
+import os
+import warnings
+
+from PIL import Image
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(15 * 1024 * 1024)))
+# Whole request body, so batch uploads are bounded too
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", str(50_000_000)))
+UPLOAD_MAX_SIDE = int(os.getenv("UPLOAD_MAX_SIDE", "12000"))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+
+class UploadRejected(Exception):
+    """The upload breaks a limit; ``status_code`` is what the API should answer."""
+
+    def __init__(self, message: str, status_code: int = 413):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+async def read_upload(file, max_bytes: int = None) -> bytes:
+    """The upload's bytes, read in chunks and abandoned once past ``max_bytes``."""
+    max_bytes = UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    limit_message = f"Upload exceeds {max_bytes // (1024 * 1024)} MB limit."
+    # Starlette records the spooled size, which lets most oversize files be refused without reading
+    if getattr(file, "size", None) is not None and file.size > max_bytes:
+        raise UploadRejected(limit_message)
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            return bytes(buffer)
+        if len(buffer) + len(chunk) > max_bytes:
+            raise UploadRejected(limit_message)
+        buffer += chunk
+
+
+def image_header(image_bytes: bytes):
+    """(format, width, height) from the header alone, or None if Pillow can't identify it."""
+    try:
+        with warnings.catch_warnings():
+            # Dimensions are checked against our own limits below
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(image_bytes)) as img:
+                return img.format, img.width, img.height
+    except Image.DecompressionBombError as exc:
+        # Pillow refuses to even open images past twice its own pixel limit
+        raise UploadRejected(f"Image dimensions are too large: {exc}")
+    except Exception:
+        return None
+
+
+def check_image(image_bytes: bytes, max_pixels: int = None, max_side: int = None):
+    """Reject images whose declared dimensions exceed the limits, without decoding them.
+
+    Bytes Pillow can't identify pass through: they can't be decoded (so can't
+    bomb) and the classification stage reports them as it always has.
+    """
+    max_pixels = UPLOAD_MAX_PIXELS if max_pixels is None else max_pixels
+    max_side = UPLOAD_MAX_SIDE if max_side is None else max_side
+    header = image_header(image_bytes)
+    if header is None:
+        return None
+    _, width, height = header
+    if width > max_side or height > max_side or width * height > max_pixels:
+        raise UploadRejected(f"Image is {width}x{height}; the limit is {max_side} px per side and {max_pixels:,} pixels.")
+    return header
+
+
+def open_bounded(image_bytes: bytes, max_side: int) -> Image.Image:
+    """Decode to RGB at no more than about ``max_side`` (JPEG scales by 1/2-1/8 while decoding)."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", Image.DecompressionBombWarning)
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            if max_side:
+                img.draft("RGB", (max_side, max_side))
+            img = img.convert("RGB")
+    return img
+
+
+class BodyLimitMiddleware:
+    """ASGI middleware answering 413 once a request body passes ``max_bytes``."""
+
+    def __init__(self, app, max_bytes: int = None):
+        self.app = app
+        self.max_bytes = UPLOAD_MAX_REQUEST_BYTES if max_bytes is None else max_bytes
+
+    async def _reject(self, send):
+        body = b'{"detail":"Request body too large."}'
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                                (b"connection", b"close")]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0:
+            await self.app(scope, receive, send)
+            return
+        for key, value in scope["headers"]:
+            if key == b"content-length":
+                if value.isdigit() and int(value) > self.max_bytes:
+                    await self._reject(send)
+                    return
+                break
+
+        received = 0
+        exceeded = started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded:
+                # The body parser turned our exception into its own error response; answer 413 instead
+                if message["type"] == "http.response.start" and not started:
+                    started = True
+                    await self._reject(send)
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _BodyTooLarge:
+            if started:
+                return
+            await self._reject(send)
+
+
+class _BodyTooLarge(Exception):
+    pass
@@ -0,0 +1,102 @@
+# nutrisnap-backend/wire.py
+"""
+Compact binary framing for image batches sent to our model service.
+
+The Vertex JSON contract wraps every JPEG in base64, which adds a third to
+the payload and costs a JSON parse plus a base64 decode per image on both
+sides. The backend talks to its own model service (MODEL_SERVICE_URL) with
+this framing instead, sent as ``Content-Type: application/x-nutrisnap-frames``.
+All integers are big-endian:
+
+    b"NSF1"  u32 count
+    then per item:
+      u8 0   u32 length  <length bytes>            encoded image (JPEG/PNG/...)
+      u8 1   u16 height  u16 width  u8 channels     uint8 pixels, row-major HWC
+             <height * width * channels bytes>
+
+Pixel items let the sender resize ahead of time so the server skips image
+decoding altogether. The predictions come back as JSON, as they always have.
+
+Standard library only, so the Vertex app imports it as ``backend.wire``.
+"""
+import struct
+from typing import List, NamedTuple, Union
+
+CONTENT_TYPE = "application/x-nutrisnap-frames"
+MAGIC = b"NSF1"
+KIND_ENCODED = 0
+KIND_PIXELS = 1
+# Guards against a corrupt count or size making the server allocate gigabytes
+MAX_ITEMS = 1024
+MAX_SIDE = 4096
+
+_HEADER = struct.Struct(">4sI")
+_ENCODED = struct.Struct(">BI")
+_PIXELS = struct.Struct(">BHHB")
+
+
+class FrameError(ValueError):
+    pass
+
+
+class Pixels(NamedTuple):
+    """A uint8 image, ``height x width x channels``, row-major."""
+
+    height: int
+    width: int
+    channels: int
+    data: bytes
+
+
+def encode_batch(items: List[Union[bytes, Pixels]]) -> bytes:
+    parts = [_HEADER.pack(MAGIC, len(items))]
+    for item in items:
+        if isinstance(item, Pixels):
+            if len(item.data) != item.height * item.width * item.channels:
+                raise FrameError(f"Pixel data is {len(item.data)} bytes, expected {item.height}x{item.width}x{item.channels}")
+            parts.append(_PIXELS.pack(KIND_PIXELS, item.height, item.width, item.channels))
+        else:
+            parts.append(_ENCODED.pack(KIND_ENCODED, len(item)))
+        parts.append(item.data if isinstance(item, Pixels) else item)
+    return b"".join(parts)
+
+
+def decode_batch(body: bytes) -> List[Union[bytes, Pixels]]:
+    """Items in order; raises FrameError on anything malformed or truncated."""
+    view = memoryview(body)
+    if len(view) < _HEADER.size:
+        raise FrameError("Body is shorter than the frame header")
+    magic, count = _HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise FrameError("Bad magic; expected NSF1")
+    if count > MAX_ITEMS:
+        raise FrameError(f"{count} items exceeds the limit of {MAX_ITEMS}")
+
+    items, offset = [], _HEADER.size
+    for idx in range(count):
+        if offset >= len(view):
+            raise FrameError(f"Item {idx} is missing")
+        kind = view[offset]
+        if kind == KIND_ENCODED:
+            if offset + _ENCODED.size > len(view):
+                raise FrameError(f"Item {idx} header is truncated")
+            _, length = _ENCODED.unpack_from(view, offset)
+            offset += _ENCODED.size
+        elif kind == KIND_PIXELS:
+            if offset + _PIXELS.size > len(view):
+                raise FrameError(f"Item {idx} header is truncated")
+            _, height, width, channels = _PIXELS.unpack_from(view, offset)
+            if channels not in (1, 3) or not 0 < height <= MAX_SIDE or not 0 < width <= MAX_SIDE:
+                raise FrameError(f"Item {idx} has unsupported shape {height}x{width}x{channels}")
+            length = height * width * channels
+            offset += _PIXELS.size
+        else:
+            raise FrameError(f"Item {idx} has unknown kind {kind}")
+        if offset + length > len(view):
+            raise FrameError(f"Item {idx} is truncated")
+        data = bytes(view[offset:offset + length])
+        items.append(data if kind == KIND_ENCODED else Pixels(height, width, channels, data))
+        offset += length
+    if offset != len(view):
+        raise FrameError(f"{len(view) - offset} trailing bytes after {count} items")
+    return items
@@ -1,13 +1,20 @@
 import base64
 import logging
-from typing import List
+from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
 
 # Reuse the core inference logic that downloads the model from GCS and
 # performs HF image classification.
 from backend import inference as core
+from backend import memstats
+from backend import metrics
+from backend import profiling
+from backend import tracing
+from backend import wire
 
 logger = logging.getLogger("vertex-app")
 logging.basicConfig(level=logging.INFO)
@@ -33,6 +40,15 @@ class PredictResponse(BaseModel):
 
 
 app = FastAPI(title="NutriSnap Vertex Inference", version="1.0.0")
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(memstats.MemoryMiddleware)
+# Joins the caller's trace when the backend forwards a traceparent header
+app.add_middleware(tracing.TracingMiddleware, service="nutrisnap-vertex")
+if profiling.PROFILE_EVERY_N > 0:
+    app.add_middleware(profiling.ProfilingMiddleware)
+
+PREDICT_INSTANCES = metrics.counter("nutrisnap_predict_instances", "Images classified by outcome", ["outcome"])
+PREDICT_REQUESTS = metrics.counter("nutrisnap_predict_requests", "Predict calls by request encoding", ["transport"])
 
 
 @app.on_event("startup")
@@ -41,6 +57,7 @@ async def _warm_model():
     try:
         core.get_bundle()
         logger.info("Model bundle loaded successfully.")
+        profiling.install_signal_handler()
     except Exception as exc:
         logger.exception("Failed to load model bundle at startup.")
         raise
@@ -51,25 +68,102 @@ async def health():
     return {"status": "ok"}
 
 
-@app.post("/predict", response_model=PredictResponse)
-async def predict(payload: PredictRequest):
-    if not payload.instances:
-        raise HTTPException(status_code=400, detail="No instances provided")
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    # Per-stage inference latency (decode / preprocess / forward / topk) for this replica
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
-    predictions: List[InstancePrediction] = []
+
+@app.get("/debug/memory", include_in_schema=False)
+async def debug_memory(limit: int = 20, depth: Optional[int] = None, x_admin_token: Optional[str] = Header(None)):
+    # RSS, torch allocator stats, tracemalloc top modules (MEMORY_TRACEMALLOC=1) and per-route peaks
+    if not memstats.allowed(x_admin_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return await run_in_threadpool(memstats.report, limit, depth)
+
+
+@app.get("/admin/profile", include_in_schema=False)
+async def admin_profile(seconds: float = 10, interval_ms: float = profiling.PROFILE_INTERVAL_MS,
+                        x_admin_token: Optional[str] = Header(None)):
+    # Collapsed stacks of this replica over the next `seconds`, for flamegraph.pl / speedscope
+    if not profiling.allowed(x_admin_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+    collapsed = await run_in_threadpool(profiling.profile_for, seconds, interval_ms / 1000)
+    return Response(collapsed, media_type="text/plain")
+
+
+async def _json_instances(request: Request) -> list:
+    # Vertex AI contract: {"instances": ["<base64 image>", ...]}
+    try:
+        payload = PredictRequest.model_validate(await request.json())
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors()) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Body is not valid JSON") from exc
+
+    images = []
     for idx, encoded in enumerate(payload.instances):
         try:
-            image_bytes = base64.b64decode(encoded, validate=True)
+            with metrics.stage("vertex.b64decode"):
+                images.append(base64.b64decode(encoded, validate=True))
         except Exception:
+            PREDICT_INSTANCES.inc(outcome="invalid")
             raise HTTPException(status_code=400, detail=f"Instance {idx} is not valid base64")
+    return images
+
+
+async def _binary_instances(request: Request, content_type: str) -> list:
+    """Images from NSF1 frames, multipart file parts, or a single raw image body."""
+    if content_type == wire.CONTENT_TYPE:
+        try:
+            with metrics.stage("vertex.unframe"):
+                return wire.decode_batch(await request.body())
+        except wire.FrameError as exc:
+            PREDICT_INSTANCES.inc(outcome="invalid")
+            raise HTTPException(status_code=400, detail=f"Invalid frames: {exc}") from exc
+    if content_type == "multipart/form-data":
+        form = await request.form()
+        # Every file part, in the order sent, whatever the field name
+        return [await part.read() for _, part in form.multi_items() if hasattr(part, "read")]
+    return [await request.body()]
+
+
+@app.post(
+    "/predict",
+    response_model=PredictResponse,
+    openapi_extra={"requestBody": {"content": {
+        "application/json": {"schema": PredictRequest.model_json_schema()},
+        wire.CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}},
+        "multipart/form-data": {"schema": {"type": "object"}},
+        "image/*": {"schema": {"type": "string", "format": "binary"}},
+    }}},
+)
+async def predict(request: Request):
+    # JSON (the Vertex contract) unless the caller sends binary: NSF1 frames from
+    # the backend, multipart file uploads, or one raw image (image/* or octet-stream)
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+    if content_type in ("application/json", ""):
+        transport = "json"
+        instances = await _json_instances(request)
+    elif content_type in (wire.CONTENT_TYPE, "multipart/form-data", "application/octet-stream") or content_type.startswith("image/"):
+        transport = {wire.CONTENT_TYPE: "frames", "multipart/form-data": "multipart"}.get(content_type, "raw")
+        instances = await _binary_instances(request, content_type)
+    else:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type {content_type}")
+    PREDICT_REQUESTS.inc(transport=transport)
+    if not instances:
+        raise HTTPException(status_code=400, detail="No instances provided")
 
+    predictions: List[InstancePrediction] = []
+    for idx, image in enumerate(instances):
         try:
-            result = core.predict(image_bytes)
+            result = core.predict(image)
         except Exception as exc:
+            PREDICT_INSTANCES.inc(outcome="error")
             logger.exception("Prediction failed for instance %s", idx)
             raise HTTPException(status_code=500, detail=f"Inference failed for instance {idx}: {exc}") from exc
 
+        PREDICT_INSTANCES.inc(outcome="ok")
         predictions.append(InstancePrediction(**result))
 
     return PredictResponse(predictions=predictions)
-